@@ -0,0 +1,29 @@
+"""
+Rebuild the per-user daily analytics rollups from the raw tables.
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute DailyCustomerRollup and DailyPaymentRollup rows from customers and payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Limit to this user ID (repeatable).')
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid date '{options['since']}', expected YYYY-MM-DD")
+
+        customer_rows, payment_rows = rebuild_rollups(user_ids=options['users'], since=since)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {customer_rows} customer and {payment_rows} payment rollup rows.'
+        ))
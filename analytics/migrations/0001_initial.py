@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('currency', models.CharField(max_length=3)),
+                ('payment_method', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_payment_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Daily Payment Rollup',
+                'verbose_name_plural': 'Daily Payment Rollups',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCustomerRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('new_customers', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_customer_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Daily Customer Rollup',
+                'verbose_name_plural': 'Daily Customer Rollups',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailypaymentrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'date', 'currency', 'payment_method', 'status'), name='unique_daily_payment_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycustomerrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_customer_rollup'),
+        ),
+    ]
@@ -1,3 +1,47 @@
+"""
+Analytics models for DataLinkCRM.
+Per-user daily rollups maintained on write (see analytics.rollups).
+"""
 from django.db import models
+from django.contrib.auth.models import User
 
-# Create your models here.
+class DailyCustomerRollup(models.Model):
+    """New customers per user per local day."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_customer_rollups')
+    date = models.DateField()
+    new_customers = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name = 'Daily Customer Rollup'
+        verbose_name_plural = 'Daily Customer Rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_customer_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} {self.date}: {self.new_customers} new customers"
+
+class DailyPaymentRollup(models.Model):
+    """Payment counts and amounts per user, local day, currency, method and status."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_payment_rollups')
+    date = models.DateField()
+    currency = models.CharField(max_length=3)
+    payment_method = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name = 'Daily Payment Rollup'
+        verbose_name_plural = 'Daily Payment Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'date', 'currency', 'payment_method', 'status'],
+                name='unique_daily_payment_rollup'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} {self.date} {self.payment_method}/{self.status}: {self.count}"
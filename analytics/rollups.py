@@ -0,0 +1,199 @@
+"""
+Daily analytics rollups for DataLinkCRM.
+
+Customer and Payment writes adjust the per-user daily rollup rows in the same
+transaction (see analytics.signals), so analytics pages read a handful of
+pre-aggregated rows instead of scanning raw transactions. Queryset updates and
+bulk writes bypass the signals; rebuild_rollups() recomputes rows from the raw
+tables to reconcile them.
+"""
+import datetime
+from collections import Counter
+from decimal import Decimal
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCustomerRollup, DailyPaymentRollup
+from customers.models import Customer
+from payments.models import Payment
+
+# Payment fields that determine which rollup row a payment counts towards.
+PAYMENT_ROLLUP_FIELDS = ['user_id', 'created_at', 'currency', 'payment_method', 'status', 'amount']
+
+BATCH_SIZE = 1000
+
+
+def _bump(model, keys, **deltas):
+    """
+    Add ``deltas`` to the rollup row identified by ``keys``.
+
+    The row is created for increases only; a decrease of a row that does not
+    exist has nothing left to subtract from.
+    """
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**keys).update(**updates):
+        return
+    if any(value < 0 for value in deltas.values()):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Another writer created the row first.
+        model.objects.filter(**keys).update(**updates)
+
+
+def record_customer(customer, delta):
+    """Count a customer being added (``delta=1``) or removed (``delta=-1``)."""
+    _bump(
+        DailyCustomerRollup,
+        {'user_id': customer.user_id, 'date': timezone.localdate(customer.created_at)},
+        new_customers=delta
+    )
+
+
+def record_customers(user_id, customers):
+    """Count customers inserted in bulk, with one rollup update per day."""
+    per_day = Counter(timezone.localdate(customer.created_at) for customer in customers)
+    for date, count in per_day.items():
+        _bump(DailyCustomerRollup, {'user_id': user_id, 'date': date}, new_customers=count)
+
+
+def snapshot_payment(payment):
+    """Return the rollup-relevant values of a Payment instance."""
+    return {field: getattr(payment, field) for field in PAYMENT_ROLLUP_FIELDS}
+
+
+def load_payment_snapshot(payment_id):
+    """Return the stored rollup-relevant values of a payment, or None."""
+    return Payment.objects.filter(pk=payment_id).values(*PAYMENT_ROLLUP_FIELDS).first()
+
+
+def _payment_keys(snapshot):
+    return {
+        'user_id': snapshot['user_id'],
+        'date': timezone.localdate(snapshot['created_at']),
+        'currency': snapshot['currency'],
+        'payment_method': snapshot['payment_method'],
+        'status': snapshot['status'],
+    }
+
+
+def record_payment_change(previous, current):
+    """
+    Move a payment between rollup rows.
+
+    ``previous`` and ``current`` are snapshots from snapshot_payment() or
+    load_payment_snapshot(); either may be None for a create or a delete.
+    """
+    if previous == current:
+        return
+    if previous is not None:
+        _bump(
+            DailyPaymentRollup, _payment_keys(previous),
+            count=-1, total_amount=-Decimal(str(previous['amount']))
+        )
+    if current is not None:
+        _bump(
+            DailyPaymentRollup, _payment_keys(current),
+            count=1, total_amount=Decimal(str(current['amount']))
+        )
+
+
+def record_payment_status_changes(payments, previous_status):
+    """
+    Move payments saved in bulk from their previous status's rollup rows.
+
+    ``previous_status`` maps payment IDs to their status before the update;
+    the moves are netted so each affected row is bumped once.
+    """
+    deltas = {}
+    for payment in payments:
+        previous = previous_status.get(payment.pk, payment.status)
+        if previous == payment.status:
+            continue
+        current = snapshot_payment(payment)
+        amount = Decimal(str(payment.amount))
+        for snapshot, sign in ((dict(current, status=previous), -1), (current, 1)):
+            keys = tuple(sorted(_payment_keys(snapshot).items()))
+            count, total = deltas.get(keys, (0, Decimal('0')))
+            deltas[keys] = (count + sign, total + sign * amount)
+    for keys, (count, total) in deltas.items():
+        if count or total:
+            _bump(DailyPaymentRollup, dict(keys), count=count, total_amount=total)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def rebuild_rollups(user_ids=None, since=None):
+    """
+    Recompute rollup rows from the raw Customer and Payment tables.
+
+    Limited to ``user_ids`` and to days from ``since`` onwards when given.
+    Returns the number of customer and payment rollup rows written.
+    """
+    customers = Customer.objects.all()
+    payments = Payment.objects.all()
+    customer_rollups = DailyCustomerRollup.objects.all()
+    payment_rollups = DailyPaymentRollup.objects.all()
+
+    if user_ids:
+        customers = customers.filter(user_id__in=user_ids)
+        payments = payments.filter(user_id__in=user_ids)
+        customer_rollups = customer_rollups.filter(user_id__in=user_ids)
+        payment_rollups = payment_rollups.filter(user_id__in=user_ids)
+
+    if since:
+        start = timezone.make_aware(datetime.datetime.combine(since, datetime.time.min))
+        customers = customers.filter(created_at__gte=start)
+        payments = payments.filter(created_at__gte=start)
+        customer_rollups = customer_rollups.filter(date__gte=since)
+        payment_rollups = payment_rollups.filter(date__gte=since)
+
+    customer_rows = (
+        DailyCustomerRollup(user_id=row['user_id'], date=row['day'], new_customers=row['n'])
+        for row in customers.order_by().annotate(
+            day=TruncDate('created_at')
+        ).values('user_id', 'day').annotate(n=Count('pk')).iterator()
+    )
+    payment_rows = (
+        DailyPaymentRollup(
+            user_id=row['user_id'],
+            date=row['day'],
+            currency=row['currency'],
+            payment_method=row['payment_method'],
+            status=row['status'],
+            count=row['n'],
+            total_amount=row['total'] or 0,
+        )
+        for row in payments.order_by().annotate(
+            day=TruncDate('created_at')
+        ).values('user_id', 'day', 'currency', 'payment_method', 'status').annotate(
+            n=Count('pk'),
+            total=Sum('amount'),
+        ).iterator()
+    )
+
+    written = [0, 0]
+    with transaction.atomic():
+        customer_rollups.delete()
+        payment_rollups.delete()
+        for index, (model, rows) in enumerate([
+            (DailyCustomerRollup, customer_rows),
+            (DailyPaymentRollup, payment_rows),
+        ]):
+            for batch in _batched(rows, BATCH_SIZE):
+                model.objects.bulk_create(batch)
+                written[index] += len(batch)
+    return tuple(written)
@@ -0,0 +1,73 @@
+"""
+Analytics signal handlers for DataLinkCRM.
+Keep the daily rollups in step with Customer and Payment writes.
+"""
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from .rollups import (
+    PAYMENT_ROLLUP_FIELDS,
+    record_customer,
+    record_customers,
+    record_payment_change,
+    record_payment_status_changes,
+    snapshot_payment,
+    load_payment_snapshot,
+)
+from customers.models import Customer
+from customers.signals import customers_bulk_created
+from payments.models import Payment
+from payments.signals import payments_bulk_updated
+
+
+def _deleting_users(origin):
+    """Whether a delete cascades from deleting users, whose rollups go with them."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is User
+
+
+def customer_saved(sender, instance, created, **kwargs):
+    if created:
+        record_customer(instance, 1)
+
+
+def customer_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleting_users(origin):
+        record_customer(instance, -1)
+
+
+def customers_imported(sender, user_id, customers, **kwargs):
+    record_customers(user_id, customers)
+
+
+def payment_pre_save(sender, instance, update_fields=None, **kwargs):
+    """Remember which rollup row an existing payment counted towards."""
+    if instance._state.adding:
+        instance._rollup_previous = None
+    elif update_fields is not None and not set(update_fields) & set(PAYMENT_ROLLUP_FIELDS + ['user']):
+        instance._rollup_previous = snapshot_payment(instance)
+    else:
+        instance._rollup_previous = load_payment_snapshot(instance.pk)
+
+
+def payment_saved(sender, instance, **kwargs):
+    record_payment_change(getattr(instance, '_rollup_previous', None), snapshot_payment(instance))
+
+
+def payment_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleting_users(origin):
+        record_payment_change(snapshot_payment(instance), None)
+
+
+def payments_updated(sender, payments, previous_status, **kwargs):
+    record_payment_status_changes(payments, previous_status)
+
+
+post_save.connect(customer_saved, sender=Customer, dispatch_uid='analytics-customer-saved')
+post_delete.connect(customer_deleted, sender=Customer, dispatch_uid='analytics-customer-deleted')
+customers_bulk_created.connect(customers_imported, dispatch_uid='analytics-customers-imported')
+pre_save.connect(payment_pre_save, sender=Payment, dispatch_uid='analytics-payment-pre-save')
+post_save.connect(payment_saved, sender=Payment, dispatch_uid='analytics-payment-saved')
+post_delete.connect(payment_deleted, sender=Payment, dispatch_uid='analytics-payment-deleted')
+payments_bulk_updated.connect(payments_updated, dispatch_uid='analytics-payments-updated')
@@ -1,3 +1,134 @@
-from django.test import TestCase
+"""
+Tests for the analytics app.
+"""
+import datetime
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .models import DailyPaymentRollup
+from .rollups import _bump, rebuild_rollups
+from .timeseries import bucket_index, build_timeseries, moving_average
+from payments.models import Payment
+from payments.signals import payments_bulk_updated
+
+# The signal handlers also touch the cache; keep it in memory instead of Redis.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def payment_rollups(user):
+    """Return a user's non-empty payment rollup rows as comparable tuples."""
+    return sorted(
+        DailyPaymentRollup.objects.filter(user=user).exclude(count=0).values_list(
+            'date', 'currency', 'payment_method', 'status', 'count', 'total_amount'
+        )
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PaymentRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rollups')
+
+    def create_payment(self, amount, **fields):
+        fields.setdefault('payment_method', 'mpesa')
+        return Payment.objects.create(
+            user=self.user, amount=Decimal(amount), reference=f'ROLLUP{Payment.objects.count()}', **fields
+        )
+
+    def assertMatchesRebuild(self):
+        live = payment_rollups(self.user)
+        rebuild_rollups([self.user.pk])
+        self.assertEqual(live, payment_rollups(self.user))
+
+    def test_saves_and_deletes_keep_rollups_in_step(self):
+        first = self.create_payment('100.00')
+        second = self.create_payment('40.00', currency='USD')
+        self.create_payment('25.50', payment_method='cash', status='completed')
+        first.status = 'completed'
+        first.save()
+        second.amount = Decimal('45.00')
+        second.save(update_fields=['amount'])
+        second.delete()
+        self.assertMatchesRebuild()
+
+    def test_bulk_status_update_moves_rollups(self):
+        payments = [self.create_payment('100.00'), self.create_payment('60.00', currency='USD')]
+        previous_status = {payment.pk: payment.status for payment in payments}
+        for payment in payments:
+            payment.status = 'completed'
+        Payment.objects.bulk_update(payments, ['status'])
+        payments_bulk_updated.send(sender=Payment, payments=payments, previous_status=previous_status)
+        self.assertMatchesRebuild()
+        self.assertEqual(
+            DailyPaymentRollup.objects.get(user=self.user, currency='KES', status='completed').count, 1
+        )
+
+    def test_deleting_a_user_skips_rollup_writes(self):
+        self.create_payment('100.00')
+        with mock.patch('analytics.signals.record_payment_change') as record:
+            self.user.delete()
+        record.assert_not_called()
+        self.assertFalse(DailyPaymentRollup.objects.exists())
+
+    def test_decrease_never_creates_a_row(self):
+        keys = {
+            'user_id': self.user.pk,
+            'date': timezone.localdate(),
+            'currency': 'KES',
+            'payment_method': 'mpesa',
+            'status': 'pending',
+        }
+        _bump(DailyPaymentRollup, keys, count=-1, total_amount=Decimal('-10'))
+        self.assertFalse(DailyPaymentRollup.objects.exists())
+
+
+class BucketTests(SimpleTestCase):
+    def days(self, first, last):
+        return np.arange(np.datetime64(first, 'D'), np.datetime64(last, 'D') + 1)
+
+    def test_weeks_start_on_monday(self):
+        # 2024-01-03 is a Wednesday.
+        indices, starts = bucket_index(self.days('2024-01-03', '2024-01-15'), 'week')
+        self.assertEqual(starts.astype(str).tolist(), ['2024-01-01', '2024-01-08', '2024-01-15'])
+        self.assertEqual(indices.tolist(), [0] * 5 + [1] * 7 + [2])
+
+    def test_quarters(self):
+        indices, starts = bucket_index(self.days('2024-03-30', '2024-04-02'), 'quarter')
+        self.assertEqual(starts.astype(str).tolist(), ['2024-01-01', '2024-04-01'])
+        self.assertEqual(indices.tolist(), [0, 0, 1, 1])
+
+    def test_moving_average_is_shorter_at_the_start(self):
+        self.assertEqual(moving_average(np.array([2.0, 4.0, 6.0, 8.0]), 2).tolist(), [2.0, 3.0, 5.0, 7.0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TimeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('timeseries')
+        self.today = timezone.localdate()
+        for index, (amount, currency) in enumerate([('1000.00', 'KES'), ('10.00', 'USD'), ('500.00', 'KES')]):
+            Payment.objects.create(
+                user=self.user, amount=Decimal(amount), currency=currency, payment_method='mpesa',
+                status='completed', reference=f'SERIES{index}'
+            )
+
+    def test_revenue_is_summed_per_currency(self):
+        first = self.today - datetime.timedelta(days=2)
+        series = build_timeseries(self.user, 'revenue', 'day', first, self.today)
+        self.assertEqual(series['currency'], 'KES')
+        self.assertEqual(series['values'], [0.0, 0.0, 1500.0])
+        usd = build_timeseries(self.user, 'revenue', 'day', first, self.today, currency='USD')
+        self.assertEqual(usd['values'], [0.0, 0.0, 10.0])
+
+    def test_cumulative_includes_days_before_the_range(self):
+        tomorrow = self.today + datetime.timedelta(days=1)
+        series = build_timeseries(self.user, 'payments', 'day', tomorrow, tomorrow)
+        self.assertEqual(series['values'], [0])
+        self.assertEqual(series['cumulative'], [3])
+        self.assertNotIn('currency', series)
@@ -0,0 +1,170 @@
+"""
+Time-series service for DataLinkCRM analytics.
+
+Per-day values are read from the daily rollups (raw projects for the
+projects metric), scattered onto an epoch-day axis with numpy.bincount and
+re-bucketed to the requested granularity, so every bucket in the range is
+present and zero-filled without any per-day Python loop. Revenue is
+charted in one currency at a time, as amounts in different currencies
+cannot be added up.
+"""
+import datetime
+
+import numpy as np
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCustomerRollup, DailyPaymentRollup
+from projects.models import Project
+
+GRANULARITIES = ['day', 'week', 'month', 'quarter']
+
+# Longest range served, in days.
+MAX_RANGE_DAYS = 3660
+
+# Currency revenue is charted in unless another is asked for; payments default to it.
+DEFAULT_CURRENCY = 'KES'
+
+
+def _daily_customers(user, first, last):
+    return DailyCustomerRollup.objects.filter(
+        user=user, date__range=(first, last)
+    ).values_list('date', 'new_customers')
+
+
+def _daily_revenue(user, first, last, currency=DEFAULT_CURRENCY):
+    return DailyPaymentRollup.objects.filter(
+        user=user, status='completed', currency=currency, date__range=(first, last)
+    ).values('date').annotate(total=Sum('total_amount')).values_list('date', 'total')
+
+
+def _daily_payments(user, first, last):
+    return DailyPaymentRollup.objects.filter(
+        user=user, date__range=(first, last)
+    ).values('date').annotate(total=Sum('count')).values_list('date', 'total')
+
+
+def _daily_projects(user, first, last):
+    start = timezone.make_aware(datetime.datetime.combine(first, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(last + datetime.timedelta(days=1), datetime.time.min))
+    return Project.objects.filter(
+        user=user, created_at__gte=start, created_at__lt=end
+    ).order_by().annotate(date=TruncDate('created_at')).values('date').annotate(
+        total=Count('pk')
+    ).values_list('date', 'total')
+
+
+def _total_before(user, metric, first, currency=DEFAULT_CURRENCY):
+    """Return the metric's total over all days before ``first``."""
+    if metric == 'customers':
+        queryset = DailyCustomerRollup.objects.filter(user=user, date__lt=first)
+        total = queryset.aggregate(total=Sum('new_customers'))['total']
+    elif metric == 'revenue':
+        queryset = DailyPaymentRollup.objects.filter(
+            user=user, status='completed', currency=currency, date__lt=first
+        )
+        total = queryset.aggregate(total=Sum('total_amount'))['total']
+    elif metric == 'payments':
+        queryset = DailyPaymentRollup.objects.filter(user=user, date__lt=first)
+        total = queryset.aggregate(total=Sum('count'))['total']
+    else:
+        start = timezone.make_aware(datetime.datetime.combine(first, datetime.time.min))
+        total = Project.objects.filter(user=user, created_at__lt=start).count()
+    return float(total or 0)
+
+
+# metric -> (daily loader, values are counts)
+METRICS = {
+    'customers': (_daily_customers, True),
+    'revenue': (_daily_revenue, False),
+    'payments': (_daily_payments, True),
+    'projects': (_daily_projects, True),
+}
+
+
+def bucket_index(days, granularity):
+    """
+    Map each datetime64[D] in ``days`` to its bucket number and return
+    ``(indices, bucket_starts)``, where bucket_starts are datetime64[D].
+    """
+    if granularity == 'day':
+        periods = days.astype('int64')
+        starts = periods.astype('datetime64[D]')
+    elif granularity == 'week':
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday.
+        periods = (days.astype('int64') + 3) // 7
+        starts = (periods * 7 - 3).astype('datetime64[D]')
+    else:
+        months = days.astype('datetime64[M]').astype('int64')
+        if granularity == 'quarter':
+            periods = months // 3
+            starts = (periods * 3).astype('datetime64[M]').astype('datetime64[D]')
+        else:
+            periods = months
+            starts = periods.astype('datetime64[M]').astype('datetime64[D]')
+    indices = periods - periods[0]
+    bucket_starts = starts[np.unique(indices, return_index=True)[1]]
+    return indices, bucket_starts
+
+
+def moving_average(values, window):
+    """Trailing mean over ``window`` buckets (shorter at the start of the series)."""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    positions = np.arange(1, len(values) + 1)
+    lower = np.maximum(positions - window, 0)
+    return (sums[positions] - sums[lower]) / (positions - lower)
+
+
+def build_timeseries(user, metric, granularity, first, last, window=7, currency=DEFAULT_CURRENCY):
+    """
+    Return a dense series for ``metric`` between ``first`` and ``last`` inclusive.
+
+    The result holds one label (bucket start date) per bucket with the bucket
+    value, the running total including everything before ``first``, and a
+    trailing moving average over ``window`` buckets. Revenue only counts
+    payments in ``currency``.
+    """
+    loader, is_count = METRICS[metric]
+    if metric == 'revenue':
+        rows = list(loader(user, first, last, currency))
+    else:
+        rows = list(loader(user, first, last))
+
+    days = np.arange(np.datetime64(first, 'D'), np.datetime64(last, 'D') + 1)
+    daily = np.zeros(len(days))
+    if rows:
+        dates, amounts = zip(*rows)
+        offsets = np.array(dates, dtype='datetime64[D]') - days[0]
+        daily = np.bincount(
+            offsets.astype('int64'),
+            weights=np.array(amounts, dtype=float),
+            minlength=len(days)
+        )
+
+    indices, bucket_starts = bucket_index(days, granularity)
+    values = np.bincount(indices, weights=daily, minlength=len(bucket_starts))
+    cumulative = np.cumsum(values) + _total_before(user, metric, first, currency)
+    averages = moving_average(values, window)
+
+    if is_count:
+        values = values.round().astype('int64')
+        cumulative = cumulative.round().astype('int64')
+    else:
+        values = values.round(2)
+        cumulative = cumulative.round(2)
+
+    series = {
+        'metric': metric,
+        'granularity': granularity,
+        'start': first.isoformat(),
+        'end': last.isoformat(),
+        'window': window,
+        'labels': bucket_starts.astype(str).tolist(),
+        'values': values.tolist(),
+        'cumulative': cumulative.tolist(),
+        'moving_average': averages.round(2).tolist(),
+    }
+    if metric == 'revenue':
+        series['currency'] = currency
+    return series
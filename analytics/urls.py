@@ -8,4 +8,5 @@ app_name = 'analytics'
 
 urlpatterns = [
     path('', views.index, name='index'),
-]
\ No newline at end of file
+    path('api/timeseries/', views.timeseries, name='timeseries'),
+]
@@ -1,8 +1,15 @@
 """
 Analytics views for DataLinkCRM.
 """
+import datetime
+
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+from .timeseries import METRICS, GRANULARITIES, MAX_RANGE_DAYS, DEFAULT_CURRENCY, build_timeseries
 
 @login_required
 def index(request):
@@ -11,3 +18,41 @@ def index(request):
         'title': 'Analytics',
     }
     return render(request, 'analytics/index.html', context)
+
+@login_required
+@require_http_methods(["GET"])
+def timeseries(request):
+    """
+    Dense time series for a metric.
+
+    Query parameters: ``metric`` (customers, revenue, payments, projects),
+    ``granularity`` (day, week, month, quarter), ``start``/``end`` as
+    YYYY-MM-DD (default: the last 90 days), ``window``, the number of
+    buckets in the moving average, and ``currency``, the 3-letter code
+    revenue is charted in (default KES).
+    """
+    metric = request.GET.get('metric', 'customers')
+    granularity = request.GET.get('granularity', 'day')
+    if metric not in METRICS:
+        return JsonResponse({'error': f"Unknown metric '{metric}'"}, status=400)
+    if granularity not in GRANULARITIES:
+        return JsonResponse({'error': f"Unknown granularity '{granularity}'"}, status=400)
+    currency = request.GET.get('currency', DEFAULT_CURRENCY).strip().upper()
+    if len(currency) != 3 or not currency.isalpha():
+        return JsonResponse({'error': 'currency must be a 3-letter code'}, status=400)
+
+    try:
+        last = datetime.date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        first = datetime.date.fromisoformat(request.GET['start']) if request.GET.get('start') else last - datetime.timedelta(days=89)
+        window = int(request.GET.get('window', 7))
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be YYYY-MM-DD and window an integer'}, status=400)
+
+    if first > last:
+        return JsonResponse({'error': 'start must not be after end'}, status=400)
+    if (last - first).days >= MAX_RANGE_DAYS:
+        return JsonResponse({'error': f'Range is limited to {MAX_RANGE_DAYS} days'}, status=400)
+    if window < 1:
+        return JsonResponse({'error': 'window must be at least 1'}, status=400)
+
+    return JsonResponse(build_timeseries(request.user, metric, granularity, first, last, window, currency))
@@ -4,6 +4,8 @@ Core API URL configuration.
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from dashboard import views as dashboard_views
+from search import views as search_views
 
 # API endpoints will be added here
 # router = DefaultRouter()
@@ -16,5 +18,7 @@ urlpatterns = [
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     
     # API v1 endpoints
+    path('stream/', dashboard_views.event_stream, name='event_stream'),
+    path('search/', search_views.search, name='search'),
     # path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Streaming data export for DataLinkCRM.
+
+Rows are read with values_list().iterator(chunk_size=...), so no model
+instances are built and only one chunk is held in memory, and are encoded as
+CSV or JSON Lines one chunk at a time, optionally gzip-compressed as they
+are produced. The same generators back the export views and the
+export_data management command.
+"""
+import csv
+import datetime
+import io
+import json
+import uuid
+import zlib
+from decimal import Decimal
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from customers.filters import filter_customers
+from customers.models import Customer
+from payments.filters import filter_payments
+from payments.models import Payment
+from projects.filters import filter_projects
+from projects.models import Project
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# name -> (model, list filter, exported fields); list filters take (queryset, params, user=).
+DATASETS = {
+    'customers': (Customer, filter_customers, [
+        'customer_id', 'first_name', 'last_name', 'email', 'phone', 'gender', 'customer_type',
+        'status', 'address', 'city', 'county', 'country', 'postal_code', 'company_name',
+        'job_title', 'industry', 'tags', 'created_at', 'last_contacted',
+    ]),
+    'payments': (Payment, filter_payments, [
+        'reference', 'amount', 'currency', 'status', 'payment_method', 'description',
+        'created_at', 'completed_at',
+    ]),
+    'projects': (Project, filter_projects, [
+        'id', 'name', 'description', 'status', 'priority', 'start_date', 'end_date',
+        'budget', 'created_at',
+    ]),
+}
+
+
+def _convert(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def _csv_chunks(header, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_convert(value) for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl_chunks(header, rows, chunk_size):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(_convert, row))), ensure_ascii=False))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks):
+    """Compress an iterable of byte strings into a gzip stream on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(user, dataset, params, fmt='csv', compress=False, chunk_size=CHUNK_SIZE):
+    """
+    Yield the user's ``dataset`` rows, filtered like its list view, as bytes.
+
+    ``params`` holds the list view filters (a QueryDict or dict). Filters
+    are applied before the first chunk is produced, so a ValueError for a
+    malformed filter is raised by this call rather than mid-stream.
+    """
+    model, filter_queryset, fields = DATASETS[dataset]
+    queryset, _ = filter_queryset(model.objects.filter(user=user), params, user=user)
+    rows = queryset.order_by('created_at', 'pk').values_list(*fields).iterator(chunk_size=chunk_size)
+
+    encode = _csv_chunks if fmt == 'csv' else _jsonl_chunks
+    chunks = (text.encode('utf-8') for text in encode(fields, rows, chunk_size))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_response(request, dataset):
+    """
+    Return a StreamingHttpResponse exporting ``dataset`` for the request's user.
+
+    Query parameters: ``format`` (csv or jsonl), ``gzip=1`` to compress, and
+    the dataset's list filters.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        fmt = 'csv'
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    try:
+        chunks = export_chunks(request.user, dataset, request.GET, fmt=fmt, compress=compress)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    filename = f"{dataset}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response = StreamingHttpResponse(
+        chunks,
+        content_type='application/gzip' if compress else FORMATS[fmt]
+    )
+    if compress:
+        filename += '.gz'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
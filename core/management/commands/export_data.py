@@ -0,0 +1,55 @@
+"""
+Export customers, payments or projects as CSV or JSON Lines.
+"""
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import DATASETS, FORMATS, CHUNK_SIZE, export_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream a user's customers, payments or projects to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--user', required=True, help='Username whose rows are exported.')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('--output', default='-', help='File to write, or - for stdout.')
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help='List filter, e.g. status=active (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user '{options['user']}'")
+
+        filters = {}
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Invalid filter '{item}', expected NAME=VALUE")
+            filters[name] = value
+
+        try:
+            chunks = export_chunks(
+                user, options['dataset'], filters,
+                fmt=options['format'],
+                compress=options['gzip'],
+                chunk_size=max(1, options['chunk_size'])
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+        else:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
@@ -0,0 +1,114 @@
+"""
+Keyset pagination helpers for DataLinkCRM.
+
+Pages are fetched with a seek condition on the ordering columns instead of
+OFFSET, so every page costs one index range scan no matter how deep the
+client has scrolled. The position is handed to clients as an opaque cursor.
+"""
+import base64
+import datetime
+import json
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded."""
+
+
+def _cursor_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def encode_cursor(values):
+    """Encode a list of ordering values as an opaque, URL-safe cursor."""
+    raw = json.dumps([_cursor_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor made by encode_cursor() holding ``size`` values."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Malformed cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Malformed cursor')
+    return values
+
+
+def seek_filter(ordering, values):
+    """
+    Return a Q matching rows that come after ``values`` in ``ordering``.
+
+    ``ordering`` is a sequence of field names, each optionally prefixed with
+    ``-`` for descending order; the last field must be unique.
+    """
+    conditions = []
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition = Q(**{f'{name}__{lookup}': values[index]})
+        for previous, value in zip(ordering[:index], values[:index]):
+            condition &= Q(**{previous.lstrip('-'): value})
+        conditions.append(condition)
+    return reduce(lambda left, right: left | right, conditions)
+
+
+def _ordering_field(queryset, name):
+    """Return the model field or annotation output field ``name`` orders ``queryset`` by."""
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    model = queryset.model
+    *relations, name = name.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def cursor_position(queryset, ordering, cursor):
+    """
+    Decode ``cursor`` into values of the fields in ``ordering``.
+
+    Each value is converted with its field's to_python(), so a cursor that
+    was tampered with fails here instead of in the database.
+    """
+    values = decode_cursor(cursor, len(ordering))
+    try:
+        return [
+            _ordering_field(queryset, field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValidationError, ValueError, TypeError):
+        raise InvalidCursor('Malformed cursor')
+
+
+def keyset_page(queryset, ordering, cursor=None, limit=20):
+    """
+    Return ``(rows, next_cursor)`` for the page of ``queryset`` after ``cursor``.
+
+    ``next_cursor`` is None on the last page. Raises InvalidCursor for a
+    cursor that was not produced for this ordering.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(seek_filter(ordering, cursor_position(queryset, ordering, cursor)))
+
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([
+            last[field.lstrip('-')] if isinstance(last, dict) else getattr(last, field.lstrip('-'))
+            for field in ordering
+        ])
+    return rows, next_cursor
@@ -63,6 +63,8 @@ LOCAL_APPS = [
     'calendar',
     'maps',
     'reports',
+    'search',
+    'segments',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -232,6 +234,41 @@ MPESA_PASS_KEY = config('MPESA_PASS_KEY', default='bfb279f9aa9bdbcf158e97dd71a46
 MPESA_CALLBACK_URL = config('MPESA_CALLBACK_URL', default='https://your-project-name.herokuapp.com/api/mpesa-callback')
 MPESA_TIMEOUT_URL = config('MPESA_TIMEOUT_URL', default='https://your-project-name.herokuapp.com/api/mpesa-timeout')
 
+# M-PESA gateway (see payments.mpesa)
+MPESA_TIMEOUT = 30  # seconds per Daraja request
+MPESA_POOL_SIZE = 10  # pooled connections to Daraja per process
+MPESA_MAX_WORKERS = 8  # concurrent STK pushes in push_payments()
+MPESA_TOKEN_EXPIRY_MARGIN = 60  # seconds before expiry a cached OAuth token is renewed
+MPESA_MAX_AMOUNT = 250000  # largest single M-PESA transaction Safaricom allows, in KES
+# Shared secret ending every M-PESA callback URL ('.../mpesa-callback/<secret>').
+# STK pushes append it to MPESA_CALLBACK_URL; URLs registered with Safaricom by
+# hand, such as MPESA_TIMEOUT_URL, need it too. Callbacks are refused while unset.
+MPESA_CALLBACK_SECRET = config('MPESA_CALLBACK_SECRET', default='')
+# Addresses M-PESA callbacks are accepted from; empty accepts any.
+MPESA_CALLBACK_ALLOWED_IPS = [
+    ip.strip() for ip in config('MPESA_CALLBACK_ALLOWED_IPS', default='').split(',') if ip.strip()
+]
+# Proxies in front of the app that append to X-Forwarded-For; the callback's
+# address is read from it only when this is set, otherwise from REMOTE_ADDR.
+MPESA_TRUSTED_PROXY_COUNT = config('MPESA_TRUSTED_PROXY_COUNT', default=0, cast=int)
+
+# Payment callback inbox (see payments.inbox); drained by
+# `manage.py drain_payment_inbox` or the payments.drain_inbox task.
+STRIPE_WEBHOOK_TOLERANCE = 300  # seconds a signed Stripe webhook stays valid
+PAYMENT_INBOX_BATCH_SIZE = 500  # events applied per transaction
+PAYMENT_INBOX_POLL_INTERVAL = 2  # seconds the drainer sleeps when the inbox is empty
+PAYMENT_INBOX_MAX_ATTEMPTS = 5  # tries to find an event's payment before it is left unmatched
+PAYMENT_INBOX_RETRY_DELAY = 30  # seconds before the first retry; doubled for each later one
+
+# Payment.metadata keys copied into indexed Payment columns (see payments.metadata);
+# run `manage.py backfill_payment_metadata` after changing this.
+PAYMENT_METADATA_COLUMNS = {
+    'mpesa_receipt': 'mpesa_receipt',
+    'checkout_request_id': 'mpesa_checkout_request_id',
+    'phone': 'phone',
+    'stripe_payment_intent_id': 'stripe_payment_intent_id',
+}
+
 # Crispy Forms Bootstrap 5
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -276,10 +313,14 @@ MAPBOX_ACCESS_TOKEN = config('MAPBOX_ACCESS_TOKEN', default='')
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
 
+# SystemStats rollup (see dashboard.rollups); run every few minutes via
+# `manage.py rollup_system_stats` or the dashboard.rollup_system_stats task.
+DASHBOARD_ROLLUP_LAG = 60  # seconds the high-water mark trails the clock
+
 # Cache configuration
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': config('REDIS_URL', default='redis://localhost:6379/1'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
@@ -287,6 +328,40 @@ CACHES = {
     }
 }
 
+# Dashboard summary cache (see dashboard.summary)
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_SUMMARY_TIMEOUT = 900  # 15 minutes; entries are also invalidated on write
+
+# Dashboard event stream (see dashboard.events)
+DASHBOARD_STREAM_KEEPALIVE = 15  # seconds between keepalive comments
+DASHBOARD_STREAM_MAX_AGE = 300  # seconds before the browser is asked to reconnect
+# Every open stream holds a server worker for up to DASHBOARD_STREAM_MAX_AGE,
+# so only enable it behind a threaded or async server (e.g. gunicorn with
+# --worker-class gthread or gevent). While disabled the dashboard page polls
+# the ETag'd dashboard data every DASHBOARD_POLL_INTERVAL seconds instead.
+DASHBOARD_STREAM_ENABLED = config('DASHBOARD_STREAM_ENABLED', default=False, cast=bool)
+DASHBOARD_POLL_INTERVAL = 60
+
+# Unread notification counters (see dashboard.notifications)
+NOTIFICATION_UNREAD_TIMEOUT = 3600  # seconds before a counter is recounted from the database
+NOTIFICATION_RETENTION_DAYS = 90  # read notifications older than this are archived
+NOTIFICATION_ARCHIVE_BATCH_SIZE = 500  # rows moved per archive transaction
+
+# Global search (see search.engine)
+SEARCH_RESULT_LIMIT = 10
+SEARCH_TIMEOUT_MS = 250  # queries running longer are cancelled
+
+# Customer typeahead (see customers.typeahead)
+TYPEAHEAD_MAX_TENANTS = 64  # per-user prefix indexes kept in each process
+
+# Customer ID allocation (see customers.identifiers)
+CUSTOMER_ID_BLOCK_SIZE = 100  # numbers each process reserves at a time
+
+# Follow-up scheduler (see customers.followups)
+FOLLOW_UP_HORIZON_MINUTES = 60  # follow-ups loaded into the scheduler's heap ahead of time
+FOLLOW_UP_BATCH_SIZE = 500  # follow-ups loaded and announced per query
+FOLLOW_UP_MAX_SLEEP = 300  # seconds; bounds how late a follow-up saved in another process is seen
+
 # Session configuration
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
@@ -0,0 +1,124 @@
+"""
+Tests for the core app.
+"""
+import csv
+import datetime
+import gzip
+import io
+import json
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .exports import export_chunks, export_response
+from .pagination import InvalidCursor, cursor_position, encode_cursor, keyset_page, seek_filter
+from customers.models import Customer
+from payments.models import Payment
+
+ORDERING = ('-date_joined', '-id')
+
+# Exported rows are created through the models, whose signals touch the cache; keep it in memory instead of Redis.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class SeekFilterTests(SimpleTestCase):
+    def test_descending_with_tie_breaker(self):
+        joined = datetime.datetime(2024, 5, 1, 12, 0)
+        self.assertEqual(
+            seek_filter(ORDERING, [joined, 7]),
+            Q(date_joined__lt=joined) | (Q(id__lt=7) & Q(date_joined=joined))
+        )
+
+    def test_mixed_directions(self):
+        self.assertEqual(
+            seek_filter(('-score', 'id'), [0.5, 3]),
+            Q(score__lt=0.5) | (Q(id__gt=3) & Q(score=0.5))
+        )
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        joined = timezone.now()
+        # Pairs of users joining in the same instant, so pages split ties.
+        for index in range(7):
+            user = User.objects.create_user(f'keyset{index}')
+            user.date_joined = joined - datetime.timedelta(minutes=index // 2)
+            user.save(update_fields=['date_joined'])
+        self.queryset = User.objects.filter(username__startswith='keyset')
+
+    def test_pages_cover_every_row_once_in_order(self):
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = keyset_page(self.queryset.values('id', 'date_joined'), ORDERING, cursor=cursor, limit=3)
+            seen.extend(row['id'] for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(self.queryset.order_by(*ORDERING).values_list('id', flat=True)))
+
+    def test_cursor_position_converts_values(self):
+        user = self.queryset.order_by(*ORDERING).first()
+        position = cursor_position(self.queryset, ORDERING, encode_cursor([user.date_joined, user.pk]))
+        self.assertEqual(position, [user.date_joined, user.pk])
+
+    def test_tampered_cursors_are_rejected(self):
+        for cursor in [
+            'not base64 json',
+            encode_cursor(['yesterday', 1]),
+            encode_cursor([timezone.now(), 'one']),
+            encode_cursor([timezone.now()]),
+        ]:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                keyset_page(self.queryset, ORDERING, cursor=cursor)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        for index, (status, county) in enumerate([('active', 'Nairobi'), ('lead', 'Mombasa'), ('active', 'Kisumu')]):
+            Customer.objects.create(
+                user=self.user, first_name='Export', last_name=str(index), email=f'export{index}@example.com',
+                phone=f'+254777{index:06d}', status=status, county=county
+            )
+        Customer.objects.create(
+            user=User.objects.create_user('other'), first_name='Not', last_name='Mine', email='other@example.com',
+            phone='+254777999999'
+        )
+
+    def export(self, dataset='customers', params=None, **kwargs):
+        return b''.join(export_chunks(self.user, dataset, params or {}, **kwargs))
+
+    def test_csv_streams_the_users_rows_in_chunks(self):
+        chunks = list(export_chunks(self.user, 'customers', {}, chunk_size=2))
+        self.assertEqual(len(chunks), 2)
+        rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual([row['email'] for row in rows], [f'export{index}@example.com' for index in range(3)])
+        created = Customer.objects.get(email='export0@example.com').created_at
+        self.assertEqual(rows[0]['created_at'], created.isoformat())
+
+    def test_jsonl_filters_and_gzip(self):
+        lines = self.export(params={'status': 'active'}, fmt='jsonl').decode().splitlines()
+        self.assertEqual([json.loads(line)['county'] for line in lines], ['Nairobi', 'Kisumu'])
+
+        Payment.objects.create(
+            user=self.user, amount=Decimal('1250.50'), payment_method='cash', reference='EXPORT1'
+        )
+        payments = self.export('payments', fmt='jsonl')
+        self.assertEqual(json.loads(payments)['amount'], '1250.50')
+        self.assertEqual(gzip.decompress(self.export('payments', fmt='jsonl', compress=True)), payments)
+
+    def test_response_rejects_malformed_filters_and_names_the_file(self):
+        request = RequestFactory().get('/export/customers/', {'tags': 'vip and ('})
+        request.user = self.user
+        self.assertEqual(export_response(request, 'customers').status_code, 400)
+
+        request = RequestFactory().get('/export/customers/', {'format': 'jsonl', 'gzip': '1'})
+        request.user = self.user
+        response = export_response(request, 'customers')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 3)
@@ -36,9 +36,11 @@ urlpatterns = [
     path('calendar/', include('schedulecal.urls')),
     path('maps/', include('maps.urls')),
     path('reports/', include('reports.urls')),
+    path('segments/', include('segments.urls')),
     
     # API endpoints
     path('api/v1/', include('core.api_urls')),
+    path('api/', include('payments.webhook_urls')),
     
     # Health check
     path('health/', include('core.health_urls')),
@@ -0,0 +1,247 @@
+"""
+Duplicate customer detection and merging for DataLinkCRM.
+
+Comparing every customer with every other one is quadratic, so customers
+are first grouped by cheap blocking keys (normalized phone number, email
+local part, Soundex of the name) and only customers sharing a key are
+compared. Candidate pairs are scored with difflib string similarity in
+batches spread over a process pool, and pairs scoring at least the
+threshold are stored as DuplicateCandidate rows for review.
+
+merge_customers() folds a duplicate into the customer that is kept:
+notes, interactions and payments are re-pointed with one UPDATE each, blank
+fields and tags are filled in from the duplicate, and the duplicate is
+deleted.
+"""
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from functools import partial
+from itertools import combinations, islice
+
+from django.db import transaction
+
+from .models import Customer, CustomerInteraction, CustomerNote, DuplicateCandidate
+from .tags import split_tags
+from payments.models import Payment
+
+DEFAULT_THRESHOLD = 0.8
+
+# Pairs sent to a worker process at a time.
+BATCH_SIZE = 2000
+
+# Blocks larger than this (a shared placeholder phone, a very common name)
+# say little about identity and would bring back the quadratic cost, so
+# they are skipped.
+MAX_BLOCK_SIZE = 50
+
+# Weights of the similarity signals in a pair's score.
+WEIGHTS = {
+    'name': 0.5,
+    'phone': 0.3,
+    'email': 0.2,
+}
+
+# Fields copied from the duplicate when the kept customer has them blank.
+FILL_FIELDS = [
+    'gender', 'address', 'city', 'county', 'postal_code', 'company_name',
+    'job_title', 'industry', 'date_of_birth',
+]
+
+RECORD_FIELDS = ['pk', 'first_name', 'last_name', 'email', 'phone']
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def soundex(name):
+    """Return the American Soundex code of ``name`` ('' for no letters)."""
+    letters = [char for char in name.lower() if 'a' <= char <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if char not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def normalize_phone(phone):
+    """Return the last nine digits of a phone number, the part all local forms share."""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-9:] if len(digits) >= 9 else ''
+
+
+def email_local_part(email):
+    """Return an email's local part without dots or a +suffix."""
+    local = (email or '').lower().split('@')[0]
+    return local.split('+')[0].replace('.', '')
+
+
+def full_name(record):
+    return ' '.join(f"{record['first_name']} {record['last_name']}".lower().split())
+
+
+def blocking_keys(record):
+    """Return the keys a customer record is grouped under."""
+    keys = []
+    phone = normalize_phone(record['phone'])
+    if phone:
+        keys.append('phone:' + phone)
+    local = email_local_part(record['email'])
+    if len(local) >= 3:
+        keys.append('email:' + local)
+    first, last = soundex(record['first_name']), soundex(record['last_name'])
+    if first and last:
+        keys.append('name:' + first + last)
+    return keys
+
+
+def score_pair(a, b):
+    """Return ``(score, reasons)`` for two customer records."""
+    reasons = []
+    name = SequenceMatcher(None, full_name(a), full_name(b)).ratio()
+    if name >= 0.85:
+        reasons.append('name')
+    phone = 1.0 if normalize_phone(a['phone']) and normalize_phone(a['phone']) == normalize_phone(b['phone']) else 0.0
+    if phone:
+        reasons.append('phone')
+    email = SequenceMatcher(None, email_local_part(a['email']), email_local_part(b['email'])).ratio()
+    if email >= 0.85:
+        reasons.append('email')
+    score = WEIGHTS['name'] * name + WEIGHTS['phone'] * phone + WEIGHTS['email'] * email
+    return score, reasons
+
+
+def score_pairs(pairs, threshold=DEFAULT_THRESHOLD):
+    """Score a batch of record pairs; returns the ``(a pk, b pk, score, reasons)`` above threshold."""
+    matches = []
+    for a, b in pairs:
+        score, reasons = score_pair(a, b)
+        if score >= threshold:
+            matches.append((a['pk'], b['pk'], round(score, 4), ','.join(reasons)))
+    return matches
+
+
+def candidate_pairs(records):
+    """Yield each pair of record indexes that share a blocking key, once."""
+    blocks = {}
+    for index, record in enumerate(records):
+        for key in blocking_keys(record):
+            blocks.setdefault(key, []).append(index)
+
+    seen = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for pair in combinations(members, 2):
+            if pair not in seen:
+                seen.add(pair)
+                yield pair
+
+
+def _pair_batches(records, size):
+    pairs = candidate_pairs(records)
+    while True:
+        batch = [(records[i], records[j]) for i, j in islice(pairs, size)]
+        if not batch:
+            return
+        yield batch
+
+
+def find_duplicates(user, threshold=DEFAULT_THRESHOLD, workers=None, batch_size=BATCH_SIZE):
+    """
+    Detect likely duplicates among ``user``'s customers and store them.
+
+    ``workers`` is the number of scoring processes (default: one per CPU);
+    pass 1 to score in this process. Existing candidates get their score
+    refreshed without losing a dismissal. Returns the number of candidate
+    pairs stored.
+    """
+    records = list(
+        Customer.objects.filter(user=user).order_by('pk').values(*RECORD_FIELDS).iterator(chunk_size=batch_size)
+    )
+    for record in records:
+        record['pk'] = str(record['pk'])
+
+    batches = _pair_batches(records, batch_size)
+    if workers == 1:
+        return _store(user, (score_pairs(batch, threshold) for batch in batches), batch_size)
+    return _store(user, _score_in_pool(batches, threshold, workers or os.cpu_count() or 1), batch_size)
+
+
+def _score_in_pool(batches, threshold, workers):
+    """Score batches in worker processes, keeping at most two batches per worker in flight."""
+    score = partial(score_pairs, threshold=threshold)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(score, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _store(user, results, batch_size):
+    stored = 0
+    for matches in results:
+        if not matches:
+            continue
+        DuplicateCandidate.objects.bulk_create(
+            [
+                DuplicateCandidate(user=user, customer_a_id=a, customer_b_id=b, score=score, reasons=reasons)
+                for a, b, score, reasons in matches
+            ],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['customer_a', 'customer_b'],
+            update_fields=['score', 'reasons', 'updated_at']
+        )
+        stored += len(matches)
+    return stored
+
+
+def merge_customers(primary, duplicate):
+    """
+    Merge ``duplicate`` into ``primary`` and delete ``duplicate``.
+
+    Returns ``primary``.
+    """
+    if primary.pk == duplicate.pk or primary.user_id != duplicate.user_id:
+        raise ValueError('Only two different customers of the same user can be merged')
+
+    with transaction.atomic():
+        CustomerNote.objects.filter(customer=duplicate).update(customer=primary)
+        CustomerInteraction.objects.filter(customer=duplicate).update(customer=primary)
+        Payment.objects.filter(customer=duplicate).update(customer=primary)
+
+        for field in FILL_FIELDS:
+            if not getattr(primary, field) and getattr(duplicate, field):
+                setattr(primary, field, getattr(duplicate, field))
+        tags = ', '.join(split_tags(f'{primary.tags},{duplicate.tags}'))
+        if len(tags) <= Customer._meta.get_field('tags').max_length:
+            primary.tags = tags
+        if duplicate.last_contacted and (not primary.last_contacted or duplicate.last_contacted > primary.last_contacted):
+            primary.last_contacted = duplicate.last_contacted
+        if duplicate.notes:
+            primary.notes = '\n\n'.join(part for part in [primary.notes, duplicate.notes] if part)
+
+        duplicate.delete()
+        # A full save so every derived index (tags, search, segments) re-reads the kept customer.
+        primary.save()
+    return primary
@@ -0,0 +1,49 @@
+"""
+Customer list filters for DataLinkCRM.
+"""
+from .models import Customer
+from .tags import format_tag, normalize_tag, tag_query
+
+STATUS_VALUES = {value for value, _ in Customer.STATUS_CHOICES}
+TYPE_VALUES = {value for value, _ in Customer.CUSTOMER_TYPES}
+
+
+def filter_customers(queryset, params, user=None):
+    """
+    Apply the list filters in ``params`` (a QueryDict or dict) to ``queryset``.
+
+    Supported filters are ``status``, ``type``, ``county``, ``tag`` (one
+    tag) and ``tags`` (a tag expression, see customers.tags); unknown status
+    and type values are ignored. ``user`` narrows tag name lookups to that
+    user's tags. Returns the filtered queryset and the dict of filters that
+    were applied; raises TagQueryError for a malformed tag expression.
+    """
+    applied = {}
+
+    status = params.get('status', '').strip()
+    if status in STATUS_VALUES:
+        queryset = queryset.filter(status=status)
+        applied['status'] = status
+
+    customer_type = params.get('type', '').strip()
+    if customer_type in TYPE_VALUES:
+        queryset = queryset.filter(customer_type=customer_type)
+        applied['type'] = customer_type
+
+    county = params.get('county', '').strip()
+    if county:
+        queryset = queryset.filter(county__iexact=county)
+        applied['county'] = county
+
+    user_id = user.pk if user is not None else None
+    tag = params.get('tag', '').strip()
+    if tag:
+        queryset = queryset.filter(tag_query(format_tag(normalize_tag(tag)), user_id))
+        applied['tag'] = tag
+
+    tags = params.get('tags', '').strip()
+    if tags:
+        queryset = queryset.filter(tag_query(tags, user_id))
+        applied['tags'] = tags
+
+    return queryset, applied
@@ -0,0 +1,200 @@
+"""
+Follow-up scheduling for DataLinkCRM.
+
+Interactions flagged ``follow_up_required`` form each user's due queue,
+read along a partial index that holds only open follow-ups.
+
+FollowUpScheduler announces follow-ups as they fall due. It loads the
+follow-ups due within FOLLOW_UP_HORIZON_MINUTES into a min-heap keyed on
+the due date, sleeps until the earliest one (or the end of the horizon),
+then claims everything due and sends the notifications in bulk. Follow-ups
+saved in the same process are pushed into the heap directly and wake it.
+Any other wakeup reloads the heap, so ones saved elsewhere are picked up at
+the latest after FOLLOW_UP_MAX_SLEEP seconds.
+"""
+import datetime
+import heapq
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import CustomerInteraction
+from core.pagination import keyset_page
+from dashboard.models import Notification
+from dashboard.notifications import create_notifications
+
+logger = logging.getLogger(__name__)
+
+QUEUE_ORDERING = ('follow_up_date', 'id')
+
+# Follow-ups overdue by this much are announced as high priority.
+OVERDUE_PRIORITY_AFTER = datetime.timedelta(days=1)
+
+# The scheduler running in this process, if any; see FollowUpScheduler.run().
+_scheduler = None
+
+
+def due_queue(user, until=None, cursor=None, limit=20):
+    """
+    Return ``(interactions, next_cursor)`` for ``user``'s open follow-ups due by ``until``.
+
+    ``until`` defaults to now; the oldest follow-ups come first.
+    """
+    interactions = CustomerInteraction.objects.filter(
+        user=user,
+        follow_up_required=True,
+        follow_up_date__lte=until or timezone.now()
+    ).select_related('customer')
+    return keyset_page(interactions, QUEUE_ORDERING, cursor=cursor, limit=limit)
+
+
+def complete_follow_up(user, interaction_id):
+    """Close one of the user's follow-ups; returns False if there was none open."""
+    return bool(CustomerInteraction.objects.filter(
+        pk=interaction_id, user=user, follow_up_required=True
+    ).update(follow_up_required=False))
+
+
+def reschedule_follow_up(user, interaction_id, when):
+    """Move one of the user's follow-ups to ``when``; it is announced again then."""
+    updated = CustomerInteraction.objects.filter(pk=interaction_id, user=user).update(
+        follow_up_required=True, follow_up_date=when, follow_up_notified_at=None
+    )
+    if updated:
+        transaction.on_commit(lambda: follow_up_changed(interaction_id, when))
+    return bool(updated)
+
+
+def follow_up_changed(interaction_id, follow_up_date):
+    """Tell this process's scheduler about a new or moved follow-up."""
+    scheduler = _scheduler
+    if scheduler is not None and follow_up_date is not None:
+        scheduler.push(follow_up_date, interaction_id)
+
+
+def _notification(interaction, now):
+    customer = interaction.customer
+    overdue = now - interaction.follow_up_date >= OVERDUE_PRIORITY_AFTER
+    return Notification(
+        user_id=interaction.user_id,
+        title=f"Follow up with {customer.get_full_name()}",
+        message=interaction.subject,
+        priority='high' if overdue else 'medium',
+        action_url=reverse('customers:detail', args=[customer.pk]),
+    )
+
+
+def notify_due(interaction_ids, now=None):
+    """
+    Claim the given follow-ups that are due and still unannounced, and notify their users.
+
+    The claim is a conditional UPDATE stamped with ``now``, so concurrent
+    schedulers never announce a follow-up twice. Returns the number sent.
+    """
+    now = now or timezone.now()
+    claimed = CustomerInteraction.objects.filter(
+        pk__in=interaction_ids,
+        follow_up_required=True,
+        follow_up_notified_at__isnull=True,
+        follow_up_date__lte=now
+    ).update(follow_up_notified_at=now)
+    if not claimed:
+        return 0
+
+    interactions = CustomerInteraction.objects.filter(
+        pk__in=interaction_ids, follow_up_notified_at=now
+    ).select_related('customer')
+    return create_notifications(_notification(interaction, now) for interaction in interactions)
+
+
+class FollowUpScheduler:
+    """Sleeps until the next follow-up falls due, using a min-heap of due dates."""
+
+    def __init__(self, horizon=None, batch_size=None, max_sleep=None):
+        self.horizon = datetime.timedelta(minutes=horizon or settings.FOLLOW_UP_HORIZON_MINUTES)
+        self.batch_size = batch_size or settings.FOLLOW_UP_BATCH_SIZE
+        self.max_sleep = max_sleep or settings.FOLLOW_UP_MAX_SLEEP
+        self.heap = []
+        self.loaded_at = None
+        self.loaded_until = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def push(self, follow_up_date, interaction_id):
+        """Add a follow-up; it only matters if it falls within the loaded horizon."""
+        with self.lock:
+            if self.loaded_until is not None and follow_up_date <= self.loaded_until:
+                heapq.heappush(self.heap, (follow_up_date, interaction_id))
+                self.wakeup.set()
+
+    def load(self, now):
+        """Fill the heap with the unannounced follow-ups due before the horizon."""
+        until = now + self.horizon
+        upcoming = list(
+            CustomerInteraction.objects.filter(
+                follow_up_required=True,
+                follow_up_notified_at__isnull=True,
+                follow_up_date__lte=until
+            ).order_by(*QUEUE_ORDERING).values_list('follow_up_date', 'id')[:self.batch_size]
+        )
+        with self.lock:
+            self.heap = upcoming
+            heapq.heapify(self.heap)
+            self.loaded_at = now
+            # A full batch may have cut the horizon short; reload after its last date.
+            self.loaded_until = upcoming[-1][0] if len(upcoming) == self.batch_size else until
+
+    def _stale(self, now):
+        if self.loaded_until is None or now >= self.loaded_until:
+            return True
+        # Steady pushes never let a sleep run out; reload now and then regardless.
+        return (now - self.loaded_at).total_seconds() >= self.max_sleep
+
+    def run_once(self, now=None, reload=False):
+        """
+        Announce what is due at ``now`` and return the seconds until the next wakeup.
+
+        ``reload`` refreshes the heap from the database first, to catch
+        follow-ups saved by other processes.
+        """
+        now = now or timezone.now()
+        if reload or self._stale(now):
+            self.load(now)
+
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap)[1])
+        for start in range(0, len(due), self.batch_size):
+            sent = notify_due(due[start:start + self.batch_size], now=now)
+            if sent:
+                logger.info('Sent %s follow-up notifications', sent)
+
+        with self.lock:
+            next_time = min(self.heap[0][0], self.loaded_until) if self.heap else self.loaded_until
+        return max(0.0, min((next_time - timezone.now()).total_seconds(), self.max_sleep))
+
+    def run(self):
+        """Run until stop() is called."""
+        global _scheduler
+        _scheduler = self
+        try:
+            reload = False
+            while not self.stopping.is_set():
+                # Cleared before the pass, so a push made during it cuts the next sleep short.
+                self.wakeup.clear()
+                delay = self.run_once(reload=reload)
+                # Only a push is already in the heap; after any other wakeup
+                # the next pass reloads.
+                reload = bool(delay) and not self.wakeup.wait(delay)
+        finally:
+            _scheduler = None
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
@@ -0,0 +1,90 @@
+"""
+Customer ID allocation for DataLinkCRM.
+
+Customer IDs are ``CUS`` followed by a number taken from the
+``customer_id`` IdSequence row. Each process reserves a block of numbers
+with one atomic UPDATE and hands them out locally, so IDs never collide
+across workers and most allocations need no query at all.
+
+Numbers start at 1000000, above the six-digit random IDs issued before the
+sequence existed.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection, IntegrityError, transaction
+from django.db.models import F
+
+from .models import IdSequence
+
+PREFIX = 'CUS'
+SEQUENCE_NAME = 'customer_id'
+FIRST_NUMBER = 1000000
+
+
+def reserve_numbers(count, name=SEQUENCE_NAME):
+    """
+    Reserve ``count`` consecutive numbers from sequence ``name`` and return the first.
+
+    The increment is written before the new value is read, so the row lock
+    (or SQLite's write lock) serializes concurrent reservations.
+    """
+    with transaction.atomic():
+        if not IdSequence.objects.filter(name=name).update(next_value=F('next_value') + count):
+            try:
+                with transaction.atomic():
+                    IdSequence.objects.create(name=name, next_value=FIRST_NUMBER + count)
+                return FIRST_NUMBER
+            except IntegrityError:
+                # Another worker created the row first.
+                IdSequence.objects.filter(name=name).update(next_value=F('next_value') + count)
+        next_value = IdSequence.objects.filter(name=name).values_list('next_value', flat=True).get()
+    return next_value - count
+
+
+class BlockAllocator:
+    """Hands out numbers from blocks reserved with reserve_numbers()."""
+
+    def __init__(self, name=SEQUENCE_NAME):
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+
+    def get_block_size(self):
+        return getattr(settings, 'CUSTOMER_ID_BLOCK_SIZE', 100)
+
+    def allocate(self, count):
+        """Return ``count`` unused numbers."""
+        if connection.in_atomic_block:
+            # A rollback would undo the reservation, so nothing reserved here
+            # may outlive the caller's transaction.
+            start = reserve_numbers(count, self.name)
+            return list(range(start, start + count))
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse its parent's block.
+                self._pid = os.getpid()
+                self._next = self._end = 0
+
+            take = min(count, self._end - self._next)
+            numbers = list(range(self._next, self._next + take))
+            self._next += take
+
+            missing = count - take
+            if missing:
+                size = missing + self.get_block_size()
+                start = reserve_numbers(size, self.name)
+                numbers.extend(range(start, start + missing))
+                self._next, self._end = start + missing, start + size
+            return numbers
+
+
+allocator = BlockAllocator()
+
+
+def generate_customer_ids(count):
+    """Return ``count`` distinct unused customer IDs."""
+    return [f'{PREFIX}{number}' for number in allocator.allocate(count)]
@@ -0,0 +1,306 @@
+"""
+Bulk customer import for DataLinkCRM.
+
+Rows are streamed from a CSV or XLSX file and processed in chunks: each
+chunk is validated in one pass, checked for existing emails (ignoring
+case) with one IN query, given customer IDs in bulk and inserted with
+bulk_create in its own transaction. Memory use depends on the chunk size,
+not the file size.
+
+bulk_create skips post_save, so every inserted chunk is announced with the
+customers_bulk_created signal for the apps that keep derived data.
+"""
+import csv
+import io
+import re
+import zipfile
+from itertools import islice
+from xml.etree.ElementTree import ParseError
+
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .identifiers import generate_customer_ids
+from .models import Customer
+from .signals import customers_bulk_created
+
+try:
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+except ImportError:
+    openpyxl = None
+    InvalidFileException = None
+
+CHUNK_SIZE = 2000
+
+# Errors kept in the report; later ones are only counted.
+MAX_REPORTED_ERRORS = 1000
+
+REQUIRED_COLUMNS = ['first_name', 'last_name', 'email', 'phone']
+
+OPTIONAL_COLUMNS = [
+    'gender', 'customer_type', 'status', 'address', 'city', 'county', 'country',
+    'postal_code', 'company_name', 'job_title', 'industry', 'notes', 'tags',
+]
+
+PHONE_RE = re.compile(r'^\+254[0-9]{9}$')
+
+# Local and international forms normalized to +254XXXXXXXXX.
+PHONE_FORMS = [
+    (re.compile(r'^0([17][0-9]{8})$'), r'+254\1'),
+    (re.compile(r'^254([0-9]{9})$'), r'+254\1'),
+]
+
+CHOICES = {
+    'gender': Customer.GENDER_CHOICES,
+    'customer_type': Customer.CUSTOMER_TYPES,
+    'status': Customer.STATUS_CHOICES,
+}
+
+validate_email = EmailValidator()
+
+
+class CustomerImportError(ValueError):
+    """Raised when a file cannot be imported at all (bad format or columns)."""
+
+
+class ImportReport:
+    """Outcome of an import: counts plus the first MAX_REPORTED_ERRORS row errors."""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, field, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'field': field, 'message': message})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def normalize_header(name):
+    return re.sub(r'[^a-z0-9]+', '_', str(name or '').strip().lower()).strip('_')
+
+
+def normalize_phone(value):
+    value = re.sub(r'[\s\-()]', '', value)
+    for pattern, replacement in PHONE_FORMS:
+        value = pattern.sub(replacement, value)
+    return value
+
+
+def _choice_lookup(choices):
+    lookup = {}
+    for value, label in choices:
+        lookup[value.lower()] = value
+        lookup[label.lower()] = value
+    return lookup
+
+
+CHOICE_LOOKUPS = {field: _choice_lookup(choices) for field, choices in CHOICES.items()}
+
+MAX_LENGTHS = {
+    field.name: field.max_length
+    for field in Customer._meta.get_fields()
+    if getattr(field, 'max_length', None)
+}
+
+
+def iter_csv(file):
+    """
+    Yield rows of a CSV file as lists of strings, header first.
+
+    Raises CustomerImportError if the file is not UTF-8 text or not CSV.
+    """
+    if isinstance(file, io.TextIOBase):
+        text = file
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    except UnicodeDecodeError:
+        raise CustomerImportError('The file is not UTF-8 encoded text')
+    except csv.Error as exc:
+        raise CustomerImportError(f'The file is not valid CSV: {exc}')
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Phone numbers stored as numbers come back as floats.
+        return str(int(value))
+    return str(value)
+
+
+def iter_xlsx(file):
+    """
+    Yield rows of the first worksheet of an XLSX file, header first.
+
+    Raises CustomerImportError if the file is not a readable workbook.
+    """
+    if openpyxl is None:
+        raise CustomerImportError('XLSX import requires openpyxl')
+    # openpyxl reports damaged workbooks with whatever its zip and XML
+    # readers raise.
+    unreadable = (zipfile.BadZipFile, InvalidFileException, ParseError, KeyError, IndexError, OSError, ValueError)
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except unreadable:
+        raise CustomerImportError('The file is not a readable XLSX workbook')
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [_cell_text(value) for value in row]
+    except unreadable:
+        raise CustomerImportError('The file is not a readable XLSX workbook')
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, filename):
+    if filename.lower().endswith('.xlsx'):
+        return iter_xlsx(file)
+    if filename.lower().endswith('.csv'):
+        return iter_csv(file)
+    raise CustomerImportError('Only .csv and .xlsx files can be imported')
+
+
+def _clean_chunk(rows, columns, report):
+    """
+    Validate a chunk of ``(row_number, values)`` pairs.
+
+    Returns ``{email: (row_number, fields)}`` for the rows that passed; the
+    first occurrence wins when an email repeats within the chunk.
+    """
+    valid = {}
+    for row_number, values in rows:
+        fields = {
+            column: (values[index] if index < len(values) else '').strip()
+            for index, column in columns
+        }
+        error = None
+
+        for column in REQUIRED_COLUMNS:
+            if not fields.get(column):
+                error = (column, 'This field is required.')
+                break
+
+        if error is None:
+            fields['email'] = fields['email'].lower()
+            fields['phone'] = normalize_phone(fields['phone'])
+            try:
+                validate_email(fields['email'])
+            except ValidationError:
+                error = ('email', 'Enter a valid email address.')
+            else:
+                if not PHONE_RE.match(fields['phone']):
+                    error = ('phone', 'Phone number must be in format +254XXXXXXXXX')
+
+        if error is None:
+            for column, lookup in CHOICE_LOOKUPS.items():
+                if fields.get(column):
+                    value = lookup.get(fields[column].lower())
+                    if value is None:
+                        error = (column, f"'{fields[column]}' is not a valid choice.")
+                        break
+                    fields[column] = value
+                else:
+                    fields.pop(column, None)
+
+        if error is None:
+            for column, value in fields.items():
+                if column in MAX_LENGTHS and len(value) > MAX_LENGTHS[column]:
+                    error = (column, f'Ensure this value has at most {MAX_LENGTHS[column]} characters.')
+                    break
+
+        if error is None and fields['email'] in valid:
+            error = ('email', 'Duplicate email in file.')
+
+        if error is not None:
+            report.add_error(row_number, *error)
+        else:
+            valid[fields['email']] = (row_number, fields)
+    return valid
+
+
+def _insert(user, customers, report):
+    """Insert a chunk, falling back to row-by-row inserts if it conflicts."""
+    try:
+        with transaction.atomic():
+            Customer.objects.bulk_create(customers)
+            customers_bulk_created.send(sender=Customer, user_id=user.pk, customers=customers)
+        report.created += len(customers)
+        return
+    except IntegrityError:
+        # A concurrent writer took one of the emails or IDs after the checks.
+        pass
+
+    for customer in customers:
+        try:
+            with transaction.atomic():
+                customer.customer_id = generate_customer_ids(1)[0]
+                Customer.objects.bulk_create([customer])
+                customers_bulk_created.send(sender=Customer, user_id=user.pk, customers=[customer])
+            report.created += 1
+        except IntegrityError:
+            report.add_error(customer._import_row, 'email', 'A customer with this email already exists.')
+
+
+def import_customers(user, file, filename, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Import customers for ``user`` from a CSV or XLSX ``file``.
+
+    ``progress`` is called with the report after every chunk. Returns the
+    ImportReport. Raises CustomerImportError if the file has the wrong type
+    or lacks a required column.
+    """
+    rows = iter_rows(file, filename)
+    header = [normalize_header(name) for name in next(rows, [])]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise CustomerImportError(f"Missing required columns: {', '.join(missing)}")
+    known = set(REQUIRED_COLUMNS + OPTIONAL_COLUMNS)
+    columns = [(index, name) for index, name in enumerate(header) if name in known]
+
+    report = ImportReport()
+    # Row numbers count the header as row 1, like a spreadsheet.
+    numbered = ((number, values) for number, values in enumerate(rows, start=2) if any(values))
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        report.rows += len(chunk)
+
+        valid = _clean_chunk(chunk, columns, report)
+        # Emails in the file are lowercased; stored ones may not be.
+        existing = set(
+            Customer.objects.annotate(email_lower=Lower('email')).filter(
+                email_lower__in=list(valid)
+            ).order_by().values_list('email_lower', flat=True)
+        )
+        for email in existing:
+            report.add_error(valid.pop(email)[0], 'email', 'A customer with this email already exists.')
+
+        customer_ids = generate_customer_ids(len(valid))
+        customers = []
+        for (row_number, fields), customer_id in zip(valid.values(), customer_ids):
+            customer = Customer(user=user, customer_id=customer_id, **fields)
+            customer._import_row = row_number
+            customers.append(customer)
+        if customers:
+            _insert(user, customers, report)
+
+        if progress is not None:
+            progress(report)
+    return report
@@ -0,0 +1,35 @@
+"""
+Detect likely duplicate customers and store them for review.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from customers.dedupe import find_duplicates, DEFAULT_THRESHOLD, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Score customers sharing a phone, email local part or name sound and record likely duplicates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', help='Username to check (repeatable; default all users).')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Lowest score recorded, 0 to 1.')
+        parser.add_argument('--workers', type=int, default=None, help='Scoring processes (default: one per CPU).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Pairs scored per worker task.')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(customers__isnull=False).distinct()
+        if options['users']:
+            users = User.objects.filter(username__in=options['users'])
+            missing = set(options['users']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown user '{sorted(missing)[0]}'")
+
+        for user in users:
+            stored = find_duplicates(
+                user,
+                threshold=options['threshold'],
+                workers=options['workers'],
+                batch_size=max(1, options['batch_size'])
+            )
+            self.stdout.write(f'{user.username}: {stored} candidate pairs')
+        self.stdout.write(self.style.SUCCESS('Duplicate detection finished.'))
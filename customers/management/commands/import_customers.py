@@ -0,0 +1,41 @@
+"""
+Import customers from a CSV or XLSX file.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from customers.importer import import_customers, CustomerImportError, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Bulk import customers for a user from a CSV or XLSX file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file to import.')
+        parser.add_argument('--user', required=True, help='Username that will own the customers.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows validated and inserted per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user '{options['user']}'")
+
+        def progress(report):
+            self.stdout.write(f'{report.rows} rows read, {report.created} created, {report.failed} failed')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                report = import_customers(
+                    user, file, options['path'],
+                    chunk_size=max(1, options['chunk_size']),
+                    progress=progress
+                )
+        except (OSError, CustomerImportError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report.errors:
+            self.stderr.write(f"Row {error['row']} ({error['field']}): {error['message']}")
+        if report.failed > len(report.errors):
+            self.stderr.write(f'... and {report.failed - len(report.errors)} more errors')
+        self.stdout.write(self.style.SUCCESS(f'Imported {report.created} of {report.rows} customers.'))
@@ -0,0 +1,26 @@
+"""
+Announce follow-ups as they fall due.
+"""
+from django.core.management.base import BaseCommand
+
+from customers.followups import FollowUpScheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the follow-up scheduler, sleeping until the next follow-up is due.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Announce what is due now and exit.')
+
+    def handle(self, *args, **options):
+        scheduler = FollowUpScheduler()
+        if options['once']:
+            scheduler.run_once()
+            self.stdout.write(self.style.SUCCESS('Due follow-ups announced.'))
+            return
+
+        self.stdout.write('Follow-up scheduler running; press Ctrl+C to stop.')
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            scheduler.stop()
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at'], name='customers_c_created_1ed0f4_idx'),
+        ),
+    ]
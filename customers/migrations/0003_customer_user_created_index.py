@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_rollup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='customers_c_user_id_2d13ec_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:35
+
+from django.db import migrations, models
+
+
+FIRST_NUMBER = 1000000
+
+
+def seed_customer_id_sequence(apps, schema_editor):
+    """Start the customer_id sequence above every existing numeric customer ID."""
+    Customer = apps.get_model('customers', 'Customer')
+    IdSequence = apps.get_model('customers', 'IdSequence')
+    highest = FIRST_NUMBER - 1
+    for customer_id in Customer.objects.filter(customer_id__startswith='CUS').values_list('customer_id', flat=True).iterator():
+        suffix = customer_id[3:]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    IdSequence.objects.update_or_create(name='customer_id', defaults={'next_value': highest + 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_customer_user_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'ID Sequence',
+                'verbose_name_plural': 'ID Sequences',
+            },
+        ),
+        migrations.RunPython(seed_customer_id_sequence, migrations.RunPython.noop),
+    ]
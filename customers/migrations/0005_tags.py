@@ -0,0 +1,89 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from itertools import islice
+
+
+BATCH_SIZE = 1000
+
+
+def split_customer_tags(apps, schema_editor):
+    """Create Tag and CustomerTag rows from the comma-separated Customer.tags values."""
+    Customer = apps.get_model('customers', 'Customer')
+    Tag = apps.get_model('customers', 'Tag')
+    CustomerTag = apps.get_model('customers', 'CustomerTag')
+    tag_ids = {}
+    rows = (
+        Customer.objects.exclude(tags='').order_by()
+        .values_list('pk', 'user_id', 'tags').iterator(chunk_size=BATCH_SIZE)
+    )
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        links = []
+        for pk, user_id, tags in batch:
+            names = {' '.join(tag.split()).lower()[:100] for tag in tags.split(',')}
+            for name in names - {''}:
+                key = (user_id, name)
+                if key not in tag_ids:
+                    tag_ids[key] = Tag.objects.get_or_create(user_id=user_id, name=name)[0].pk
+                links.append(CustomerTag(customer_id=pk, tag_id=tag_ids[key]))
+        CustomerTag.objects.bulk_create(links, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customers', '0004_idsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customer_tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Tag',
+                'verbose_name_plural': 'Tags',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tag_links', to='customers.customer')),
+                ('tag', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='customer_links', to='customers.tag')),
+            ],
+            options={
+                'verbose_name': 'Customer Tag',
+                'verbose_name_plural': 'Customer Tags',
+            },
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='customers', through='customers.CustomerTag', to='customers.tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_customer_tag_name'),
+        ),
+        migrations.AddIndex(
+            model_name='customertag',
+            index=models.Index(fields=['customer', 'tag'], name='customers_c_custome_531913_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='customertag',
+            constraint=models.UniqueConstraint(fields=('tag', 'customer'), name='unique_customer_tag'),
+        ),
+        migrations.RunPython(split_customer_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customers', '0005_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('reasons', models.CharField(blank=True, max_length=200)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('dismissed', 'Dismissed')], default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('customer_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='customers.customer')),
+                ('customer_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='customers.customer')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_candidates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Duplicate Candidate',
+                'verbose_name_plural': 'Duplicate Candidates',
+                'indexes': [models.Index(fields=['user', 'status', 'score'], name='customers_d_user_id_87f998_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='duplicatecandidate',
+            constraint=models.UniqueConstraint(fields=('customer_a', 'customer_b'), name='unique_duplicate_pair'),
+        ),
+    ]
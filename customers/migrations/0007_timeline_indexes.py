@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0006_duplicatecandidate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customerinteraction',
+            index=models.Index(fields=['customer', 'interaction_date', 'id'], name='customers_c_custome_65bb93_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customernote',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='customers_c_custome_903491_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0007_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerinteraction',
+            name='follow_up_notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='customerinteraction',
+            index=models.Index(condition=models.Q(('follow_up_required', True)), fields=['user', 'follow_up_date', 'id'], name='interaction_follow_up_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerinteraction',
+            index=models.Index(condition=models.Q(('follow_up_notified_at__isnull', True), ('follow_up_required', True)), fields=['follow_up_date', 'id'], name='interaction_follow_up_next_idx'),
+        ),
+    ]
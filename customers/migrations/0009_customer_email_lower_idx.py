@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:18
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0008_follow_up_queue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='customer_email_lower_idx'),
+        ),
+    ]
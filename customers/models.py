@@ -2,6 +2,7 @@
 Customer models for DataLinkCRM.
 """
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 import uuid
@@ -60,6 +61,7 @@ class Customer(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     notes = models.TextField(blank=True)
     tags = models.CharField(max_length=500, blank=True, help_text='Comma-separated tags')
+    tag_set = models.ManyToManyField('Tag', through='CustomerTag', related_name='customers', blank=True)
     is_primary_contact = models.BooleanField(default=False)
     
     # Metadata
@@ -76,6 +78,10 @@ class Customer(models.Model):
             models.Index(fields=['phone']),
             models.Index(fields=['status']),
             models.Index(fields=['customer_type']),
+            models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'created_at', 'id']),
+            # Case-insensitive email lookups (see customers.importer).
+            models.Index(Lower('email'), name='customer_email_lower_idx'),
         ]
     
     def __str__(self):
@@ -93,11 +99,87 @@ class Customer(models.Model):
     def save(self, *args, **kwargs):
         if not self.customer_id:
             # Generate customer ID
-            import random
-            import string
-            self.customer_id = f"CUS{random.randint(100000, 999999)}"
+            from .identifiers import generate_customer_ids
+            self.customer_id = generate_customer_ids(1)[0]
         super().save(*args, **kwargs)
 
+class Tag(models.Model):
+    """A customer tag, normalized to lower case; the index behind tag filters."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='customer_tags')
+    name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Tag'
+        verbose_name_plural = 'Tags'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='unique_customer_tag_name'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+class CustomerTag(models.Model):
+    """Links a customer to a Tag; kept in step with ``Customer.tags``."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='tag_links', db_index=False)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='customer_links', db_index=False)
+    
+    class Meta:
+        verbose_name = 'Customer Tag'
+        verbose_name_plural = 'Customer Tags'
+        constraints = [
+            # Also the index that answers "customers tagged X".
+            models.UniqueConstraint(fields=['tag', 'customer'], name='unique_customer_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['customer', 'tag']),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer_id}: {self.tag_id}"
+
+class DuplicateCandidate(models.Model):
+    """A pair of customers that the dedupe job scored as likely the same person."""
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('dismissed', 'Dismissed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='duplicate_candidates')
+    customer_a = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='+')
+    customer_b = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    reasons = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Duplicate Candidate'
+        verbose_name_plural = 'Duplicate Candidates'
+        constraints = [
+            models.UniqueConstraint(fields=['customer_a', 'customer_b'], name='unique_duplicate_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'status', 'score']),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer_a_id} ~ {self.customer_b_id} ({self.score:.2f})"
+
+class IdSequence(models.Model):
+    """Named counter that identifier allocators reserve blocks of numbers from."""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField()
+    
+    class Meta:
+        verbose_name = 'ID Sequence'
+        verbose_name_plural = 'ID Sequences'
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
 class CustomerNote(models.Model):
     """Customer notes."""
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='customer_notes')
@@ -111,6 +193,9 @@ class CustomerNote(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Customer Note'
         verbose_name_plural = 'Customer Notes'
+        indexes = [
+            models.Index(fields=['customer', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Note for {self.customer.name} by {self.user.username}"
@@ -136,12 +221,28 @@ class CustomerInteraction(models.Model):
     outcome = models.CharField(max_length=100, blank=True)
     follow_up_required = models.BooleanField(default=False)
     follow_up_date = models.DateTimeField(null=True, blank=True)
+    follow_up_notified_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-interaction_date']
         verbose_name = 'Customer Interaction'
         verbose_name_plural = 'Customer Interactions'
+        indexes = [
+            models.Index(fields=['customer', 'interaction_date', 'id']),
+            # The due queue of each user; only open follow-ups are indexed.
+            models.Index(
+                fields=['user', 'follow_up_date', 'id'],
+                condition=models.Q(follow_up_required=True),
+                name='interaction_follow_up_due_idx'
+            ),
+            # Follow-ups the scheduler has yet to announce, soonest first.
+            models.Index(
+                fields=['follow_up_date', 'id'],
+                condition=models.Q(follow_up_required=True, follow_up_notified_at__isnull=True),
+                name='interaction_follow_up_next_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.customer.name} - {self.get_interaction_type_display()}"
@@ -0,0 +1,55 @@
+"""
+Customer signals for DataLinkCRM.
+Keep the in-process typeahead indexes and the tag index in step with
+Customer writes, and tell a running follow-up scheduler about new
+follow-ups.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal
+
+from .followups import follow_up_changed
+from .models import Customer, CustomerInteraction
+from .tags import sync_customer_tags
+from .typeahead import customer_changed, invalidate
+
+# Sent with ``user_id`` and ``customers`` after customers are inserted with
+# bulk_create, which skips post_save; receivers update derived data in bulk.
+customers_bulk_created = Signal()
+
+
+def customer_saved(sender, instance, **kwargs):
+    customer_changed(instance)
+
+
+def customer_deleted(sender, instance, **kwargs):
+    customer_changed(instance, deleted=True)
+
+
+def customers_imported(sender, user_id, customers, **kwargs):
+    invalidate(user_id)
+
+
+def customer_tags_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields and 'tags' not in update_fields:
+        return
+    if created and not instance.tags:
+        return
+    sync_customer_tags([instance], created=created)
+
+
+def customers_imported_tags(sender, user_id, customers, **kwargs):
+    sync_customer_tags(customers, created=True)
+
+
+def interaction_saved(sender, instance, **kwargs):
+    if instance.follow_up_required and instance.follow_up_date and instance.follow_up_notified_at is None:
+        transaction.on_commit(lambda: follow_up_changed(instance.pk, instance.follow_up_date))
+
+
+post_save.connect(customer_saved, sender=Customer, dispatch_uid='customers-typeahead')
+post_delete.connect(customer_deleted, sender=Customer, dispatch_uid='customers-typeahead')
+customers_bulk_created.connect(customers_imported, dispatch_uid='customers-typeahead')
+post_save.connect(customer_tags_saved, sender=Customer, dispatch_uid='customers-tags')
+customers_bulk_created.connect(customers_imported_tags, dispatch_uid='customers-tags')
+post_save.connect(interaction_saved, sender=CustomerInteraction, dispatch_uid='customers-follow-ups')
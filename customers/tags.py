@@ -0,0 +1,283 @@
+"""
+Customer tag index for DataLinkCRM.
+
+``Customer.tags`` stays the editable comma-separated field; every write is
+mirrored into Tag and CustomerTag rows (see customers.signals) so tag
+filters are answered from the (tag, customer) index instead of a LIKE scan
+over the text.
+
+Tag queries are boolean expressions over tag names::
+
+    vip AND (nairobi OR mombasa) AND NOT "payment overdue"
+
+Adjacent terms are ANDed, a comma means OR and names with spaces are
+quoted. Each term becomes an ``id IN (SELECT customer_id ...)`` subquery on
+the link table, so an expression costs one index range per tag.
+"""
+import re
+from collections import defaultdict
+from itertools import islice
+
+from django.db.models import Count, Q
+
+from .models import CustomerTag, Tag
+
+MAX_TAG_LENGTH = 100
+
+# Longest tag expression accepted, in tags.
+MAX_QUERY_TERMS = 20
+
+# Longest tag expression accepted, in words, operators and parentheses.
+MAX_QUERY_TOKENS = 200
+
+# Deepest nesting of NOTs and parentheses accepted; the parser recurses once per level.
+MAX_QUERY_DEPTH = 20
+
+TOKEN_RE = re.compile(r'\s*(?:([(),])|"([^"]*)"|([^\s(),"]+))')
+
+BARE_TAG_RE = re.compile(r'[^\s(),"]+')
+
+OPERATORS = {'and', 'or', 'not'}
+
+
+class TagQueryError(ValueError):
+    """Raised for a tag expression that cannot be parsed."""
+
+
+def normalize_tag(tag):
+    """Return ``tag`` lower-cased with runs of whitespace collapsed."""
+    return ' '.join(tag.split()).lower()[:MAX_TAG_LENGTH]
+
+
+def split_tags(value):
+    """Return the distinct normalized tags of a comma-separated value, in order."""
+    names = {}
+    for tag in (value or '').split(','):
+        name = normalize_tag(tag)
+        if name:
+            names[name] = None
+    return list(names)
+
+
+def format_tag(name):
+    """Return ``name`` as a term of a tag expression, quoted if needed."""
+    if BARE_TAG_RE.fullmatch(name) and name not in OPERATORS:
+        return name
+    return f'"{name}"'
+
+
+def _tag_ids(user_id, names):
+    """Return ``{name: tag id}`` for ``names``, creating the missing tags."""
+    ids = dict(Tag.objects.filter(user_id=user_id, name__in=names).values_list('name', 'id'))
+    missing = [name for name in names if name not in ids]
+    if missing:
+        Tag.objects.bulk_create([Tag(user_id=user_id, name=name) for name in missing], ignore_conflicts=True)
+        ids.update(Tag.objects.filter(user_id=user_id, name__in=missing).values_list('name', 'id'))
+    return ids
+
+
+def sync_customer_tags(customers, created=False):
+    """
+    Bring the CustomerTag rows of ``customers`` in line with their ``tags`` field.
+
+    Pass ``created=True`` for customers that were just inserted and so have
+    no links yet; that skips reading and deleting existing links.
+    """
+    by_user = defaultdict(dict)
+    for customer in customers:
+        by_user[customer.user_id][customer.pk] = split_tags(customer.tags)
+
+    for user_id, wanted in by_user.items():
+        names = {name for tags in wanted.values() for name in tags}
+        ids = _tag_ids(user_id, sorted(names)) if names else {}
+        wanted = {pk: {ids[name] for name in tags} for pk, tags in wanted.items()}
+
+        existing = defaultdict(set)
+        if not created:
+            links = CustomerTag.objects.filter(customer_id__in=list(wanted)).values_list('id', 'customer_id', 'tag_id')
+            stale = []
+            for link_id, customer_id, tag_id in links:
+                if tag_id in wanted[customer_id]:
+                    existing[customer_id].add(tag_id)
+                else:
+                    stale.append(link_id)
+            if stale:
+                CustomerTag.objects.filter(id__in=stale).delete()
+
+        CustomerTag.objects.bulk_create([
+            CustomerTag(customer_id=pk, tag_id=tag_id)
+            for pk, tag_ids in wanted.items()
+            for tag_id in tag_ids - existing[pk]
+        ], ignore_conflicts=True)
+
+
+def _tokens(expression):
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN_RE.match(expression, position)
+        if match is None or match.end() == position:
+            raise TagQueryError(f'Unexpected character at position {position + 1}')
+        position = match.end()
+        symbol, quoted, word = match.groups()
+        if symbol:
+            yield (symbol, None)
+        elif quoted is not None:
+            yield ('tag', normalize_tag(quoted))
+        elif word.lower() in OPERATORS:
+            yield (word.lower(), None)
+        else:
+            yield ('tag', normalize_tag(word))
+
+
+class _Parser:
+    """
+    Recursive descent parser for tag expressions.
+
+    Builds a tree of ``('tag', name)``, ``('not', node)``, ``('and', nodes)``
+    and ``('or', nodes)`` tuples; NOT binds tightest, then AND, then OR.
+    """
+
+    def __init__(self, expression):
+        self.tokens = list(islice(_tokens(expression), MAX_QUERY_TOKENS + 1))
+        if len(self.tokens) > MAX_QUERY_TOKENS:
+            raise TagQueryError(f'Tag expressions may be at most {MAX_QUERY_TOKENS} words long')
+        self.position = 0
+        self.depth = 0
+        self.names = set()
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def descend(self):
+        self.depth += 1
+        if self.depth > MAX_QUERY_DEPTH:
+            raise TagQueryError(f'Tag expressions may nest at most {MAX_QUERY_DEPTH} levels deep')
+
+    def parse(self):
+        if not self.tokens:
+            raise TagQueryError('Empty tag expression')
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise TagQueryError(f"Unexpected '{self.take()[0]}'")
+        if len(self.names) > MAX_QUERY_TERMS:
+            raise TagQueryError(f'Tag expressions may use at most {MAX_QUERY_TERMS} tags')
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() in ('or', ','):
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() in ('and', 'not', 'tag', '('):
+            if self.peek() == 'and':
+                self.take()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_not(self):
+        if self.peek() == 'not':
+            self.take()
+            self.descend()
+            node = ('not', self.parse_not())
+            self.depth -= 1
+            return node
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind = self.peek()
+        if kind is None:
+            raise TagQueryError('Tag expression ends unexpectedly')
+        token, value = self.take()
+        if token == '(':
+            self.descend()
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise TagQueryError("Missing ')'")
+            self.take()
+            self.depth -= 1
+            return node
+        if token == 'tag' and value:
+            self.names.add(value)
+            return ('tag', value)
+        raise TagQueryError(f"Unexpected '{token}'")
+
+
+def parse_tag_query(expression):
+    """Parse a tag expression; returns ``(tree, names)``. Raises TagQueryError."""
+    parser = _Parser(expression)
+    return parser.parse(), parser.names
+
+
+def tree_matches(node, names):
+    """Evaluate a parsed tag expression against one customer's set of tag names."""
+    kind, value = node
+    if kind == 'tag':
+        return value in names
+    if kind == 'not':
+        return not tree_matches(value, names)
+    if kind == 'and':
+        return all(tree_matches(child, names) for child in value)
+    return any(tree_matches(child, names) for child in value)
+
+
+def _compile(node, tag_ids):
+    kind, value = node
+    if kind == 'tag':
+        if not tag_ids.get(value):
+            # No customer carries a tag that does not exist.
+            return Q(pk__in=[])
+        return Q(pk__in=CustomerTag.objects.filter(tag_id__in=tag_ids[value]).values('customer_id'))
+    if kind == 'not':
+        return ~_compile(value, tag_ids)
+    combined = _compile(value[0], tag_ids)
+    for child in value[1:]:
+        if kind == 'and':
+            combined &= _compile(child, tag_ids)
+        else:
+            combined |= _compile(child, tag_ids)
+    return combined
+
+
+def tag_query(expression, user_id=None):
+    """
+    Return a Q selecting the customers that match a tag expression.
+
+    Tag names are resolved to ids up front, among ``user_id``'s tags when
+    given; combine the Q with a queryset already limited to one owner either
+    way. Raises TagQueryError if the expression is malformed.
+    """
+    tree, names = parse_tag_query(expression)
+    tags = Tag.objects.filter(name__in=names)
+    if user_id is not None:
+        tags = tags.filter(user_id=user_id)
+    tag_ids = defaultdict(list)
+    for name, tag_id in tags.values_list('name', 'id'):
+        tag_ids[name].append(tag_id)
+    return _compile(tree, tag_ids)
+
+
+def tag_facets(queryset, limit=20):
+    """
+    Return ``[{'name': ..., 'count': ...}]`` for the most used tags among ``queryset``.
+
+    Counted in one grouped query over the link table.
+    """
+    rows = (
+        CustomerTag.objects.filter(customer_id__in=queryset.order_by().values('pk'))
+        .values('tag__name')
+        .annotate(count=Count('customer_id'))
+        .order_by('-count', 'tag__name')[:limit]
+    )
+    return [{'name': row['tag__name'], 'count': row['count']} for row in rows]
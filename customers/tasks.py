@@ -0,0 +1,17 @@
+"""
+Background tasks for the customers app.
+Celery is optional; without it these are plain functions.
+"""
+try:
+    from celery import shared_task
+except ImportError:
+    def shared_task(func=None, **kwargs):
+        return func if func is not None else (lambda f: f)
+
+from .followups import FollowUpScheduler
+
+
+@shared_task(name='customers.announce_due_follow_ups')
+def announce_due_follow_ups_task():
+    """Announce due follow-ups once, for deployments that schedule it periodically instead of running the scheduler."""
+    FollowUpScheduler().run_once()
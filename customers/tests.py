@@ -1,3 +1,497 @@
-from django.test import TestCase
+"""
+Tests for the customers app.
+"""
+import datetime
+import io
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import typeahead, views
+from .dedupe import email_local_part, find_duplicates, merge_customers, normalize_phone as phone_key, soundex
+from .followups import FollowUpScheduler, complete_follow_up, due_queue, notify_due, reschedule_follow_up
+from .identifiers import FIRST_NUMBER, BlockAllocator, generate_customer_ids, reserve_numbers
+from .importer import CustomerImportError, import_customers, normalize_phone
+from .models import Customer, CustomerInteraction, CustomerNote, CustomerTag, DuplicateCandidate, IdSequence
+from .tags import MAX_QUERY_DEPTH, TagQueryError, parse_tag_query, split_tags, tag_query, tree_matches
+from .timeline import timeline_page
+from core.pagination import InvalidCursor, encode_cursor, keyset_page
+from dashboard.models import Notification
+from payments.models import Payment
+from segments.definitions import clean_definition
+from segments.membership import refresh_segment
+from segments.models import Segment, SegmentMembership
+
+# Customer writes also touch the typeahead and dashboard caches; keep them in memory instead of Redis.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_customers(user, tags, prefix='customer'):
+    """Create one customer of ``user`` per entry of ``tags`` (comma-separated tags)."""
+    return [
+        Customer.objects.create(
+            user=user,
+            first_name=prefix.title(),
+            last_name=str(index),
+            email=f'{prefix}{index}@example.com',
+            phone=f'+254700{index:06d}',
+            tags=value,
+        )
+        for index, value in enumerate(tags)
+    ]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CustomerListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lister')
+        create_customers(self.user, ['vip, nairobi'] * 20 + ['vip'] * 10)
+        self.factory = RequestFactory()
+
+    def get(self, view, **params):
+        request = self.factory.get('/customers/', params)
+        request.user = self.user
+        return view(request)
+
+    def test_facets_are_counted_on_the_first_page_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            content = self.get(views.index).content.decode()
+        self.assertIn('nairobi <span class="text-muted">20</span>', content)
+        self.assertTrue(any('GROUP BY' in query['sql'] for query in queries.captured_queries))
+
+        _, cursor = keyset_page(Customer.objects.filter(user=self.user), views.LIST_ORDERING, limit=views.PAGE_SIZE)
+        with CaptureQueriesContext(connection) as queries:
+            content = self.get(views.index, cursor=cursor).content.decode()
+        self.assertNotIn('nairobi <span class="text-muted">', content)
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in queries.captured_queries))
+
+    def test_tag_search_returns_facets_with_the_first_page(self):
+        data = json.loads(self.get(views.tag_search, tags='vip and not nairobi', limit=4).content)
+        self.assertEqual(data['facets'], [{'name': 'vip', 'count': 10}])
+        following = json.loads(
+            self.get(views.tag_search, tags='vip and not nairobi', limit=4, cursor=data['next_cursor']).content
+        )
+        self.assertIsNone(following['facets'])
+        self.assertEqual(len(following['results']), 4)
+
+    def test_bad_input_is_rejected(self):
+        self.assertEqual(self.get(views.index, cursor='nonsense').status_code, 400)
+        self.assertEqual(self.get(views.index, tags='vip and (').status_code, 400)
+        self.assertEqual(self.get(views.tag_search, tags='not ' * 500 + 'vip').status_code, 400)
+
+
+class NormalizePhoneTests(SimpleTestCase):
+    def test_local_and_international_forms(self):
+        for value in ['0712345678', '254712345678', '+254 712 345 678', '(0712) 345-678']:
+            with self.subTest(value=value):
+                self.assertEqual(normalize_phone(value), '+254712345678')
+
+    def test_other_numbers_are_left_alone(self):
+        self.assertEqual(normalize_phone('0612345678'), '0612345678')
+        self.assertEqual(normalize_phone('+1 555 0100'), '+15550100')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer')
+
+    def import_csv(self, text, **kwargs):
+        return import_customers(self.user, io.BytesIO(text.encode()), 'customers.csv', **kwargs)
+
+    def test_valid_rows_are_created_and_announced(self):
+        report = self.import_csv(
+            'First Name,Last Name,Email,Phone,Tags,Customer Type\n'
+            'Achieng,Odhiambo,Achieng@Example.com,0722000001,"vip, nairobi",Business\n'
+            'Baraka,Mwangi,baraka@example.com,254722000002,,\n',
+            chunk_size=1,
+        )
+        self.assertEqual((report.rows, report.created, report.failed), (2, 2, 0))
+        customer = Customer.objects.get(email='achieng@example.com')
+        self.assertEqual(customer.phone, '+254722000001')
+        self.assertEqual(customer.customer_type, 'business')
+        # bulk_create skips post_save; the tag index is filled from customers_bulk_created.
+        self.assertEqual(
+            sorted(CustomerTag.objects.filter(customer=customer).values_list('tag__name', flat=True)),
+            ['nairobi', 'vip'],
+        )
+
+    def test_row_errors_are_reported(self):
+        create_customers(self.user, [''], prefix='taken')
+        report = self.import_csv(
+            'first_name,last_name,email,phone\n'
+            'Taken,Again,TAKEN0@example.com,0722000001\n'
+            'No,Phone,nophone@example.com,\n'
+            'Bad,Phone,badphone@example.com,12345\n'
+            'First,Copy,copy@example.com,0722000002\n'
+            'Second,Copy,Copy@example.com,0722000003\n'
+        )
+        self.assertEqual((report.rows, report.created, report.failed), (5, 1, 4))
+        self.assertEqual(
+            [(error['row'], error['field']) for error in report.errors],
+            [(3, 'phone'), (4, 'phone'), (6, 'email'), (2, 'email')],
+        )
+        self.assertEqual(Customer.objects.get(email='copy@example.com').first_name, 'First')
+
+    def test_unreadable_files_are_rejected(self):
+        for content, filename in [
+            ('first_name,last_name,email,phone\nJos\xe9,K,j@example.com,0722000001\n'.encode('latin-1'),
+             'customers.csv'),
+            (b'PK\x03\x04 not really a workbook', 'customers.xlsx'),
+            (b'first_name,last_name\n', 'customers.csv'),
+            (b'', 'customers.txt'),
+        ]:
+            with self.subTest(filename=filename), self.assertRaises(CustomerImportError):
+                import_customers(self.user, io.BytesIO(content), filename)
+        self.assertFalse(Customer.objects.exists())
+
+
+class TagQueryParseTests(SimpleTestCase):
+    def test_precedence_and_quoting(self):
+        tree, names = parse_tag_query('VIP nairobi, "Payment  Overdue" and not (mombasa or lead)')
+        self.assertEqual(tree, ('or', [
+            ('and', [('tag', 'vip'), ('tag', 'nairobi')]),
+            ('and', [('tag', 'payment overdue'), ('not', ('or', [('tag', 'mombasa'), ('tag', 'lead')]))]),
+        ]))
+        self.assertEqual(names, {'vip', 'nairobi', 'payment overdue', 'mombasa', 'lead'})
+
+    def test_tree_matches(self):
+        tree, _ = parse_tag_query('vip and not (mombasa, lead)')
+        self.assertTrue(tree_matches(tree, {'vip', 'nairobi'}))
+        self.assertFalse(tree_matches(tree, {'vip', 'lead'}))
+        self.assertFalse(tree_matches(tree, {'nairobi'}))
+
+    def test_malformed_expressions_are_rejected(self):
+        for expression in ['', 'vip and', '(vip', 'vip)', 'not', '"vip']:
+            with self.subTest(expression=expression), self.assertRaises(TagQueryError):
+                parse_tag_query(expression)
+
+    def test_long_and_deep_expressions_are_rejected(self):
+        depth = MAX_QUERY_DEPTH + 1
+        for expression in ['not ' * 2000 + 'vip', 'not ' * depth + 'vip', '(' * depth + 'vip' + ')' * depth]:
+            with self.subTest(expression=expression[:20]), self.assertRaises(TagQueryError):
+                parse_tag_query(expression)
+        self.assertEqual(parse_tag_query('not ' * 2 + 'vip')[0], ('not', ('not', ('tag', 'vip'))))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TagQueryTests(TestCase):
+    def test_query_agrees_with_tree_matches(self):
+        user = User.objects.create_user('tagger')
+        values = ['vip, nairobi', 'vip', 'nairobi, lead', 'Payment Overdue, vip', '', 'mombasa']
+        customers = create_customers(user, values)
+        # Another owner's tags of the same names must not leak into the query.
+        create_customers(User.objects.create_user('other'), values, prefix='other')
+        for expression in [
+            'vip', 'vip nairobi', 'vip, lead', 'not vip', 'vip and not "payment overdue"',
+            'not (nairobi or mombasa)', 'unknown', 'not unknown',
+        ]:
+            tree, _ = parse_tag_query(expression)
+            expected = {
+                customer.pk for customer in customers if tree_matches(tree, set(split_tags(customer.tags)))
+            }
+            with self.subTest(expression=expression):
+                matched = Customer.objects.filter(user=user).filter(tag_query(expression, user_id=user.pk))
+                self.assertEqual(set(matched.values_list('pk', flat=True)), expected)
+
+
+class BlockingKeyTests(SimpleTestCase):
+    def test_soundex(self):
+        for name, code in [('Robert', 'R163'), ('Rupert', 'R163'), ('Ashcraft', 'A261'), ('Lee', 'L000'), ('42', '')]:
+            with self.subTest(name=name):
+                self.assertEqual(soundex(name), code)
+
+    def test_phone_and_email_keys(self):
+        self.assertEqual(phone_key('+254 712 345 678'), phone_key('0712345678'))
+        self.assertEqual(phone_key('12345'), '')
+        self.assertEqual(email_local_part('Jane.Wanjiku+crm@example.com'), 'janewanjiku')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DuplicateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('deduper')
+
+    def create(self, first_name, last_name, email, phone, **fields):
+        return Customer.objects.create(
+            user=self.user, first_name=first_name, last_name=last_name, email=email, phone=phone, **fields
+        )
+
+    def test_find_duplicates_stores_likely_pairs(self):
+        jane = self.create('Jane', 'Wanjiku', 'jane.wanjiku@example.com', '+254712345678')
+        again = self.create('Jane', 'Wanjiku', 'janewanjiku@example.org', '+254712345678')
+        self.create('Peter', 'Otieno', 'peter@example.com', '+254733000111')
+
+        self.assertEqual(find_duplicates(self.user, workers=1), 1)
+        candidate = DuplicateCandidate.objects.get()
+        self.assertEqual({candidate.customer_a_id, candidate.customer_b_id}, {jane.pk, again.pk})
+        self.assertEqual(candidate.reasons, 'name,phone,email')
+        # Running again refreshes the pair instead of adding another.
+        self.assertEqual(find_duplicates(self.user, workers=1), 1)
+        self.assertEqual(DuplicateCandidate.objects.count(), 1)
+
+    def test_merge_moves_related_rows_and_refreshes_segments(self):
+        primary = self.create('Jane', 'Wanjiku', 'jane@example.com', '+254712345678', tags='vip')
+        duplicate = self.create(
+            'Jane', 'Wanjiku', 'jane2@example.com', '+254712345679', tags='nairobi, VIP', city='Nairobi'
+        )
+        CustomerNote.objects.create(customer=duplicate, user=self.user, note='Prefers email')
+        CustomerInteraction.objects.create(
+            customer=duplicate, user=self.user, interaction_type='call', subject='Intro', description='Called',
+            interaction_date=timezone.now()
+        )
+        Payment.objects.create(
+            user=self.user, customer=duplicate, amount=Decimal('2000.00'), status='completed', payment_method='cash',
+            reference='MERGE1'
+        )
+        segment = Segment.objects.create(
+            user=self.user, name='Paying', definition=clean_definition({'payments': {'min': '1000'}})
+        )
+        refresh_segment(segment)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            merge_customers(primary, duplicate)
+
+        self.assertFalse(Customer.objects.filter(pk=duplicate.pk).exists())
+        primary.refresh_from_db()
+        self.assertEqual((primary.tags, primary.city), ('vip, nairobi', 'Nairobi'))
+        self.assertEqual(primary.customer_notes.count(), 1)
+        self.assertEqual(primary.interactions.count(), 1)
+        self.assertEqual(primary.payments.count(), 1)
+        self.assertEqual(
+            sorted(CustomerTag.objects.filter(customer=primary).values_list('tag__name', flat=True)), ['nairobi', 'vip']
+        )
+        # The payments moved with an UPDATE; the kept customer's save re-evaluates its segments.
+        members = SegmentMembership.objects.filter(segment=segment).values_list('customer_id', flat=True)
+        self.assertEqual(list(members), [primary.pk])
+        segment.refresh_from_db()
+        self.assertEqual(segment.member_count, 1)
+
+    def test_only_customers_of_one_user_merge(self):
+        customer = self.create('Jane', 'Wanjiku', 'jane@example.com', '+254712345678')
+        stranger = Customer.objects.create(
+            user=User.objects.create_user('stranger'), first_name='Jane', last_name='Wanjiku',
+            email='jane@example.org', phone='+254712345678'
+        )
+        for duplicate in [customer, stranger]:
+            with self.subTest(duplicate=duplicate.email), self.assertRaises(ValueError):
+                merge_customers(customer, duplicate)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        typeahead._indexes.clear()
+        self.addCleanup(typeahead._indexes.clear)
+        self.user = User.objects.create_user('typer')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer = Customer.objects.create(
+                user=self.user, first_name='Zoë', last_name='Njoroge', email='zoe@example.com', phone='+254712345678'
+            )
+            create_customers(self.user, ['', ''], prefix='njeri')
+
+    def names(self, query, user=None, limit=10):
+        return sorted(result['name'] for result in typeahead.lookup((user or self.user).pk, query, limit))
+
+    def test_keys(self):
+        self.assertEqual(
+            typeahead.customer_keys('Zoë', ' Njoroge ', 'Zoe@Example.com', '+254712345678', 'CUS1000000'),
+            ['0712345678', '254712345678', 'cus1000000', 'njoroge', 'njoroge zoe', 'zoe', 'zoe njoroge',
+             'zoe@example.com'],
+        )
+
+    def test_prefix_lookups(self):
+        self.assertEqual(self.names('ZOE'), ['Zoë Njoroge'])
+        self.assertEqual(self.names('nj'), ['Njeri 0', 'Njeri 1', 'Zoë Njoroge'])
+        self.assertEqual(len(self.names('nj', limit=1)), 1)
+        self.assertEqual(self.names('0712'), ['Zoë Njoroge'])
+        self.assertEqual(self.names('+25471234'), ['Zoë Njoroge'])
+        self.assertEqual(self.names(self.customer.customer_id.lower()), ['Zoë Njoroge'])
+        self.assertEqual(self.names('  '), [])
+        self.assertEqual(self.names('zoe', user=User.objects.create_user('stranger')), [])
+
+    def test_saves_update_the_local_index_in_place(self):
+        self.names('zoe')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.last_name = 'Kamau'
+            self.customer.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('kam'), ['Zoë Kamau'])
+            self.assertEqual(self.names('njo'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('zoe'), [])
+
+    def test_changes_from_another_process_rebuild_the_index(self):
+        self.names('zoe')
+        # Another worker saved a customer: the shared version moves on without this copy.
+        Customer.objects.filter(pk=self.customer.pk).update(first_name='Wanjiru')
+        typeahead._bump_version(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names('wanj'), ['Wanjiru Njoroge'])
+
+    def test_least_recently_used_tenants_are_evicted(self):
+        others = [User.objects.create_user(f'tenant{index}') for index in range(2)]
+        with self.settings(TYPEAHEAD_MAX_TENANTS=2):
+            for user in [self.user, *others]:
+                self.names('a', user=user)
+        self.assertEqual(list(typeahead._indexes), [user.pk for user in others])
+
+
+class IdentifierTests(TestCase):
+    def test_reservations_never_overlap(self):
+        self.assertEqual(reserve_numbers(5, 'test'), FIRST_NUMBER)
+        self.assertEqual(reserve_numbers(3, 'test'), FIRST_NUMBER + 5)
+        self.assertEqual(IdSequence.objects.get(name='test').next_value, FIRST_NUMBER + 8)
+
+    def test_inside_a_transaction_only_what_is_used_is_reserved(self):
+        # Test cases run inside a transaction, so no block is kept for later.
+        allocator = BlockAllocator('test')
+        self.assertEqual(allocator.allocate(2), [FIRST_NUMBER, FIRST_NUMBER + 1])
+        self.assertEqual(allocator.allocate(1), [FIRST_NUMBER + 2])
+        ids = generate_customer_ids(3)
+        self.assertEqual(len(set(ids)), 3)
+        self.assertTrue(all(customer_id.startswith('CUS') for customer_id in ids))
+
+
+@override_settings(CUSTOMER_ID_BLOCK_SIZE=10)
+class BlockAllocatorTests(TransactionTestCase):
+    def test_numbers_come_from_one_reserved_block(self):
+        allocator = BlockAllocator('test')
+        first = allocator.allocate(3)
+        with self.assertNumQueries(0):
+            second = allocator.allocate(4)
+        self.assertEqual(first + second, list(range(FIRST_NUMBER, FIRST_NUMBER + 7)))
+
+        # Asking for more than is left uses up the block and reserves the shortfall plus a new block.
+        third = allocator.allocate(8)
+        self.assertEqual(third[:6], list(range(FIRST_NUMBER + 7, FIRST_NUMBER + 13)))
+        self.assertEqual(third[6:], [FIRST_NUMBER + 13, FIRST_NUMBER + 14])
+        self.assertEqual(IdSequence.objects.get(name='test').next_value, FIRST_NUMBER + 13 + 2 + 10)
+
+    def test_allocators_in_other_processes_get_other_numbers(self):
+        numbers = BlockAllocator('test').allocate(5) + BlockAllocator('test').allocate(5)
+        self.assertEqual(len(set(numbers)), 10)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('historian')
+        self.colleague = User.objects.create_user('colleague')
+        self.customer = create_customers(self.user, [''], prefix='history')[0]
+        start = timezone.now() - datetime.timedelta(days=1)
+        # Several events share an instant, within and across sources.
+        for index in range(6):
+            note = CustomerNote.objects.create(customer=self.customer, user=self.user, note=f'Note {index}')
+            CustomerNote.objects.filter(pk=note.pk).update(created_at=start + datetime.timedelta(minutes=index // 2))
+        for index in range(5):
+            CustomerInteraction.objects.create(
+                customer=self.customer, user=self.user, interaction_type='call', subject=f'Call {index}',
+                description='', interaction_date=start + datetime.timedelta(minutes=index)
+            )
+        for index in range(4):
+            payment = Payment.objects.create(
+                user=self.user, customer=self.customer, amount=Decimal('10.00'), payment_method='cash',
+                reference=f'HISTORY{index}'
+            )
+            Payment.objects.filter(pk=payment.pk).update(created_at=start + datetime.timedelta(minutes=2 * index))
+        CustomerNote.objects.create(customer=self.customer, user=self.colleague, note='Secret', is_private=True)
+
+    def walk(self, user, limit):
+        events, cursor = timeline_page(self.customer, user, limit=limit)
+        pages = 1
+        while cursor is not None:
+            page, cursor = timeline_page(self.customer, user, cursor=cursor, limit=limit)
+            events.extend(page)
+            pages += 1
+        return events, pages
+
+    def test_pages_merge_every_source_newest_first(self):
+        events, pages = self.walk(self.user, limit=4)
+        self.assertEqual(pages, 4)
+        self.assertEqual(len(events), 15)
+        self.assertEqual(len({(event['type'], event['id']) for event in events}), 15)
+        timestamps = [event['timestamp'] for event in events]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertNotIn('Secret', [event['body'] for event in events])
+
+    def test_private_notes_are_shown_to_their_author(self):
+        events, _ = self.walk(self.colleague, limit=20)
+        self.assertEqual(events[0]['title'], 'Private note')
+        self.assertEqual(len(events), 16)
+
+    def test_tampered_cursors_are_rejected(self):
+        for cursor in ['garbage', encode_cursor(['yesterday', 1, None, None, None, None]), encode_cursor([None])]:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                timeline_page(self.customer, self.user, cursor=cursor)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FollowUpTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('follower')
+        self.customer = create_customers(self.user, [''], prefix='followed')[0]
+        self.now = timezone.now()
+
+    def follow_up(self, minutes, user=None, required=True):
+        return CustomerInteraction.objects.create(
+            customer=self.customer, user=user or self.user, interaction_type='call', subject=f'In {minutes} minutes',
+            description='', interaction_date=self.now, follow_up_required=required,
+            follow_up_date=self.now + datetime.timedelta(minutes=minutes)
+        )
+
+    def test_due_queue_is_oldest_first(self):
+        due = [self.follow_up(minutes) for minutes in (-3000, -30, -30, -5)]
+        self.follow_up(-10, required=False)
+        self.follow_up(10)
+        self.follow_up(-10, user=User.objects.create_user('other'))
+
+        page, cursor = due_queue(self.user, until=self.now, limit=3)
+        following, last = due_queue(self.user, until=self.now, cursor=cursor, limit=3)
+        self.assertIsNone(last)
+        self.assertEqual([interaction.pk for interaction in page + following], [interaction.pk for interaction in due])
+
+        self.assertTrue(complete_follow_up(self.user, due[0].pk))
+        self.assertFalse(complete_follow_up(self.user, due[0].pk))
+        self.assertEqual(len(due_queue(self.user, until=self.now)[0]), 3)
+
+    def test_due_follow_ups_are_announced_once(self):
+        overdue, recent, later = self.follow_up(-3000), self.follow_up(-5), self.follow_up(10)
+        ids = [overdue.pk, recent.pk, later.pk]
+        self.assertEqual(notify_due(ids, now=self.now), 2)
+        self.assertEqual(notify_due(ids, now=self.now), 0)
+        self.assertEqual(
+            sorted(Notification.objects.filter(user=self.user).values_list('priority', flat=True)), ['high', 'medium']
+        )
+
+        # Rescheduling makes it due again later.
+        when = self.now + datetime.timedelta(minutes=20)
+        self.assertTrue(reschedule_follow_up(self.user, recent.pk, when))
+        self.assertEqual(notify_due(ids, now=when), 2)
+
+    def test_scheduler_sleeps_until_the_next_follow_up(self):
+        self.follow_up(-5)
+        upcoming = self.follow_up(10)
+        scheduler = FollowUpScheduler(horizon=60, max_sleep=3600)
+
+        with self.assertLogs('customers.followups', 'INFO'):
+            delay = scheduler.run_once(now=self.now)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+        self.assertAlmostEqual(delay, 600, delta=5)
+
+        pushed = self.follow_up(2)
+        scheduler.push(pushed.follow_up_date, pushed.pk)
+        self.assertTrue(scheduler.wakeup.is_set())
+        self.assertAlmostEqual(scheduler.run_once(now=self.now), 120, delta=5)
+
+        with self.assertLogs('customers.followups', 'INFO'):
+            scheduler.run_once(now=upcoming.follow_up_date)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
@@ -0,0 +1,167 @@
+"""
+Customer activity timeline for DataLinkCRM.
+
+A customer's notes, interactions and payments are merged newest first.
+Each source is read in small chunks by a seek query along its
+(customer, time, id) index, and the sources are combined with a k-way heap
+merge that only pulls the next chunk of a source when the merge reaches it,
+so a page reads about as many rows as it shows however long the history.
+
+The cursor records, for every source, the (time, id) of the last event of
+that source already shown; each source resumes from its own position.
+"""
+import heapq
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .models import CustomerInteraction, CustomerNote
+from core.pagination import InvalidCursor, decode_cursor, encode_cursor, seek_filter
+from payments.models import Payment
+
+PAGE_SIZE = 20
+
+
+def _note_event(note):
+    return {
+        'title': 'Private note' if note.is_private else 'Note',
+        'body': note.note,
+        'author': note.user.get_username(),
+    }
+
+
+def _interaction_event(interaction):
+    return {
+        'title': f"{interaction.get_interaction_type_display()}: {interaction.subject}",
+        'body': interaction.description,
+        'author': interaction.user.get_username(),
+        'outcome': interaction.outcome,
+        'follow_up_date': interaction.follow_up_date.isoformat() if interaction.follow_up_date else None,
+    }
+
+
+def _payment_event(payment):
+    return {
+        'title': f"Payment {payment.reference}",
+        'body': payment.description,
+        'amount': str(payment.amount),
+        'currency': payment.currency,
+        'status': payment.status,
+    }
+
+
+class Source:
+    """One kind of timeline event and how to seek through it."""
+
+    def __init__(self, kind, model, queryset, time_field, describe):
+        self.kind = kind
+        self.model = model
+        self.queryset = queryset
+        self.time_field = time_field
+        self.ordering = (f'-{time_field}', '-id')
+        self.describe = describe
+
+    def position(self, timestamp, pk):
+        """Convert a cursor's ``(time, id)`` for this source to field values."""
+        try:
+            moment = self.model._meta.get_field(self.time_field).to_python(timestamp)
+            pk = self.model._meta.pk.to_python(pk)
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor('Malformed cursor')
+        if moment is None or pk is None:
+            raise InvalidCursor('Malformed cursor')
+        return [moment, pk]
+
+    def events(self, customer, user, position, chunk_size):
+        """Yield ``(time, id, instance)`` newest first, after ``position`` if given."""
+        queryset = self.queryset(customer, user).order_by(*self.ordering)
+        while True:
+            page = queryset
+            if position is not None:
+                page = page.filter(seek_filter(self.ordering, position))
+            rows = list(page[:chunk_size])
+            for row in rows:
+                yield (getattr(row, self.time_field), row.pk, row)
+            if len(rows) < chunk_size:
+                return
+            position = [getattr(rows[-1], self.time_field), rows[-1].pk]
+
+
+SOURCES = [
+    Source(
+        'note',
+        CustomerNote,
+        lambda customer, user: CustomerNote.objects.filter(customer=customer).filter(
+            Q(is_private=False) | Q(user=user)
+        ).select_related('user'),
+        'created_at',
+        _note_event
+    ),
+    Source(
+        'interaction',
+        CustomerInteraction,
+        lambda customer, user: CustomerInteraction.objects.filter(customer=customer).select_related('user'),
+        'interaction_date',
+        _interaction_event
+    ),
+    Source(
+        'payment',
+        Payment,
+        lambda customer, user: Payment.objects.filter(customer=customer),
+        'created_at',
+        _payment_event
+    ),
+]
+
+
+def _decode_positions(cursor):
+    values = decode_cursor(cursor, 2 * len(SOURCES))
+    positions = []
+    for index, source in enumerate(SOURCES):
+        timestamp, pk = values[2 * index], values[2 * index + 1]
+        positions.append(None if timestamp is None else source.position(timestamp, pk))
+    return positions
+
+
+def _ranked(rank, events):
+    # The source's rank breaks ties between events of different sources at
+    # the same instant, so ids of different types are never compared.
+    for moment, pk, instance in events:
+        yield moment, rank, pk, instance
+
+
+def timeline_page(customer, user, cursor=None, limit=PAGE_SIZE):
+    """
+    Return ``(events, next_cursor)`` for a page of ``customer``'s activity.
+
+    ``user`` is the reader; other users' private notes are left out.
+    Raises InvalidCursor for a cursor not produced by this function.
+    """
+    positions = _decode_positions(cursor) if cursor else [None] * len(SOURCES)
+    # Sources are pulled a few rows at a time; the merge asks for more only
+    # when a source's rows keep winning.
+    chunk_size = limit // len(SOURCES) + 2
+
+    streams = [
+        _ranked(rank, source.events(customer, user, position, chunk_size))
+        for rank, (source, position) in enumerate(zip(SOURCES, positions))
+    ]
+    merged = heapq.merge(*streams, key=lambda event: event[:3], reverse=True)
+
+    events = []
+    for moment, rank, pk, instance in merged:
+        if len(events) == limit:
+            break
+        source = SOURCES[rank]
+        positions[rank] = [moment, pk]
+        events.append(dict(
+            {'type': source.kind, 'id': str(pk), 'timestamp': moment.isoformat()},
+            **source.describe(instance)
+        ))
+    else:
+        return events, None
+
+    values = []
+    for position in positions:
+        values.extend(position if position is not None else [None, None])
+    return events, encode_cursor(values)
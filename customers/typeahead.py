@@ -0,0 +1,219 @@
+"""
+Customer typeahead index for DataLinkCRM.
+
+Each process keeps, per user, a sorted array of normalized search keys
+(names, email, phone forms and customer_id) and answers prefix lookups with
+a binary search, so typeahead requests never touch the database. Indexes
+are built lazily on first use and the least recently used tenants are
+evicted beyond TYPEAHEAD_MAX_TENANTS.
+
+Customer signals update the index of the process that made the change and
+bump a per-user version in the shared cache. Other processes notice the new
+version on their next lookup and rebuild their copy.
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Customer
+
+VERSION_KEY = 'customers:typeahead:version:{user_id}'
+
+INDEX_FIELDS = ['pk', 'customer_id', 'first_name', 'last_name', 'email', 'phone']
+
+
+def normalize(text):
+    """Lowercase ``text``, strip accents and collapse whitespace."""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def customer_keys(first_name, last_name, email, phone, customer_id):
+    """Return the normalized keys a customer can be found by."""
+    first_name, last_name = normalize(first_name), normalize(last_name)
+    keys = {
+        first_name,
+        last_name,
+        f'{first_name} {last_name}',
+        f'{last_name} {first_name}',
+        normalize(email),
+        normalize(customer_id),
+    }
+    digits = (phone or '').lstrip('+')
+    keys.add(digits)
+    if digits.startswith('254') and len(digits) == 12:
+        keys.add('0' + digits[3:])
+    keys.discard('')
+    return sorted(keys)
+
+
+def normalize_query(query):
+    query = normalize(query)
+    return query[1:] if query.startswith('+') else query
+
+
+class PrefixIndex:
+    """Sorted (key, customer) arrays for one user's customers."""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.keys = []
+        self.pks = []
+        self.customers = {}
+
+    @classmethod
+    def build(cls, rows, version=None):
+        index = cls(version)
+        pairs = []
+        for pk, customer_id, first_name, last_name, email, phone in rows:
+            index.customers[pk] = index._entry(pk, customer_id, first_name, last_name, email, phone)
+            pairs.extend((key, pk) for key in index.customers[pk]['keys'])
+        pairs.sort(key=itemgetter(0))
+        index.keys = [key for key, _ in pairs]
+        index.pks = [pk for _, pk in pairs]
+        return index
+
+    @staticmethod
+    def _entry(pk, customer_id, first_name, last_name, email, phone):
+        return {
+            'keys': customer_keys(first_name, last_name, email, phone, customer_id),
+            'result': {
+                'id': str(pk),
+                'customer_id': customer_id,
+                'name': f'{first_name} {last_name}'.strip(),
+                'email': email,
+                'phone': phone,
+            },
+        }
+
+    def remove(self, pk):
+        entry = self.customers.pop(pk, None)
+        if entry is None:
+            return
+        for key in entry['keys']:
+            position = bisect_left(self.keys, key)
+            while position < len(self.keys) and self.keys[position] == key:
+                if self.pks[position] == pk:
+                    del self.keys[position]
+                    del self.pks[position]
+                    break
+                position += 1
+
+    def add(self, pk, customer_id, first_name, last_name, email, phone):
+        self.remove(pk)
+        entry = self._entry(pk, customer_id, first_name, last_name, email, phone)
+        self.customers[pk] = entry
+        for key in entry['keys']:
+            position = bisect_left(self.keys, key)
+            self.keys.insert(position, key)
+            self.pks.insert(position, pk)
+
+    def lookup(self, prefix, limit):
+        """Return up to ``limit`` customers with a key starting with ``prefix``."""
+        results, seen = [], set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            pk = self.pks[position]
+            if pk not in seen:
+                seen.add(pk)
+                results.append(self.customers[pk]['result'])
+                if len(results) == limit:
+                    break
+            position += 1
+        return results
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_max_tenants():
+    return getattr(settings, 'TYPEAHEAD_MAX_TENANTS', 64)
+
+
+def version_key(user_id):
+    return VERSION_KEY.format(user_id=user_id)
+
+
+def get_index(user_id):
+    """Return the user's index, building it if missing or outdated."""
+    version = cache.get(version_key(user_id))
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(user_id)
+            return index
+
+    rows = Customer.objects.filter(user_id=user_id).values_list(*INDEX_FIELDS)
+    index = PrefixIndex.build(rows.iterator(chunk_size=2000), version)
+    with _lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > get_max_tenants():
+            _indexes.popitem(last=False)
+    return index
+
+
+def lookup(user_id, query, limit=10):
+    """Return customers of ``user_id`` with a name, email, phone or ID starting with ``query``."""
+    prefix = normalize_query(query)
+    if not prefix:
+        return []
+    index = get_index(user_id)
+    with _lock:
+        return index.lookup(prefix, limit)
+
+
+def _bump_version(user_id):
+    """Bump the user's version and return ``(version, incremented)``."""
+    key = version_key(user_id)
+    try:
+        return cache.incr(key), True
+    except ValueError:
+        # Start from the clock so an evicted version is never reused.
+        cache.add(key, time.time_ns() // 1000, None)
+        return cache.get(key), False
+
+
+def customer_changed(customer, deleted=False):
+    """Apply a saved or deleted customer once the transaction commits."""
+    user_id, pk = customer.user_id, customer.pk
+    values = (customer.customer_id, customer.first_name, customer.last_name, customer.email, customer.phone)
+
+    def apply():
+        with _lock:
+            index = _indexes.get(user_id)
+            if index is not None:
+                if deleted:
+                    index.remove(pk)
+                else:
+                    index.add(pk, *values)
+            version, incremented = _bump_version(user_id)
+            if index is not None:
+                # This copy already has the change. It stays current only if
+                # no other process changed the user's customers in between.
+                if index.version is None:
+                    current = not incremented
+                else:
+                    current = incremented and version == index.version + 1
+                index.version = version if current else False
+    transaction.on_commit(apply)
+
+
+def invalidate(user_id):
+    """Make every process rebuild the user's index, e.g. after bulk writes."""
+    def apply():
+        with _lock:
+            _indexes.pop(user_id, None)
+            _bump_version(user_id)
+    transaction.on_commit(apply)
@@ -8,4 +8,16 @@ app_name = 'customers'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('<uuid:customer_id>/', views.detail, name='detail'),
+    path('api/<uuid:customer_id>/timeline/', views.timeline, name='timeline'),
+    path('api/follow-ups/', views.follow_ups, name='follow-ups'),
+    path('api/follow-ups/<int:interaction_id>/complete/', views.complete_follow_up_view, name='complete-follow-up'),
+    path('api/follow-ups/<int:interaction_id>/reschedule/', views.reschedule_follow_up_view, name='reschedule-follow-up'),
+    path('api/typeahead/', views.typeahead, name='typeahead'),
+    path('api/tags/', views.tag_search, name='tag-search'),
+    path('api/duplicates/', views.duplicates, name='duplicates'),
+    path('api/duplicates/<int:candidate_id>/merge/', views.merge_duplicate, name='merge-duplicate'),
+    path('api/duplicates/<int:candidate_id>/dismiss/', views.dismiss_duplicate, name='dismiss-duplicate'),
+    path('import/', views.import_file, name='import'),
+    path('export/', views.export, name='export'),
 ]
\ No newline at end of file
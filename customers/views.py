@@ -4,28 +4,353 @@ Customers views for DataLinkCRM.
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
-from .models import Customer
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import require_http_methods
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+import datetime
+from .models import Customer, DuplicateCandidate
+from .dedupe import merge_customers
+from .timeline import timeline_page
+from .followups import due_queue, complete_follow_up, reschedule_follow_up
+from .filters import filter_customers
+from .tags import TagQueryError, format_tag, tag_facets
+from .typeahead import lookup
+from .importer import import_customers, CustomerImportError
+from core.pagination import keyset_page, InvalidCursor
+from core.exports import export_response
+
+# Customers shown per page of the list.
+PAGE_SIZE = 25
+
+# Newest first; id breaks ties between customers created in the same instant.
+LIST_ORDERING = ('-created_at', '-id')
+
+# Tags listed with their counts above the customer list.
+FACET_LIMIT = 20
+
+LIST_FIELDS = [
+    'id', 'customer_id', 'first_name', 'last_name', 'email', 'phone',
+    'status', 'customer_type', 'county', 'tags', 'created_at',
+]
 
 @login_required
 def index(request):
-    """Customer list view."""
-    customers = Customer.objects.filter(user=request.user)
+    """
+    Customer list view.
+    
+    Pages are fetched by seeking past the cursor on (created_at, id), so
+    there is no OFFSET or COUNT and every page costs the same.
+    """
+    try:
+        customers, filters = filter_customers(
+            Customer.objects.filter(user=request.user).only(*LIST_FIELDS),
+            request.GET,
+            user=request.user
+        )
+    except TagQueryError as exc:
+        return HttpResponseBadRequest(f'Invalid tag expression: {exc}')
+    
+    # Facets count every match, so they are only worked out for the first
+    # page; clicking one narrows the current tag expression to that tag too.
+    cursor = request.GET.get('cursor')
+    facets = [] if cursor else tag_facets(customers, limit=FACET_LIMIT)
+    for facet in facets:
+        term = format_tag(facet['name'])
+        expression = f"({filters['tags']}) {term}" if filters.get('tags') else term
+        facet['query'] = urlencode(dict(filters, tags=expression))
+    
+    try:
+        customers, next_cursor = keyset_page(customers, LIST_ORDERING, cursor=cursor, limit=PAGE_SIZE)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    
     context = {
         'title': 'Customers',
         'customers': customers,
+        'filters': filters,
+        'facets': facets,
+        'status_choices': Customer.STATUS_CHOICES,
+        'type_choices': Customer.CUSTOMER_TYPES,
+        'is_first_page': not cursor,
+        'first_page_query': urlencode(filters),
+        'next_page_query': urlencode(dict(filters, cursor=next_cursor)) if next_cursor else None,
     }
     return render(request, 'customers/index.html', context)
 
+# Largest number of typeahead suggestions returned.
+TYPEAHEAD_MAX_LIMIT = 20
+
+@login_required
+@require_http_methods(["GET"])
+def typeahead(request):
+    """Customers whose name, email, phone or customer ID starts with ``q``."""
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), TYPEAHEAD_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    return JsonResponse({
+        'results': lookup(request.user.pk, request.GET.get('q', ''), limit),
+    })
+
+# Largest page of customers returned by the tag query API.
+TAG_QUERY_MAX_LIMIT = 100
+
+@login_required
+@require_http_methods(["GET"])
+def tag_search(request):
+    """
+    Customers matching the list filters, typically a ``tags`` expression.
+    
+    Returns a keyset page of customers plus, on the first page only, the
+    tag facet counts over every match (``facets`` is null after that).
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), TAG_QUERY_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    try:
+        customers, filters = filter_customers(
+            Customer.objects.filter(user=request.user),
+            request.GET,
+            user=request.user
+        )
+    except TagQueryError as exc:
+        return JsonResponse({'error': f'Invalid tag expression: {exc}'}, status=400)
+    
+    cursor = request.GET.get('cursor')
+    try:
+        rows, next_cursor = keyset_page(
+            customers.values('id', 'customer_id', 'first_name', 'last_name', 'email', 'tags', 'created_at'),
+            LIST_ORDERING,
+            cursor=cursor,
+            limit=limit
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'results': [
+            {
+                'id': str(row['id']),
+                'customer_id': row['customer_id'],
+                'name': f"{row['first_name']} {row['last_name']}".strip(),
+                'email': row['email'],
+                'tags': row['tags'],
+            }
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+        'facets': None if cursor else tag_facets(customers, limit=FACET_LIMIT),
+        'filters': filters,
+    })
+
+# Largest page of duplicate candidates returned at once.
+DUPLICATES_MAX_LIMIT = 100
+
+def _duplicate_side(customer):
+    return {
+        'id': str(customer.pk),
+        'customer_id': customer.customer_id,
+        'name': customer.get_full_name(),
+        'email': customer.email,
+        'phone': customer.phone,
+    }
+
+@login_required
+@require_http_methods(["GET"])
+def duplicates(request):
+    """Open duplicate candidates, most likely first."""
+    try:
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), DUPLICATES_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    candidates = DuplicateCandidate.objects.filter(user=request.user, status='open').select_related('customer_a', 'customer_b')
+    try:
+        candidates, next_cursor = keyset_page(candidates, ('-score', 'id'), cursor=request.GET.get('cursor'), limit=limit)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'results': [
+            {
+                'id': candidate.pk,
+                'score': candidate.score,
+                'reasons': candidate.reasons.split(',') if candidate.reasons else [],
+                'customer_a': _duplicate_side(candidate.customer_a),
+                'customer_b': _duplicate_side(candidate.customer_b),
+            }
+            for candidate in candidates
+        ],
+        'next_cursor': next_cursor,
+    })
+
+@login_required
+@require_http_methods(["POST"])
+def merge_duplicate(request, candidate_id):
+    """
+    Merge a duplicate candidate.
+    
+    ``keep`` names the customer (its UUID) that survives; the other one is
+    merged into it and deleted.
+    """
+    candidate = get_object_or_404(DuplicateCandidate, pk=candidate_id, user=request.user)
+    keep = request.POST.get('keep', '')
+    pair = {str(candidate.customer_a_id): candidate.customer_b_id, str(candidate.customer_b_id): candidate.customer_a_id}
+    if keep not in pair:
+        return JsonResponse({'error': 'keep must be one of the two customers'}, status=400)
+    
+    primary = Customer.objects.get(pk=keep)
+    duplicate = Customer.objects.get(pk=pair[keep])
+    merge_customers(primary, duplicate)
+    
+    return JsonResponse({'success': True, 'customer': _duplicate_side(primary)})
+
+@login_required
+@require_http_methods(["POST"])
+def dismiss_duplicate(request, candidate_id):
+    """Mark a duplicate candidate as not a duplicate; later runs keep it dismissed."""
+    updated = DuplicateCandidate.objects.filter(pk=candidate_id, user=request.user).update(status='dismissed')
+    if not updated:
+        return JsonResponse({'error': 'Duplicate candidate not found'}, status=404)
+    
+    return JsonResponse({'success': True})
+
+# Largest page of the follow-up queue returned at once.
+FOLLOW_UPS_MAX_LIMIT = 100
+
+@login_required
+@require_http_methods(["GET"])
+def follow_ups(request):
+    """
+    The user's open follow-ups, oldest first.
+    
+    By default only follow-ups due now are listed; ``days`` looks that many
+    days ahead as well.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), FOLLOW_UPS_MAX_LIMIT)
+        days = max(int(request.GET.get('days', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'limit and days must be integers'}, status=400)
+    
+    until = timezone.now() + datetime.timedelta(days=days)
+    try:
+        interactions, next_cursor = due_queue(request.user, until=until, cursor=request.GET.get('cursor'), limit=limit)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    now = timezone.now()
+    return JsonResponse({
+        'results': [
+            {
+                'id': interaction.pk,
+                'customer': {
+                    'id': str(interaction.customer_id),
+                    'name': interaction.customer.get_full_name(),
+                },
+                'subject': interaction.subject,
+                'interaction_type': interaction.interaction_type,
+                'follow_up_date': interaction.follow_up_date.isoformat(),
+                'overdue': interaction.follow_up_date <= now,
+            }
+            for interaction in interactions
+        ],
+        'next_cursor': next_cursor,
+    })
+
+@login_required
+@require_http_methods(["POST"])
+def complete_follow_up_view(request, interaction_id):
+    """Close a follow-up."""
+    if not complete_follow_up(request.user, interaction_id):
+        return JsonResponse({'error': 'Follow-up not found'}, status=404)
+    
+    return JsonResponse({'success': True})
+
+@login_required
+@require_http_methods(["POST"])
+def reschedule_follow_up_view(request, interaction_id):
+    """Move a follow-up to ``follow_up_date`` (ISO 8601); it is announced again then."""
+    when = parse_datetime(request.POST.get('follow_up_date', ''))
+    if when is None:
+        return JsonResponse({'error': 'follow_up_date must be an ISO 8601 date and time'}, status=400)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    
+    if not reschedule_follow_up(request.user, interaction_id, when):
+        return JsonResponse({'error': 'Follow-up not found'}, status=404)
+    
+    return JsonResponse({'success': True, 'follow_up_date': when.isoformat()})
+
+@login_required
+@require_http_methods(["GET"])
+def export(request):
+    """Stream the user's customers as CSV or JSON Lines, with the list filters applied."""
+    return export_response(request, 'customers')
+
+@login_required
+@require_http_methods(["POST"])
+def import_file(request):
+    """Import customers from an uploaded CSV or XLSX file."""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'No file uploaded'}, status=400)
+    
+    try:
+        report = import_customers(request.user, upload, upload.name)
+    except CustomerImportError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    return JsonResponse(report.as_dict())
+
 @login_required
 def detail(request, customer_id):
-    """Customer detail view."""
+    """Customer detail view, with the newest page of the activity timeline."""
     customer = get_object_or_404(Customer, id=customer_id, user=request.user)
+    
+    cursor = request.GET.get('cursor')
+    try:
+        events, next_cursor = timeline_page(customer, request.user, cursor=cursor)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    
     context = {
         'title': customer.name,
         'customer': customer,
+        'events': events,
+        'is_first_page': not cursor,
+        'next_cursor': next_cursor,
     }
     return render(request, 'customers/detail.html', context)
 
+# Largest page of timeline events returned at once.
+TIMELINE_MAX_LIMIT = 100
+
+@login_required
+@require_http_methods(["GET"])
+def timeline(request, customer_id):
+    """A page of the customer's notes, interactions and payments, newest first."""
+    customer = get_object_or_404(Customer, id=customer_id, user=request.user)
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), TIMELINE_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    try:
+        events, next_cursor = timeline_page(customer, request.user, cursor=request.GET.get('cursor'), limit=limit)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'results': events,
+        'next_cursor': next_cursor,
+    })
+
 @login_required
 def create(request):
     """Customer create view."""
@@ -0,0 +1,213 @@
+"""
+Dashboard event channel for DataLinkCRM.
+Per-user pub/sub used to push live updates to the dashboard event stream.
+
+Messages are published on Redis when the default cache is django-redis, so
+every worker sees them. Otherwise an in-process broker is used, which only
+reaches streams served by the same process (good enough for runserver).
+"""
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .summary import get_dashboard_summary
+
+CHANNEL = 'dashboard:events:{user_id}'
+
+# Events buffered per local subscriber before new ones are dropped.
+LOCAL_QUEUE_SIZE = 100
+
+
+def channel_name(user_id):
+    """Return the pub/sub channel for a user's dashboard events."""
+    return CHANNEL.format(user_id=user_id)
+
+
+class LocalSubscription:
+    """A subscriber queue registered with the in-process broker."""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=LOCAL_QUEUE_SIZE)
+
+    def get(self, timeout=None):
+        """Return the next message, or None if none arrives within ``timeout``."""
+        try:
+            return self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process stand-in for Redis pub/sub."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # A stalled stream only needs to know something changed.
+                pass
+
+    def subscribe(self, channel):
+        subscription = LocalSubscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class RedisSubscription:
+    """A Redis pub/sub subscription."""
+
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    def get(self, timeout=None):
+        """Return the next message, or None if none arrives within ``timeout``."""
+        message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout or 0)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisBroker:
+    """Pub/sub over the Redis server behind a django-redis cache."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def connection(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    def publish(self, channel, message):
+        self.connection().publish(channel, json.dumps(message, default=str))
+
+    def subscribe(self, channel):
+        pubsub = self.connection().pubsub()
+        pubsub.subscribe(channel)
+        return RedisSubscription(pubsub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker, choosing Redis when it is configured."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                alias = getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')
+                backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+                try:
+                    import django_redis  # noqa: F401
+                except ImportError:
+                    backend = ''
+                if backend.startswith('django_redis.'):
+                    _broker = RedisBroker(alias)
+                else:
+                    _broker = LocalBroker()
+    return _broker
+
+
+def publish(user_id, event, data=None):
+    """Publish an event to a user's dashboard streams right away."""
+    get_broker().publish(channel_name(user_id), {'event': event, 'data': data or {}})
+
+
+def publish_on_commit(user_id, event, data=None):
+    """Publish an event once the current transaction commits."""
+    transaction.on_commit(lambda: publish(user_id, event, data))
+
+
+def subscribe(user_id):
+    """Subscribe to a user's dashboard events."""
+    return get_broker().subscribe(channel_name(user_id))
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def live_stats(summary):
+    """Return the flat stat values pushed to the browser as ``dashboard-update``."""
+    stats = summary['stats']
+    return {
+        'total_customers': stats.total_customers,
+        'total_projects': stats.total_projects,
+        'total_revenue': float(stats.total_revenue),
+        'active_subscriptions': stats.active_subscriptions,
+        'month_customers': summary['month_customers'],
+        'month_revenue': float(summary['month_revenue']),
+        'active_projects': summary['active_projects'],
+        'unread_count': summary['unread_count'],
+    }
+
+
+def stream_events(user):
+    """
+    Yield the Server-Sent Events stream for a user's dashboard.
+
+    The first frame carries the full stat set; after that only stats whose
+    value changed are sent. Bursts of ``changed`` events are coalesced into a
+    single recomputation, which reads the cached summary, so idle tabs cost
+    nothing and busy ones cost one cache read per burst. The stream closes
+    after ``DASHBOARD_STREAM_MAX_AGE`` seconds and the browser reconnects.
+    """
+    keepalive = getattr(settings, 'DASHBOARD_STREAM_KEEPALIVE', 15)
+    max_age = getattr(settings, 'DASHBOARD_STREAM_MAX_AGE', 300)
+    deadline = time.monotonic() + max_age
+
+    subscription = subscribe(user.pk)
+    try:
+        yield 'retry: 5000\n\n'
+        last = live_stats(get_dashboard_summary(user))
+        yield format_sse('dashboard-update', last)
+
+        while time.monotonic() < deadline:
+            message = subscription.get(timeout=keepalive)
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+
+            while message is not None:
+                if message['event'] == 'notification':
+                    yield format_sse('notification', message['data'])
+                message = subscription.get()
+
+            current = live_stats(get_dashboard_summary(user))
+            delta = {key: value for key, value in current.items() if last.get(key) != value}
+            if delta:
+                yield format_sse('dashboard-update', delta)
+            last = current
+    finally:
+        subscription.close()
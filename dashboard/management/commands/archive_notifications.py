@@ -0,0 +1,21 @@
+"""
+Move old read notifications to the archive table.
+"""
+from django.core.management.base import BaseCommand
+
+from dashboard.notifications import archive_notifications
+
+
+class Command(BaseCommand):
+    help = 'Archive read notifications older than NOTIFICATION_RETENTION_DAYS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive read notifications older than this many days.')
+        parser.add_argument('--batch-size', type=int, help='Notifications moved per transaction.')
+
+    def handle(self, *args, **options):
+        archived = archive_notifications(
+            older_than_days=options['days'],
+            batch_size=options['batch_size'] and max(1, options['batch_size'])
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} notifications.'))
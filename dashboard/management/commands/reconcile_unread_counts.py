@@ -0,0 +1,19 @@
+"""
+Recount the cached unread notification counters.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from dashboard.notifications import reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Reset the cached unread notification counters from the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Limit to this user ID (repeatable).')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or User.objects.order_by('pk').values_list('pk', flat=True).iterator()
+        reconciled = reconcile_unread_counts(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled unread counters for {reconciled} users.'))
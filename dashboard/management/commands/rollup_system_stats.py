@@ -0,0 +1,47 @@
+"""
+Update the daily SystemStats rows.
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.rollups import rollup_system_stats, backfill_system_stats
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = 'Incrementally update SystemStats from the stored high-water mark, or backfill a date range.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recount today\'s totals and reset the high-water mark.')
+        parser.add_argument('--backfill', nargs=2, metavar=('START', 'END'), help='Rebuild rows for START..END (YYYY-MM-DD, inclusive).')
+        parser.add_argument('--workers', type=int, default=4, help='Parallel workers for --backfill.')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days per backfill chunk.')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            first, last = (parse_date(value) for value in options['backfill'])
+            if first > last:
+                raise CommandError('START must not be after END')
+            written = backfill_system_stats(
+                first, last,
+                workers=max(1, options['workers']),
+                chunk_days=max(1, options['chunk_days'])
+            )
+            self.stdout.write(self.style.SUCCESS(f'Backfilled {written} SystemStats rows ({first} to {last}).'))
+            return
+
+        rows = rollup_system_stats(full=options['full'])
+        if not rows:
+            self.stdout.write('SystemStats already up to date.')
+        for stats in rows:
+            self.stdout.write(self.style.SUCCESS(
+                f'{stats.date}: {stats.total_customers} customers, {stats.total_projects} projects, '
+                f'KSh {stats.total_revenue} revenue'
+            ))
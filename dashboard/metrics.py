@@ -0,0 +1,55 @@
+"""
+Dashboard metrics service for DataLinkCRM.
+Computes the dashboard headline numbers for a user in a single statement.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Sum, Q, OuterRef, Subquery, Value, IntegerField, DecimalField
+from django.db.models.functions import Coalesce
+
+from customers.models import Customer
+from projects.models import Project
+from payments.models import Payment
+
+ACTIVE_PROJECT_STATUSES = ['in_progress', 'planning']
+
+
+def _user_aggregate(model, aggregate, output_field, default):
+    """
+    Return ``aggregate`` over the outer user's ``model`` rows as a scalar subquery.
+
+    Rows are grouped by user so the subquery yields at most one row; users
+    with no rows get ``default`` instead of NULL.
+    """
+    subquery = model.objects.filter(
+        user=OuterRef('pk')
+    ).order_by().values('user').annotate(value=aggregate).values('value')
+    return Coalesce(Subquery(subquery, output_field=output_field), Value(default), output_field=output_field)
+
+
+def get_dashboard_metrics(user, month_start):
+    """
+    Return the dashboard headline numbers for ``user``.
+
+    Each figure is a conditional aggregate (``Count``/``Sum`` with ``filter=``)
+    over the user's rows in one table, selected as a scalar subquery against
+    the user row, so the whole set is one statement and one pass per table.
+    """
+    return User.objects.filter(pk=user.pk).annotate(
+        month_customers=_user_aggregate(
+            Customer,
+            Count('pk', filter=Q(created_at__gte=month_start)),
+            IntegerField(), 0
+        ),
+        month_revenue=_user_aggregate(
+            Payment,
+            Sum('amount', filter=Q(status='completed', created_at__gte=month_start)),
+            DecimalField(max_digits=14, decimal_places=2), Decimal('0.00')
+        ),
+        active_projects=_user_aggregate(
+            Project,
+            Count('pk', filter=Q(status__in=ACTIVE_PROJECT_STATUSES)),
+            IntegerField(), 0
+        ),
+    ).values('month_customers', 'month_revenue', 'active_projects').get()
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('dashboard', '0002_rollupcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], default='medium', max_length=10)),
+                ('action_url', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archived Notification',
+                'verbose_name_plural': 'Archived Notifications',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='dashboard_n_user_id_0b95c2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='dashboard_n_user_id_8ce52d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['is_read', 'created_at'], name='dashboard_n_is_read_34e235_idx'),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notificationarchive',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='dashboard_n_user_id_bc0534_idx'),
+        ),
+    ]
@@ -59,6 +59,19 @@ class SystemStats(models.Model):
     def __str__(self):
         return f"Stats for {self.date}"
 
+class RollupCheckpoint(models.Model):
+    """High-water marks for incremental rollup jobs."""
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Rollup Checkpoint'
+        verbose_name_plural = 'Rollup Checkpoints'
+    
+    def __str__(self):
+        return f"{self.name} @ {self.high_water_mark}"
+
 class QuickAction(models.Model):
     """Quick action shortcuts for dashboard."""
     ICON_CHOICES = [
@@ -113,6 +126,11 @@ class Notification(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'created_at']),
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['is_read', 'created_at']),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username}"
@@ -134,3 +152,26 @@ class Notification(models.Model):
             return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
         else:
             return "Just now"
+
+
+class NotificationArchive(models.Model):
+    """Read notifications moved out of the live table by the retention job."""
+    id = models.UUIDField(primary_key=True, editable=False)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    priority = models.CharField(max_length=10, choices=Notification.PRIORITY_CHOICES, default='medium')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    action_url = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Archived Notification'
+        verbose_name_plural = 'Archived Notifications'
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} - {self.user.username}"
@@ -0,0 +1,248 @@
+"""
+Notification service for DataLinkCRM.
+
+Creates notifications in bulk and keeps a denormalized per-user unread
+counter in the dashboard cache, so badges never count rows. The counter is
+adjusted on commit by every write that goes through this module or the
+Notification signals; when it is missing or has expired it is recounted from
+the database, and reconcile_unread_counts() resets it for many users at once.
+
+Read notifications older than NOTIFICATION_RETENTION_DAYS are moved to
+NotificationArchive by archive_notifications(), keeping the live table small.
+"""
+import datetime
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.pagination import keyset_page
+from .events import publish_on_commit
+from .models import Notification, NotificationArchive
+from .summary import (
+    get_dashboard_cache, invalidate_dashboard_summary, unread_cache_key, get_unread_timeout, count_unread
+)
+
+FANOUT_BATCH_SIZE = 1000
+
+INBOX_ORDERING = ('-created_at', '-id')
+INBOX_FIELDS = ['id', 'title', 'message', 'priority', 'is_read', 'action_url', 'created_at']
+
+ARCHIVE_FIELDS = ['id', 'title', 'message', 'priority', 'user_id', 'action_url', 'created_at']
+
+_archiving = threading.local()
+
+# Map notification priorities onto the alert types used by app.js.
+NOTIFICATION_ALERT_TYPES = {
+    'low': 'info',
+    'medium': 'info',
+    'high': 'warning',
+    'critical': 'danger',
+}
+
+
+def get_unread_count(user_id):
+    """Return a user's unread notification count, from the counter when present."""
+    count = get_dashboard_cache().get(unread_cache_key(user_id))
+    if count is None:
+        return count_unread(user_id)
+    return max(count, 0)
+
+
+def adjust_unread_count(user_id, delta):
+    """Add ``delta`` to a user's counter once the current transaction commits."""
+    def adjust():
+        try:
+            get_dashboard_cache().incr(unread_cache_key(user_id), delta)
+        except ValueError:
+            # No counter cached; the next read recounts.
+            pass
+    transaction.on_commit(adjust)
+
+
+def reset_unread_count(user_id):
+    """Drop a user's counter on commit so the next read recounts it."""
+    transaction.on_commit(lambda: get_dashboard_cache().delete(unread_cache_key(user_id)))
+
+
+def notification_event(notification):
+    """Return the payload pushed to dashboard streams for a new notification."""
+    return {
+        'id': str(notification.id),
+        'title': notification.title,
+        'message': notification.message,
+        'type': NOTIFICATION_ALERT_TYPES.get(notification.priority, 'info'),
+        'action_url': notification.action_url,
+    }
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def create_notifications(notifications, batch_size=FANOUT_BATCH_SIZE):
+    """
+    Insert unsaved Notification instances in bulk and return how many were created.
+
+    Rows are inserted with bulk_create, one transaction per ``batch_size``
+    notifications. bulk_create skips the post_save signals, so counters,
+    dashboard summaries and live streams are updated here for each batch.
+    """
+    created = 0
+    for batch in _batched(notifications, batch_size):
+        with transaction.atomic():
+            batch = Notification.objects.bulk_create(batch)
+            for notification in batch:
+                adjust_unread_count(notification.user_id, 1)
+                invalidate_dashboard_summary(notification.user_id)
+                publish_on_commit(notification.user_id, 'notification', notification_event(notification))
+        created += len(batch)
+    return created
+
+
+def notify_users(user_ids, title, message, priority='medium', action_url='', batch_size=FANOUT_BATCH_SIZE):
+    """Send one notification to many users and return how many were created."""
+    return create_notifications(
+        (
+            Notification(
+                user_id=user_id,
+                title=title,
+                message=message,
+                priority=priority,
+                action_url=action_url,
+            )
+            for user_id in user_ids
+        ),
+        batch_size=batch_size
+    )
+
+
+def notify_user(user, title, message, priority='medium', action_url=''):
+    """Create a single notification; signals keep the counter in step."""
+    return Notification.objects.create(
+        user=user,
+        title=title,
+        message=message,
+        priority=priority,
+        action_url=action_url,
+    )
+
+
+def mark_read(user, notification_id):
+    """
+    Mark one of the user's notifications read.
+
+    Returns False if it does not exist or was already read. The conditional
+    update makes repeated requests decrement the counter only once.
+    """
+    updated = Notification.objects.filter(
+        id=notification_id,
+        user=user,
+        is_read=False
+    ).update(is_read=True)
+    if updated:
+        adjust_unread_count(user.pk, -updated)
+        invalidate_dashboard_summary(user.pk)
+        publish_on_commit(user.pk, 'changed', {'model': 'dashboard.notification'})
+    return bool(updated)
+
+
+def mark_all_read(user):
+    """Mark all of the user's notifications read and return how many changed."""
+    updated = Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+    if updated:
+        adjust_unread_count(user.pk, -updated)
+        invalidate_dashboard_summary(user.pk)
+        publish_on_commit(user.pk, 'changed', {'model': 'dashboard.notification'})
+    return updated
+
+
+def reconcile_unread_counts(user_ids):
+    """Recount unread notifications for ``user_ids`` with one grouped query per batch."""
+    cache = get_dashboard_cache()
+    reconciled = 0
+    for batch in _batched(user_ids, FANOUT_BATCH_SIZE):
+        counts = dict(
+            Notification.objects.filter(user_id__in=batch, is_read=False).order_by().values(
+                'user_id'
+            ).annotate(n=Count('pk')).values_list('user_id', 'n')
+        )
+        cache.set_many(
+            {unread_cache_key(user_id): counts.get(user_id, 0) for user_id in batch},
+            get_unread_timeout()
+        )
+        reconciled += len(batch)
+    return reconciled
+
+
+def get_inbox_page(user, cursor=None, limit=20, unread_only=False):
+    """
+    Return ``(notifications, next_cursor)`` for a page of the user's inbox.
+
+    Pages are ordered newest first on ``(created_at, id)`` and seek from the
+    cursor along the user's index, so deep pages cost the same as the first.
+    Raises core.pagination.InvalidCursor for a bad cursor.
+    """
+    queryset = Notification.objects.filter(user=user)
+    if unread_only:
+        queryset = queryset.filter(is_read=False)
+    return keyset_page(queryset.values(*INBOX_FIELDS), INBOX_ORDERING, cursor=cursor, limit=limit)
+
+
+def archiving():
+    """Whether this thread is deleting notifications archive_notifications() has just archived."""
+    return getattr(_archiving, 'active', False)
+
+
+def get_retention_days():
+    """Return how many days read notifications stay in the live table."""
+    return getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+
+
+def archive_notifications(older_than_days=None, batch_size=None, now=None):
+    """
+    Move read notifications older than ``older_than_days`` to the archive.
+
+    Works through the backlog oldest first in transactions of at most
+    ``batch_size`` rows, so locks stay short however large it is. The
+    per-row delete signal handlers skip archived rows (see archiving()):
+    only read notifications are archived, so unread counters stay as they
+    are, and each owner's summary and streams are refreshed once per batch
+    instead. Returns the number of notifications archived.
+    """
+    if older_than_days is None:
+        older_than_days = get_retention_days()
+    if batch_size is None:
+        batch_size = getattr(settings, 'NOTIFICATION_ARCHIVE_BATCH_SIZE', 500)
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=older_than_days)
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(Notification.objects.filter(
+                is_read=True,
+                created_at__lt=cutoff
+            ).order_by('created_at').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                return archived
+            NotificationArchive.objects.bulk_create(
+                [NotificationArchive(**row) for row in rows],
+                ignore_conflicts=True
+            )
+            _archiving.active = True
+            try:
+                Notification.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            finally:
+                _archiving.active = False
+            for user_id in {row['user_id'] for row in rows}:
+                invalidate_dashboard_summary(user_id)
+                publish_on_commit(user_id, 'changed', {'model': 'dashboard.notification'})
+        archived += len(rows)
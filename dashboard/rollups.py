@@ -0,0 +1,289 @@
+"""
+SystemStats rollup engine for DataLinkCRM.
+
+The incremental job folds rows created or completed since the last run into
+the daily SystemStats row, reading only the window after the stored
+high-water mark. Running totals are carried forward from the previous day's
+row; figures that describe a single day are recomputed over that day's index
+range. Deletions are not seen incrementally, so a periodic ``full`` run (or a
+backfill) reconciles the totals.
+"""
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import SystemStats, RollupCheckpoint
+from .summary import invalidate_system_stats
+from customers.models import Customer
+from projects.models import Project
+from payments.models import Payment
+from subscriptions.models import Subscription
+
+CHECKPOINT_NAME = 'system-stats'
+
+# Subscription statuses that never count as active when reconstructing history.
+INACTIVE_SUBSCRIPTION_STATUSES = ['cancelled', 'suspended']
+
+
+def day_bounds(date):
+    """Return the aware local midnights that start ``date`` and the day after."""
+    start = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+def split_by_day(start, end):
+    """Yield ``(date, window_start, window_end)`` pieces of (start, end] split at local midnight."""
+    cursor = start
+    while cursor < end:
+        date = timezone.localtime(cursor).date()
+        window_end = min(end, day_bounds(date)[1])
+        yield date, cursor, window_end
+        cursor = window_end
+
+
+def _success_rate(completed, failed):
+    settled = completed + failed
+    return round(100.0 * completed / settled, 2) if settled else 0.0
+
+
+def _apply_day_metrics(stats, day_start, end):
+    """Recompute the figures that only describe the day so far."""
+    stats.projects_completed = Project.objects.filter(
+        status='completed',
+        updated_at__gte=day_start,
+        updated_at__lte=end
+    ).count()
+
+    payments = Payment.objects.filter(
+        created_at__gte=day_start,
+        created_at__lte=end
+    ).aggregate(
+        completed=Count('pk', filter=Q(status='completed')),
+        failed=Count('pk', filter=Q(status='failed')),
+    )
+    stats.payment_success_rate = _success_rate(payments['completed'], payments['failed'])
+    stats.active_subscriptions = Subscription.objects.filter(status='active').count()
+
+
+def _apply_window(date, start, end):
+    """Fold rows from (start, end] into the SystemStats row for ``date``."""
+    day_start = day_bounds(date)[0]
+    stats = SystemStats.objects.filter(date=date).first()
+
+    if stats is None or start <= day_start:
+        # First window of the day: carry the running totals forward and
+        # count the day from midnight.
+        start = min(start, day_start)
+        previous = SystemStats.objects.filter(date__lt=date).order_by('-date').first()
+        stats = stats or SystemStats(date=date)
+        stats.total_customers = previous.total_customers if previous else 0
+        stats.total_projects = previous.total_projects if previous else 0
+        stats.total_revenue = previous.total_revenue if previous else Decimal('0.00')
+        stats.new_customers_today = 0
+
+    new_customers = Customer.objects.filter(created_at__gt=start, created_at__lte=end).count()
+    new_projects = Project.objects.filter(created_at__gt=start, created_at__lte=end).count()
+    revenue = Payment.objects.filter(
+        status='completed',
+        completed_at__gt=start,
+        completed_at__lte=end
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+
+    stats.total_customers += new_customers
+    stats.new_customers_today += new_customers
+    stats.total_projects += new_projects
+    stats.total_revenue += revenue
+    _apply_day_metrics(stats, day_start, end)
+    stats.save()
+    return stats
+
+
+def _rebuild_day(date, end):
+    """Recount the SystemStats row for ``date`` from scratch, up to ``end``."""
+    day_start = day_bounds(date)[0]
+    stats = SystemStats.objects.filter(date=date).first() or SystemStats(date=date)
+
+    stats.total_customers = Customer.objects.filter(created_at__lte=end).count()
+    stats.total_projects = Project.objects.filter(created_at__lte=end).count()
+    stats.total_revenue = Payment.objects.filter(
+        status='completed',
+        completed_at__lte=end
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    stats.new_customers_today = Customer.objects.filter(
+        created_at__gte=day_start,
+        created_at__lte=end
+    ).count()
+    _apply_day_metrics(stats, day_start, end)
+    stats.save()
+    return stats
+
+
+def rollup_system_stats(now=None, full=False):
+    """
+    Bring SystemStats up to date and return the rows that were written.
+
+    Only rows after the stored high-water mark are read. The mark trails the
+    clock by ``DASHBOARD_ROLLUP_LAG`` seconds so rows from transactions still
+    in flight are not skipped. The first run, or ``full=True``, recounts the
+    current day's totals and resets the mark.
+    """
+    lag = getattr(settings, 'DASHBOARD_ROLLUP_LAG', 60)
+    end = (now or timezone.now()) - datetime.timedelta(seconds=lag)
+
+    with transaction.atomic():
+        checkpoint = RollupCheckpoint.objects.select_for_update().filter(name=CHECKPOINT_NAME).first()
+
+        if checkpoint is None or full:
+            rows = [_rebuild_day(timezone.localtime(end).date(), end)]
+        elif end <= checkpoint.high_water_mark:
+            return []
+        else:
+            rows = [
+                _apply_window(date, window_start, window_end)
+                for date, window_start, window_end in split_by_day(checkpoint.high_water_mark, end)
+            ]
+
+        RollupCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME,
+            defaults={'high_water_mark': end}
+        )
+    return rows
+
+
+def _per_day(queryset, field, **aggregates):
+    """Group ``queryset`` by the local date of ``field``."""
+    grouped = {}
+    for row in queryset.order_by().annotate(day=TruncDate(field)).values('day').annotate(**aggregates):
+        grouped[row.pop('day')] = row
+    return grouped
+
+
+def _backfill_chunk(first, last):
+    """Compute SystemStats values for each day from ``first`` to ``last`` inclusive."""
+    start = day_bounds(first)[0]
+    end = day_bounds(last)[1]
+
+    total_customers = Customer.objects.filter(created_at__lt=start).count()
+    total_projects = Project.objects.filter(created_at__lt=start).count()
+    total_revenue = Payment.objects.filter(
+        status='completed',
+        completed_at__lt=start
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+
+    customers = _per_day(
+        Customer.objects.filter(created_at__gte=start, created_at__lt=end),
+        'created_at', n=Count('pk')
+    )
+    projects = _per_day(
+        Project.objects.filter(created_at__gte=start, created_at__lt=end),
+        'created_at', n=Count('pk')
+    )
+    completed_projects = _per_day(
+        Project.objects.filter(status='completed', updated_at__gte=start, updated_at__lt=end),
+        'updated_at', n=Count('pk')
+    )
+    revenue = _per_day(
+        Payment.objects.filter(status='completed', completed_at__gte=start, completed_at__lt=end),
+        'completed_at', total=Sum('amount')
+    )
+    payments = _per_day(
+        Payment.objects.filter(created_at__gte=start, created_at__lt=end),
+        'created_at',
+        completed=Count('pk', filter=Q(status='completed')),
+        failed=Count('pk', filter=Q(status='failed')),
+    )
+    # Historical subscription status is not recorded, so a subscription
+    # counts as active on the days its billing period covers.
+    periods = list(Subscription.objects.filter(
+        start_date__lte=last,
+        end_date__gte=first
+    ).exclude(status__in=INACTIVE_SUBSCRIPTION_STATUSES).values_list('start_date', 'end_date'))
+
+    rows = []
+    date = first
+    while date <= last:
+        new_customers = customers.get(date, {}).get('n', 0)
+        total_customers += new_customers
+        total_projects += projects.get(date, {}).get('n', 0)
+        total_revenue += revenue.get(date, {}).get('total') or Decimal('0.00')
+        day_payments = payments.get(date, {'completed': 0, 'failed': 0})
+        rows.append({
+            'date': date,
+            'total_customers': total_customers,
+            'total_projects': total_projects,
+            'total_revenue': total_revenue,
+            'active_subscriptions': sum(1 for begin, finish in periods if begin <= date <= finish),
+            'new_customers_today': new_customers,
+            'projects_completed': completed_projects.get(date, {}).get('n', 0),
+            'payment_success_rate': _success_rate(day_payments['completed'], day_payments['failed']),
+        })
+        date += datetime.timedelta(days=1)
+    return rows
+
+
+def _backfill_chunk_in_thread(chunk):
+    try:
+        return _backfill_chunk(*chunk)
+    finally:
+        # Each worker thread opened its own connection.
+        connection.close()
+
+
+def backfill_system_stats(first, last, workers=4, chunk_days=31):
+    """
+    Rebuild SystemStats rows for every day from ``first`` to ``last`` inclusive.
+
+    The range is split into chunks of ``chunk_days`` that are computed in
+    parallel, each with one grouped query per metric plus one count for the
+    running totals before the chunk. Rows are then written with one
+    bulk_create and one bulk_update. The high-water mark is left alone.
+    """
+    chunks = []
+    chunk_start = first
+    while chunk_start <= last:
+        chunk_end = min(last, chunk_start + datetime.timedelta(days=chunk_days - 1))
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + datetime.timedelta(days=1)
+
+    if workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_backfill_chunk_in_thread, chunks))
+    else:
+        results = [_backfill_chunk(*chunk) for chunk in chunks]
+
+    fields = [
+        'total_customers',
+        'total_projects',
+        'total_revenue',
+        'active_subscriptions',
+        'new_customers_today',
+        'projects_completed',
+        'payment_success_rate',
+        'updated_at',
+    ]
+    now = timezone.now()
+    existing = {stats.date: stats for stats in SystemStats.objects.filter(date__range=(first, last))}
+    to_create, to_update = [], []
+    for row in (row for chunk in results for row in chunk):
+        stats = existing.get(row['date'])
+        if stats is None:
+            to_create.append(SystemStats(**row))
+        else:
+            for field, value in row.items():
+                setattr(stats, field, value)
+            stats.updated_at = now
+            to_update.append(stats)
+
+    with transaction.atomic():
+        SystemStats.objects.bulk_create(to_create, batch_size=500)
+        SystemStats.objects.bulk_update(to_update, fields, batch_size=500)
+        # Bulk writes skip the post_save handlers.
+        invalidate_system_stats()
+    return len(to_create) + len(to_update)
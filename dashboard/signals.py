@@ -0,0 +1,93 @@
+"""
+Dashboard signal handlers for DataLinkCRM.
+Keep the cached dashboard summaries in step with the models they are built
+from, and tell connected dashboard streams that something changed.
+"""
+from django.db.models.signals import post_save, post_delete
+
+from .events import publish_on_commit
+from .models import DashboardWidget, SystemStats, QuickAction, Notification
+from .notifications import archiving, notification_event, adjust_unread_count, reset_unread_count
+from .summary import invalidate_dashboard_summary, invalidate_system_stats
+from customers.models import Customer
+from customers.signals import customers_bulk_created
+from projects.models import Project
+from payments.models import Payment
+from payments.signals import payments_bulk_updated
+from subscriptions.models import Subscription
+
+# Per-user models whose rows feed the dashboard summary.
+SUMMARY_MODELS = [
+    Customer,
+    Project,
+    Payment,
+    Subscription,
+    Notification,
+    DashboardWidget,
+    QuickAction,
+]
+
+
+def invalidate_user_summary(sender, instance, **kwargs):
+    """Invalidate the owning user's dashboard summary and notify their streams."""
+    if sender is Notification and archiving():
+        # archive_notifications() refreshes each owner once per batch.
+        return
+    invalidate_dashboard_summary(instance.user_id)
+    publish_on_commit(instance.user_id, 'changed', {'model': sender._meta.label_lower})
+
+
+def customers_imported(sender, user_id, customers, **kwargs):
+    """Invalidate the summary of a user whose customers were bulk inserted."""
+    invalidate_dashboard_summary(user_id)
+    publish_on_commit(user_id, 'changed', {'model': 'customers.customer'})
+
+
+def payments_updated(sender, payments, **kwargs):
+    """Invalidate the summaries of users whose payments were bulk updated."""
+    for user_id in {payment.user_id for payment in payments}:
+        invalidate_dashboard_summary(user_id)
+        publish_on_commit(user_id, 'changed', {'model': 'payments.payment'})
+
+
+def push_notification(sender, instance, created, **kwargs):
+    """Push newly created notifications to the user's dashboard streams."""
+    if created:
+        publish_on_commit(instance.user_id, 'notification', notification_event(instance))
+
+
+def count_notification(sender, instance, created, **kwargs):
+    """Keep the unread counter in step with single-row notification saves."""
+    if created:
+        if not instance.is_read:
+            adjust_unread_count(instance.user_id, 1)
+    else:
+        # The previous read state is unknown here; recount on the next read.
+        reset_unread_count(instance.user_id)
+
+
+def uncount_notification(sender, instance, **kwargs):
+    """Drop a deleted unread notification from the counter."""
+    if not instance.is_read and not archiving():
+        adjust_unread_count(instance.user_id, -1)
+
+
+def invalidate_stats(sender, instance, **kwargs):
+    """Invalidate the shared SystemStats cache entry."""
+    invalidate_system_stats()
+
+
+for model in SUMMARY_MODELS:
+    uid = f'dashboard-summary-{model._meta.label_lower}'
+    post_save.connect(invalidate_user_summary, sender=model, dispatch_uid=uid)
+    post_delete.connect(invalidate_user_summary, sender=model, dispatch_uid=uid)
+
+customers_bulk_created.connect(customers_imported, dispatch_uid='dashboard-customers-imported')
+payments_bulk_updated.connect(payments_updated, dispatch_uid='dashboard-payments-updated')
+
+post_save.connect(push_notification, sender=Notification, dispatch_uid='dashboard-push-notification')
+post_save.connect(count_notification, sender=Notification, dispatch_uid='dashboard-unread-count')
+post_delete.connect(uncount_notification, sender=Notification, dispatch_uid='dashboard-unread-count')
+
+post_save.connect(invalidate_stats, sender=SystemStats, dispatch_uid='dashboard-system-stats')
+post_delete.connect(invalidate_stats, sender=SystemStats, dispatch_uid='dashboard-system-stats')
@@ -0,0 +1,198 @@
+"""
+Dashboard summary cache for DataLinkCRM.
+Per-user snapshot of everything the dashboard renders, rebuilt lazily on a
+cache miss and invalidated by model signals (see dashboard.signals).
+
+Every invalidation also bumps a data-version counter, which the JSON
+endpoints use as their ETag. The unread notification count is a separate
+counter (see dashboard.notifications) read alongside the summary.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import get_dashboard_metrics
+from .models import DashboardWidget, SystemStats, QuickAction, Notification
+from customers.models import Customer
+from projects.models import Project
+from payments.models import Payment
+
+SUMMARY_KEY = 'dashboard:summary:{user_id}'
+SYSTEM_STATS_KEY = 'dashboard:system-stats'
+DATA_VERSION_KEY = 'dashboard:version:{user_id}'
+STATS_VERSION_KEY = 'dashboard:version:system-stats'
+UNREAD_KEY = 'dashboard:unread:{user_id}'
+
+# Number of rows kept per "recent" list; the dashboard page shows the first 5.
+RECENT_LIMIT = 10
+
+
+def get_dashboard_cache():
+    """Return the cache backend used for dashboard summaries."""
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def get_summary_timeout():
+    """Return the summary TTL in seconds."""
+    return getattr(settings, 'DASHBOARD_SUMMARY_TIMEOUT', 900)
+
+
+def summary_cache_key(user_id):
+    """Return the cache key holding a user's dashboard summary."""
+    return SUMMARY_KEY.format(user_id=user_id)
+
+
+def unread_cache_key(user_id):
+    """Return the cache key holding a user's unread notification count."""
+    return UNREAD_KEY.format(user_id=user_id)
+
+
+def get_unread_timeout():
+    """Return how long an unread counter lives before it is recounted, in seconds."""
+    return getattr(settings, 'NOTIFICATION_UNREAD_TIMEOUT', 3600)
+
+
+def count_unread(user_id):
+    """Count a user's unread notifications in the database and cache the result."""
+    count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+    get_dashboard_cache().set(unread_cache_key(user_id), count, get_unread_timeout())
+    return count
+
+
+def get_month_start():
+    """Return midnight on the first day of the current local month."""
+    return timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def build_system_stats():
+    """
+    Load the latest SystemStats row.
+
+    Rows are written by the rollup job (see dashboard.rollups); until it has
+    run, an unsaved all-zero row is returned instead.
+    """
+    try:
+        return SystemStats.objects.latest('date')
+    except SystemStats.DoesNotExist:
+        return SystemStats()
+
+
+def build_user_summary(user):
+    """Run the dashboard queries for a user and return the results."""
+    month_start = get_month_start()
+    metrics = get_dashboard_metrics(user, month_start)
+
+    return {
+        'month_start': month_start,
+        'user_widgets': list(DashboardWidget.objects.filter(
+            user=user,
+            is_active=True
+        ).order_by('position')),
+        'quick_actions': list(QuickAction.objects.filter(
+            user=user,
+            is_active=True
+        ).order_by('position')[:8]),
+        'notifications': list(Notification.objects.filter(
+            user=user
+        ).order_by('-created_at')[:5]),
+        'recent_customers': list(Customer.objects.filter(
+            user=user
+        ).order_by('-created_at')[:RECENT_LIMIT]),
+        'recent_projects': list(Project.objects.filter(
+            user=user
+        ).order_by('-created_at')[:RECENT_LIMIT]),
+        'recent_payments': list(Payment.objects.filter(
+            user=user
+        ).order_by('-created_at')[:RECENT_LIMIT]),
+        'month_customers': metrics['month_customers'],
+        'month_revenue': metrics['month_revenue'],
+        'active_projects': metrics['active_projects'],
+    }
+
+
+def get_dashboard_summary(user):
+    """
+    Return the dashboard summary for a user.
+
+    A warm hit is a single multi-key cache read covering the user's
+    summary, their unread counter and the shared SystemStats row. Missing
+    entries are rebuilt and stored; a summary built in a previous month is
+    treated as a miss so the monthly figures roll over without waiting for
+    an invalidation.
+    """
+    cache = get_dashboard_cache()
+    key = summary_cache_key(user.pk)
+    unread_key = unread_cache_key(user.pk)
+    cached = cache.get_many([key, unread_key, SYSTEM_STATS_KEY])
+
+    summary = cached.get(key)
+    if summary is None or summary['month_start'] != get_month_start():
+        summary = build_user_summary(user)
+        cache.set(key, summary, get_summary_timeout())
+
+    stats = cached.get(SYSTEM_STATS_KEY)
+    if stats is None:
+        stats = build_system_stats()
+        cache.set(SYSTEM_STATS_KEY, stats, get_summary_timeout())
+
+    unread_count = cached.get(unread_key)
+    if unread_count is None:
+        unread_count = count_unread(user.pk)
+
+    return dict(summary, stats=stats, unread_count=max(unread_count, 0))
+
+
+def _new_version():
+    """
+    Return a fresh version number.
+
+    Versions start from the clock rather than zero so a counter that was
+    evicted never repeats a value a client may still hold as an ETag.
+    """
+    return time.time_ns() // 1000
+
+
+def _bump_version(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def get_data_versions(user_id):
+    """Return the user's data version and the SystemStats version."""
+    cache = get_dashboard_cache()
+    user_key = DATA_VERSION_KEY.format(user_id=user_id)
+    versions = cache.get_many([user_key, STATS_VERSION_KEY])
+    for key in (user_key, STATS_VERSION_KEY):
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return versions[user_key], versions[STATS_VERSION_KEY]
+
+
+def get_dashboard_etag(user):
+    """Return an ETag covering everything the dashboard endpoints read for a user."""
+    user_version, stats_version = get_data_versions(user.pk)
+    return f"{user_version}-{stats_version}-{get_month_start():%Y%m}"
+
+
+def invalidate_dashboard_summary(user_id):
+    """Drop a user's cached summary and bump their data version on commit."""
+    def invalidate():
+        cache = get_dashboard_cache()
+        cache.delete(summary_cache_key(user_id))
+        _bump_version(cache, DATA_VERSION_KEY.format(user_id=user_id))
+    transaction.on_commit(invalidate)
+
+
+def invalidate_system_stats():
+    """Drop the cached SystemStats row and bump its version on commit."""
+    def invalidate():
+        cache = get_dashboard_cache()
+        cache.delete(SYSTEM_STATS_KEY)
+        _bump_version(cache, STATS_VERSION_KEY)
+    transaction.on_commit(invalidate)
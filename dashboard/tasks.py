@@ -0,0 +1,31 @@
+"""
+Background tasks for the dashboard app.
+Celery is optional; without it these are plain functions.
+"""
+try:
+    from celery import shared_task
+except ImportError:
+    def shared_task(func=None, **kwargs):
+        return func if func is not None else (lambda f: f)
+
+from .notifications import notify_users, archive_notifications
+from .rollups import rollup_system_stats
+
+
+@shared_task(name='dashboard.rollup_system_stats')
+def rollup_system_stats_task(full=False):
+    """Run the incremental SystemStats rollup."""
+    rows = rollup_system_stats(full=full)
+    return [str(stats.date) for stats in rows]
+
+
+@shared_task(name='dashboard.notify_users')
+def notify_users_task(user_ids, title, message, priority='medium', action_url=''):
+    """Fan a notification out to ``user_ids`` in the background."""
+    return notify_users(user_ids, title, message, priority=priority, action_url=action_url)
+
+
+@shared_task(name='dashboard.archive_notifications')
+def archive_notifications_task(older_than_days=None):
+    """Move old read notifications to the archive table."""
+    return archive_notifications(older_than_days=older_than_days)
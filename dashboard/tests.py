@@ -1,3 +1,375 @@
-from django.test import TestCase
+"""
+Tests for the dashboard app.
+"""
+import datetime
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import views
+from .events import LocalBroker, stream_events
+from .metrics import get_dashboard_metrics
+from .models import DashboardWidget, Notification, NotificationArchive, SystemStats
+from .rollups import backfill_system_stats, rollup_system_stats
+from .notifications import (
+    archive_notifications, get_inbox_page, get_unread_count, mark_all_read, mark_read, notify_user, notify_users
+)
+from .summary import get_dashboard_cache, get_dashboard_summary, get_data_versions, unread_cache_key
+from .widget_resolvers import resolve_definition, resolve_widgets
+from customers.models import Customer
+from payments.models import Payment
+from projects.models import Project
+
+# The dashboard keeps counters and summaries in the cache; keep it in memory instead of Redis.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SummaryCacheTests(TestCase):
+    def setUp(self):
+        get_dashboard_cache().clear()
+        self.user = User.objects.create_user('summary')
+
+    def create_customer(self, index):
+        return Customer.objects.create(
+            user=self.user, first_name='Summary', last_name=str(index), email=f'summary{index}@example.com',
+            phone=f'+254733{index:06d}'
+        )
+
+    def test_warm_summary_needs_no_queries(self):
+        get_dashboard_summary(self.user)
+        with self.assertNumQueries(0):
+            summary = get_dashboard_summary(self.user)
+        self.assertEqual((summary['month_customers'], summary['unread_count']), (0, 0))
+
+    def test_writes_invalidate_on_commit(self):
+        get_dashboard_summary(self.user)
+        version = get_data_versions(self.user.pk)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            customer = self.create_customer(0)
+        self.assertNotEqual(get_data_versions(self.user.pk)[0], version)
+        summary = get_dashboard_summary(self.user)
+        self.assertEqual(summary['month_customers'], 1)
+        self.assertEqual(summary['recent_customers'], [customer])
+
+        # Another user's writes leave this summary cached.
+        other = User.objects.create_user('neighbour')
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(
+                user=other, first_name='Other', last_name='User', email='other@example.com', phone='+254733999999'
+            )
+        with self.assertNumQueries(0):
+            get_dashboard_summary(self.user)
+
+    def test_summary_from_last_month_is_rebuilt(self):
+        get_dashboard_summary(self.user)
+        with mock.patch('dashboard.summary.get_month_start', return_value=timezone.now()), \
+                CaptureQueriesContext(connection) as queries:
+            get_dashboard_summary(self.user)
+        self.assertTrue(queries.captured_queries)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        get_dashboard_cache().clear()
+        self.user = User.objects.create_user('etagged')
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        request = self.factory.get('/dashboard/api/data/', **headers)
+        request.user = self.user
+        return views.get_dashboard_data(request)
+
+    def test_unchanged_data_is_not_sent_again(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        # Answering a revalidation reads the cache only.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_user(self.user, 'Invoice paid', 'INV1')
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['unread_notifications'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MetricsTests(TestCase):
+    def test_figures_in_one_query(self):
+        user = User.objects.create_user('metrics')
+        month_start = timezone.now() - datetime.timedelta(days=3)
+        for index in range(3):
+            Customer.objects.create(
+                user=user, first_name='Metric', last_name=str(index), email=f'metric{index}@example.com',
+                phone=f'+254744{index:06d}'
+            )
+        Customer.objects.filter(email='metric0@example.com').update(created_at=month_start - datetime.timedelta(days=1))
+        payments = [('100.00', 'completed'), ('50.50', 'completed'), ('75.00', 'failed')]
+        for index, (amount, status) in enumerate(payments):
+            Payment.objects.create(
+                user=user, amount=Decimal(amount), status=status, payment_method='cash', reference=f'METRIC{index}'
+            )
+        for status in ['planning', 'in_progress', 'completed']:
+            Project.objects.create(user=user, name=status, status=status)
+        # Nothing of another user is counted.
+        other = User.objects.create_user('other')
+        Project.objects.create(user=other, name='Elsewhere', status='planning')
+
+        with self.assertNumQueries(1):
+            metrics = get_dashboard_metrics(user, month_start)
+        self.assertEqual(metrics, {'month_customers': 2, 'month_revenue': Decimal('150.50'), 'active_projects': 2})
+        self.assertEqual(
+            get_dashboard_metrics(User.objects.create_user('empty'), month_start),
+            {'month_customers': 0, 'month_revenue': Decimal('0'), 'active_projects': 0}
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DASHBOARD_ROLLUP_LAG=0)
+class SystemStatsRollupTests(TestCase):
+    FIELDS = ('date', 'total_customers', 'total_projects', 'total_revenue', 'new_customers_today')
+
+    def setUp(self):
+        self.user = User.objects.create_user('rollup')
+        self.day = timezone.localdate() - datetime.timedelta(days=2)
+
+    def at(self, days, hour):
+        day = self.day + datetime.timedelta(days=days)
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time(hour)))
+
+    def create_customer(self, index, created_at):
+        customer = Customer.objects.create(
+            user=self.user, first_name='Rollup', last_name=str(index), email=f'rollup{index}@example.com',
+            phone=f'+254766{index:06d}'
+        )
+        Customer.objects.filter(pk=customer.pk).update(created_at=created_at)
+
+    def rows(self):
+        return list(SystemStats.objects.order_by('date').values_list(*self.FIELDS))
+
+    def test_incremental_runs_agree_with_a_backfill(self):
+        self.create_customer(0, self.at(0, 10))
+        self.assertEqual(len(rollup_system_stats(now=self.at(0, 12))), 1)
+
+        self.create_customer(1, self.at(0, 20))
+        self.create_customer(2, self.at(1, 8))
+        project = Project.objects.create(user=self.user, name='Fit-out')
+        Project.objects.filter(pk=project.pk).update(created_at=self.at(1, 9))
+        Payment.objects.create(
+            user=self.user, amount=Decimal('1200.00'), status='completed', payment_method='cash',
+            reference='ROLLUP1', completed_at=self.at(1, 9)
+        )
+        # The window crosses midnight, so both days' rows are written.
+        self.assertEqual(len(rollup_system_stats(now=self.at(1, 12))), 2)
+        self.assertEqual(rollup_system_stats(now=self.at(1, 12)), [])
+
+        incremental = self.rows()
+        self.assertEqual(incremental, [
+            (self.day, 2, 0, Decimal('0.00'), 2),
+            (self.day + datetime.timedelta(days=1), 3, 1, Decimal('1200.00'), 1),
+        ])
+        backfill_system_stats(self.day, self.day + datetime.timedelta(days=1), workers=1)
+        self.assertEqual(self.rows(), incremental)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class WidgetTests(TestCase):
+    def setUp(self):
+        get_dashboard_cache().clear()
+        self.user = User.objects.create_user('widgets')
+        for index, (amount, method, status) in enumerate([
+            ('100.00', 'mpesa', 'completed'), ('250.00', 'mpesa', 'completed'),
+            ('40.00', 'cash', 'completed'), ('999.00', 'mpesa', 'failed'),
+        ]):
+            Payment.objects.create(
+                user=self.user, amount=Decimal(amount), payment_method=method, status=status, reference=f'WIDGET{index}'
+            )
+        Payment.objects.create(
+            user=User.objects.create_user('other'), amount=Decimal('5000.00'), payment_method='mpesa',
+            status='completed', reference='ELSEWHERE'
+        )
+
+    def test_definitions_resolve_to_queries(self):
+        completed = {'source': 'payments', 'filters': {'status': 'completed'}}
+        revenue = resolve_definition(self.user, 'metric', {**completed, 'metric': 'sum:amount'})
+        self.assertEqual(revenue, {'value': 390.0})
+        self.assertEqual(
+            resolve_definition(self.user, 'chart', {**completed, 'group_by': 'payment_method'}),
+            {'labels': ['cash', 'mpesa'], 'values': [1, 2]}
+        )
+        table = resolve_definition(self.user, 'table', {
+            'source': 'payments', 'fields': ['reference', 'amount'], 'order_by': '-amount', 'limit': 2
+        })
+        self.assertEqual(table['rows'], [
+            {'reference': 'WIDGET3', 'amount': 999.0}, {'reference': 'WIDGET1', 'amount': 250.0}
+        ])
+
+    def test_configurations_outside_the_whitelist_are_errors(self):
+        for widget_type, configuration in [
+            ('metric', {'source': 'users'}),
+            ('metric', {'source': 'payments', 'filters': {'user__username': 'admin'}}),
+            ('metric', {'source': 'payments', 'metric': 'sum:reference'}),
+            ('table', {'source': 'customers', 'fields': ['notes']}),
+            ('map', {'source': 'payments'}),
+            ('gauge', {}),
+        ]:
+            with self.subTest(widget_type=widget_type, configuration=configuration):
+                self.assertIn('error', resolve_definition(self.user, widget_type, configuration))
+
+    def test_results_are_cached_until_the_data_changes(self):
+        configuration = {'source': 'payments', 'metric': 'sum:amount'}
+        widgets = [
+            DashboardWidget.objects.create(user=self.user, name=name, widget_type='metric', configuration=configuration)
+            for name in ['Revenue', 'Revenue again']
+        ]
+        with self.assertNumQueries(1):
+            results = resolve_widgets(self.user, widgets)
+        self.assertEqual([results[widget.id] for widget in widgets], [({'value': 1389.0}, False)] * 2)
+        with self.assertNumQueries(0):
+            results = resolve_widgets(self.user, widgets)
+        self.assertTrue(all(cached for _, cached in results.values()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(
+                user=self.user, amount=Decimal('11.00'), payment_method='cash', reference='WIDGET9'
+            )
+        self.assertEqual(resolve_widgets(self.user, widgets[:1])[widgets[0].id], ({'value': 1400.0}, False))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class NotificationCounterTests(TestCase):
+    def setUp(self):
+        get_dashboard_cache().clear()
+        self.users = [User.objects.create_user(f'notified{index}') for index in range(3)]
+
+    def test_bulk_fan_out_updates_counters_summaries_and_streams(self):
+        for user in self.users:
+            self.assertEqual(get_unread_count(user.pk), 0)
+        versions = [get_data_versions(user.pk)[0] for user in self.users]
+
+        with mock.patch('dashboard.notifications.publish_on_commit') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            created = notify_users([user.pk for user in self.users], 'Report ready', 'Open it', batch_size=2)
+
+        self.assertEqual(created, 3)
+        self.assertEqual(publish.call_count, 3)
+        for user, version in zip(self.users, versions):
+            self.assertEqual(get_dashboard_cache().get(unread_cache_key(user.pk)), 1)
+            self.assertNotEqual(get_data_versions(user.pk)[0], version)
+
+    def test_mark_read_counts_once(self):
+        user = self.users[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = notify_user(user, 'Follow up', 'Call back')
+            notify_user(user, 'Follow up', 'Send the quote')
+        self.assertEqual(get_unread_count(user.pk), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(mark_read(user, notification.pk))
+            self.assertFalse(mark_read(user, notification.pk))
+        self.assertEqual(get_unread_count(user.pk), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_all_read(user), 1)
+        self.assertEqual(get_unread_count(user.pk), 0)
+        self.assertEqual(get_unread_count(user.pk), Notification.objects.filter(user=user, is_read=False).count())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class NotificationArchiveTests(TestCase):
+    def setUp(self):
+        get_dashboard_cache().clear()
+        self.users = [User.objects.create_user(f'archived{index}') for index in range(2)]
+        notify_users([user.pk for user in self.users] * 5, 'Weekly report', 'Ready')
+        Notification.objects.filter(pk__in=Notification.objects.order_by('created_at', 'id').values('pk')[:6]).update(
+            is_read=True
+        )
+        Notification.objects.update(created_at=timezone.now() - datetime.timedelta(days=200))
+
+    def test_moves_old_read_notifications_once_per_user_per_batch(self):
+        unread = [get_unread_count(user.pk) for user in self.users]
+        with mock.patch('dashboard.signals.publish_on_commit') as row_publish, \
+                mock.patch('dashboard.notifications.publish_on_commit') as batch_publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            archived = archive_notifications(older_than_days=90, batch_size=4)
+
+        self.assertEqual(archived, 6)
+        self.assertEqual(NotificationArchive.objects.count(), 6)
+        self.assertFalse(Notification.objects.filter(is_read=True).exists())
+        self.assertEqual(Notification.objects.count(), 4)
+        row_publish.assert_not_called()
+        # Two batches of four and two rows, each touching both users at most once.
+        self.assertLessEqual(batch_publish.call_count, 4)
+        self.assertEqual([get_unread_count(user.pk) for user in self.users], unread)
+
+    def test_recent_notifications_stay(self):
+        self.assertEqual(archive_notifications(older_than_days=365), 0)
+        self.assertEqual(Notification.objects.count(), 10)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class NotificationInboxTests(TestCase):
+    def test_pages_are_newest_first_without_repeats(self):
+        user = User.objects.create_user('inbox')
+        notify_users([user.pk] * 5, 'Reminder', 'Due today')
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = get_inbox_page(user, cursor=cursor, limit=2)
+            seen.extend(row['id'] for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(
+            seen, list(Notification.objects.filter(user=user).order_by('-created_at', '-id').values_list('id', flat=True))
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        get_dashboard_cache().clear()
+        self.user = User.objects.create_user('streamer')
+        self.broker = LocalBroker()
+        patcher = mock.patch('dashboard.events._broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def frame(self, chunk):
+        event, data = chunk.strip().split('\n')
+        return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    def test_stream_sends_notifications_and_changed_stats(self):
+        stream = stream_events(self.user)
+        self.assertEqual(next(stream), 'retry: 5000\n\n')
+        event, stats = self.frame(next(stream))
+        self.assertEqual((event, stats['month_customers'], stats['unread_count']), ('dashboard-update', 0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(
+                user=self.user, first_name='Live', last_name='Update', email='live@example.com', phone='+254755000001'
+            )
+            notify_user(self.user, 'New lead', 'Call them')
+        self.assertEqual(self.frame(next(stream))[0], 'notification')
+        self.assertEqual(self.frame(next(stream)), ('dashboard-update', {'month_customers': 1, 'unread_count': 1}))
+
+        stream.close()
+        self.assertFalse(self.broker._subscribers)
+
+    def test_stream_is_off_unless_enabled(self):
+        request = RequestFactory().get('/dashboard/events/')
+        request.user = self.user
+        with self.settings(DASHBOARD_STREAM_ENABLED=False):
+            self.assertEqual(views.event_stream(request).status_code, 404)
+        with self.settings(DASHBOARD_STREAM_ENABLED=True):
+            response = views.event_stream(request)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            response.close()
@@ -10,7 +10,10 @@ urlpatterns = [
     path('', views.dashboard_index, name='index'),
     path('analytics/', views.DashboardAnalyticsView.as_view(), name='analytics'),
     path('api/dashboard-data/', views.get_dashboard_data, name='dashboard-data'),
+    path('api/stream/', views.event_stream, name='event-stream'),
+    path('api/notifications/', views.notification_inbox, name='notification-inbox'),
     path('notifications/<uuid:notification_id>/mark-read/', views.mark_notification_read, name='mark-notification-read'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark-all-notifications-read'),
+    path('widgets/data/', views.widgets_data, name='widgets-data'),
     path('widgets/<uuid:widget_id>/data/', views.widget_data, name='widget-data'),
 ]
\ No newline at end of file
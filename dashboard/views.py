@@ -2,138 +2,80 @@
 Dashboard views for DataLinkCRM.
 Comprehensive dashboard with widgets, analytics, and quick actions.
 """
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.db.models import Count, Sum, Avg, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Sum, Avg, Q, F
 from django.utils import timezone
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
 from django.views.generic import TemplateView
 from django.core.paginator import Paginator
 from django.utils.decorators import method_decorator
 import json
 import datetime
+import time
 
 from .models import DashboardWidget, SystemStats, QuickAction, Notification
 from customers.models import Customer
 from projects.models import Project
 from payments.models import Payment
 from subscriptions.models import Subscription
+from analytics.models import DailyCustomerRollup, DailyPaymentRollup
+from .summary import get_dashboard_summary, get_dashboard_etag
+from .events import stream_events
+from .notifications import mark_read, mark_all_read, get_unread_count, get_inbox_page
+from core.pagination import InvalidCursor
+from .widget_resolvers import DEFAULT_CACHE_TTL, resolve_widgets
+
+def dashboard_data_etag(request, *args, **kwargs):
+    """ETag for the dashboard JSON endpoints, read from the cache only."""
+    return get_dashboard_etag(request.user)
+
+def widget_data_etag(request, *args, **kwargs):
+    """
+    ETag for the widget endpoints. Widget results also move with the clock
+    (period_days windows, upcoming calendar events), so the tag turns over
+    every DEFAULT_CACHE_TTL seconds as well as when the user's data changes.
+    """
+    return f"{get_dashboard_etag(request.user)}-{int(time.time()) // DEFAULT_CACHE_TTL}"
 
 @login_required
 def dashboard_index(request):
     """Main dashboard view with comprehensive overview."""
-    
-    # Get system statistics
-    try:
-        latest_stats = SystemStats.objects.latest('date')
-    except SystemStats.DoesNotExist:
-        # Create default stats if none exist
-        latest_stats = SystemStats.objects.create(
-            total_customers=0,
-            total_projects=0,
-            total_revenue=0.00,
-            active_subscriptions=0
-        )
-    
-    # Get user's custom widgets
-    user_widgets = DashboardWidget.objects.filter(
-        user=request.user, 
-        is_active=True
-    ).order_by('position')
-    
-    # Get user's quick actions
-    quick_actions = QuickAction.objects.filter(
-        user=request.user, 
-        is_active=True
-    ).order_by('position')[:8]
-    
-    # Get recent notifications
-    notifications = Notification.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:5]
-    
-    # Unread notifications count
-    unread_count = notifications.filter(is_read=False).count()
-    
-    # Recent activity data
-    recent_customers = Customer.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:5]
-    
-    recent_projects = Project.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:5]
-    
-    recent_payments = Payment.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:5]
-    
-    # Calculate additional metrics
-    current_month = timezone.now().replace(day=1)
-    month_customers = Customer.objects.filter(
-        user=request.user,
-        created_at__gte=current_month
-    ).count()
-    
-    month_revenue = Payment.objects.filter(
-        user=request.user,
-        status='completed',
-        created_at__gte=current_month
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    active_projects = Project.objects.filter(
-        user=request.user,
-        status__in=['in_progress', 'planning']
-    ).count()
+    summary = get_dashboard_summary(request.user)
     
     context = {
         'title': 'Dashboard',
-        'stats': latest_stats,
-        'user_widgets': user_widgets,
-        'quick_actions': quick_actions,
-        'notifications': notifications,
-        'unread_count': unread_count,
-        'recent_customers': recent_customers,
-        'recent_projects': recent_projects,
-        'recent_payments': recent_payments,
-        'month_customers': month_customers,
-        'month_revenue': month_revenue,
-        'active_projects': active_projects,
+        'stats': summary['stats'],
+        'user_widgets': summary['user_widgets'],
+        'quick_actions': summary['quick_actions'],
+        'notifications': summary['notifications'],
+        'unread_count': summary['unread_count'],
+        'recent_customers': summary['recent_customers'][:5],
+        'recent_projects': summary['recent_projects'][:5],
+        'recent_payments': summary['recent_payments'][:5],
+        'month_customers': summary['month_customers'],
+        'month_revenue': summary['month_revenue'],
+        'active_projects': summary['active_projects'],
         'current_date': timezone.now(),
+        'stream_enabled': settings.DASHBOARD_STREAM_ENABLED,
+        'poll_interval': settings.DASHBOARD_POLL_INTERVAL,
     }
     
     return render(request, 'dashboard/index.html', context)
 
 @login_required
 @require_http_methods(["GET"])
+@condition(etag_func=dashboard_data_etag)
 def get_dashboard_data(request):
     """API endpoint to get dashboard data in JSON format."""
-    
-    # Get statistics
-    try:
-        latest_stats = SystemStats.objects.latest('date')
-    except SystemStats.DoesNotExist:
-        latest_stats = None
-    
-    # Recent activity
-    recent_customers = Customer.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:10]
-    
-    recent_projects = Project.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:10]
-    
-    recent_payments = Payment.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:10]
-    
-    # Unread notifications
-    unread_notifications = Notification.objects.filter(
-        user=request.user,
-        is_read=False
-    ).count()
+    summary = get_dashboard_summary(request.user)
+    latest_stats = summary['stats']
+    recent_customers = summary['recent_customers']
+    recent_projects = summary['recent_projects']
+    recent_payments = summary['recent_payments']
+    unread_notifications = summary['unread_count']
     
     data = {
         'stats': {
@@ -142,6 +84,11 @@ def get_dashboard_data(request):
             'total_revenue': float(latest_stats.total_revenue) if latest_stats else 0,
             'active_subscriptions': latest_stats.active_subscriptions if latest_stats else 0,
         },
+        'metrics': {
+            'month_customers': summary['month_customers'],
+            'month_revenue': float(summary['month_revenue']),
+            'active_projects': summary['active_projects'],
+        },
         'recent_customers': [
             {
                 'id': customer.id,
@@ -176,47 +123,129 @@ def get_dashboard_data(request):
     
     return JsonResponse(data)
 
+# Largest inbox page served.
+INBOX_MAX_LIMIT = 100
+
+@login_required
+@require_http_methods(["GET"])
+def notification_inbox(request):
+    """Get a page of the user's notifications, newest first."""
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), INBOX_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    try:
+        notifications, next_cursor = get_inbox_page(
+            request.user,
+            cursor=request.GET.get('cursor'),
+            limit=limit,
+            unread_only=request.GET.get('unread') in ('1', 'true')
+        )
+    except InvalidCursor as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    return JsonResponse({
+        'notifications': [
+            dict(notification, id=str(notification['id']), created_at=notification['created_at'].isoformat())
+            for notification in notifications
+        ],
+        'next_cursor': next_cursor,
+        'unread_count': get_unread_count(request.user.pk),
+    })
+
 @login_required
 @require_http_methods(["POST"])
 def mark_notification_read(request, notification_id):
     """Mark a notification as read."""
-    notification = get_object_or_404(Notification, id=notification_id, user=request.user)
-    notification.is_read = True
-    notification.save()
+    if not mark_read(request.user, notification_id):
+        # Already read, or not the user's notification.
+        get_object_or_404(Notification, id=notification_id, user=request.user)
     
     return JsonResponse({
         'success': True,
-        'message': 'Notification marked as read'
+        'message': 'Notification marked as read',
+        'unread_count': get_unread_count(request.user.pk)
     })
 
 @login_required
 @require_http_methods(["POST"])
 def mark_all_notifications_read(request):
     """Mark all notifications as read."""
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    mark_all_read(request.user)
     
     return JsonResponse({
         'success': True,
-        'message': 'All notifications marked as read'
+        'message': 'All notifications marked as read',
+        'unread_count': get_unread_count(request.user.pk)
     })
 
 @login_required
 @require_http_methods(["GET"])
+@condition(etag_func=widget_data_etag)
 def widget_data(request, widget_id):
     """Get data for a specific widget."""
     widget = get_object_or_404(DashboardWidget, id=widget_id, user=request.user)
+    data, cached = resolve_widgets(request.user, [widget])[widget.id]
     
-    # This would be expanded based on widget type
     widget_data = {
         'id': str(widget.id),
         'name': widget.name,
         'type': widget.widget_type,
-        'data': widget.configuration,
+        'configuration': widget.configuration,
+        'data': data,
+        'cached': cached,
         'created_at': widget.created_at.isoformat(),
     }
     
     return JsonResponse(widget_data)
 
+@login_required
+@require_http_methods(["GET"])
+@condition(etag_func=widget_data_etag)
+def widgets_data(request):
+    """Get data for all of the user's active widgets in one request."""
+    widgets = list(DashboardWidget.objects.filter(
+        user=request.user,
+        is_active=True
+    ).order_by('position'))
+    results = resolve_widgets(request.user, widgets)
+    
+    return JsonResponse({
+        'widgets': [
+            {
+                'id': str(widget.id),
+                'name': widget.name,
+                'type': widget.widget_type,
+                'position': widget.position,
+                'data': results[widget.id][0],
+                'cached': results[widget.id][1],
+            }
+            for widget in widgets
+        ],
+        'last_updated': timezone.now().isoformat(),
+    })
+
+@login_required
+@require_http_methods(["GET"])
+def event_stream(request):
+    """
+    Server-Sent Events stream of live dashboard updates.
+    
+    Each stream holds a worker open, so it is off unless
+    DASHBOARD_STREAM_ENABLED is set (see core.settings).
+    """
+    if not settings.DASHBOARD_STREAM_ENABLED:
+        return JsonResponse({'error': 'The dashboard event stream is disabled'}, status=404)
+    
+    response = StreamingHttpResponse(stream_events(request.user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# Longest period the analytics view will chart, in days.
+ANALYTICS_MAX_DAYS = 730
+
 class DashboardAnalyticsView(TemplateView):
     """Dashboard analytics view with advanced charts and metrics."""
     template_name = 'dashboard/analytics.html'
@@ -229,29 +258,36 @@ class DashboardAnalyticsView(TemplateView):
         context = super().get_context_data(**kwargs)
         
         # Time period filter (default to last 30 days)
-        days = int(self.request.GET.get('days', 30))
-        start_date = timezone.now() - datetime.timedelta(days=days)
+        try:
+            days = int(self.request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        days = min(max(days, 1), ANALYTICS_MAX_DAYS)
+        start_date = timezone.localdate() - datetime.timedelta(days=days)
         
         # Customer analytics
-        customers_over_time = Customer.objects.filter(
+        customers_over_time = DailyCustomerRollup.objects.filter(
             user=self.request.user,
-            created_at__gte=start_date
-        ).extra(
-            select={'day': 'date(created_at)'}
-        ).values('day').annotate(
-            count=Count('id')
-        ).order_by('day')
+            date__gte=start_date
+        ).annotate(
+            day=F('date'),
+            count=F('new_customers')
+        ).values('day', 'count').order_by('day')
         
         # Revenue analytics
-        revenue_over_time = Payment.objects.filter(
+        completed_payments = DailyPaymentRollup.objects.filter(
             user=self.request.user,
             status='completed',
-            created_at__gte=start_date
-        ).extra(
-            select={'day': 'date(created_at)'}
-        ).values('day').annotate(
-            total=Sum('amount')
-        ).order_by('day')
+            date__gte=start_date
+        )
+        revenue_over_time = completed_payments.values('date').annotate(
+            day=F('date'),
+            total=Sum('total_amount')
+        ).values('day', 'total').order_by('day')
+        
+        revenue_by_currency = completed_payments.values('currency').annotate(
+            total=Sum('total_amount')
+        ).order_by('currency')
         
         # Project status distribution
         project_status_dist = Project.objects.filter(
@@ -261,17 +297,18 @@ class DashboardAnalyticsView(TemplateView):
         )
         
         # Payment method distribution
-        payment_method_dist = Payment.objects.filter(
+        payment_method_dist = DailyPaymentRollup.objects.filter(
             user=self.request.user
         ).values('payment_method').annotate(
-            count=Count('id')
-        )
+            count=Sum('count')
+        ).order_by('payment_method')
         
         context.update({
             'title': 'Analytics',
             'days': days,
             'customers_over_time': list(customers_over_time),
             'revenue_over_time': list(revenue_over_time),
+            'revenue_by_currency': list(revenue_by_currency),
             'project_status_dist': list(project_status_dist),
             'payment_method_dist': list(payment_method_dist),
         })
@@ -0,0 +1,350 @@
+"""
+Widget data engine for DataLinkCRM.
+
+Turns a DashboardWidget's ``configuration`` into an ORM query according to
+its ``widget_type``. Only whitelisted sources, fields and lookups are
+accepted. A configuration looks like::
+
+    {
+        "source": "payments",           # customers, projects, payments, subscriptions, notifications
+        "filters": {"status": "completed", "payment_method__in": ["mpesa"]},
+        "period_days": 30,              # only rows created in the last N days
+        "metric": "sum:amount",         # count, sum:<field> or avg:<field>
+        "group_by": "payment_method",   # chart and map widgets
+        "fields": ["reference", "amount"],  # table and list widgets
+        "order_by": "-created_at",
+        "limit": 10,
+        "date_field": "start_date",     # calendar widgets
+        "cache_ttl": 300
+    }
+
+Results are cached per user under a key built from the canonical definition
+and the user's dashboard data version (see dashboard.summary), so any write
+to the user's data retires every cached widget result, identical widget
+definitions share one entry, and ``cache_ttl`` only bounds how long an
+unchanged result is kept.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import uuid
+from decimal import Decimal
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+from django.db.models import Count, Sum, Avg
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Notification
+from .summary import get_dashboard_cache, get_data_versions
+from customers.models import Customer
+from projects.models import Project
+from payments.models import Payment
+from subscriptions.models import Subscription
+
+logger = logging.getLogger(__name__)
+
+WIDGET_CACHE_KEY = 'dashboard:widget:{user_id}:{version}:{digest}'
+
+DEFAULT_CACHE_TTL = 300
+MAX_CACHE_TTL = 86400
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+SOURCES = {
+    'customers': {
+        'model': Customer,
+        'fields': ['customer_id', 'first_name', 'last_name', 'email', 'phone', 'status',
+                   'customer_type', 'city', 'county', 'company_name', 'industry', 'created_at'],
+        'filters': ['status', 'customer_type', 'gender', 'city', 'county', 'country', 'industry'],
+        'numeric': [],
+        'dates': ['created_at', 'last_contacted'],
+        'title': 'customer_id',
+    },
+    'projects': {
+        'model': Project,
+        'fields': ['name', 'status', 'priority', 'start_date', 'end_date', 'budget', 'created_at'],
+        'filters': ['status', 'priority'],
+        'numeric': ['budget'],
+        'dates': ['created_at', 'start_date', 'end_date'],
+        'title': 'name',
+    },
+    'payments': {
+        'model': Payment,
+        'fields': ['reference', 'amount', 'currency', 'status', 'payment_method', 'created_at', 'completed_at'],
+        'filters': ['status', 'payment_method', 'currency'],
+        'numeric': ['amount'],
+        'dates': ['created_at', 'completed_at'],
+        'title': 'reference',
+    },
+    'subscriptions': {
+        'model': Subscription,
+        'fields': ['plan', 'status', 'amount', 'currency', 'billing_cycle', 'start_date', 'end_date', 'created_at'],
+        'filters': ['plan', 'status', 'currency', 'billing_cycle', 'auto_renew'],
+        'numeric': ['amount'],
+        'dates': ['created_at', 'start_date', 'end_date'],
+        'title': 'plan',
+    },
+    'notifications': {
+        'model': Notification,
+        'fields': ['title', 'message', 'priority', 'is_read', 'action_url', 'created_at'],
+        'filters': ['priority', 'is_read'],
+        'numeric': [],
+        'dates': ['created_at'],
+        'title': 'title',
+    },
+}
+
+AGGREGATES = {'sum': Sum, 'avg': Avg}
+
+
+class WidgetConfigError(ValueError):
+    """Raised when a widget configuration cannot be turned into a query."""
+
+
+def canonical_definition(widget_type, configuration):
+    """Return a stable JSON encoding of a widget definition."""
+    return json.dumps([widget_type, configuration or {}], sort_keys=True, separators=(',', ':'), default=str)
+
+
+def get_cache_ttl(configuration):
+    try:
+        ttl = int((configuration or {}).get('cache_ttl', DEFAULT_CACHE_TTL))
+    except (TypeError, ValueError):
+        ttl = DEFAULT_CACHE_TTL
+    return min(max(ttl, 1), MAX_CACHE_TTL)
+
+
+@lru_cache(maxsize=1024)
+def compile_definition(definition):
+    """
+    Validate a canonical widget definition and return ``(widget_type, spec)``.
+
+    Memoized on the definition text, so identical widgets across users are
+    only parsed and validated once per process.
+    """
+    widget_type, configuration = json.loads(definition)
+    if not isinstance(configuration, dict):
+        raise WidgetConfigError('configuration must be an object')
+    try:
+        return widget_type, _compile_spec(configuration)
+    except (AttributeError, TypeError):
+        raise WidgetConfigError('Malformed widget configuration')
+
+
+def _compile_spec(configuration):
+    source_name = configuration.get('source', 'customers')
+    source = SOURCES.get(source_name)
+    if source is None:
+        raise WidgetConfigError(f"Unknown source '{source_name}'")
+
+    filters = {}
+    for lookup, value in (configuration.get('filters') or {}).items():
+        field, _, operator = lookup.partition('__')
+        if field not in source['filters'] or operator not in ('', 'in'):
+            raise WidgetConfigError(f"Filter '{lookup}' is not allowed on {source_name}")
+        if operator == 'in' and not isinstance(value, list):
+            raise WidgetConfigError(f"Filter '{lookup}' needs a list")
+        model_field = source['model']._meta.get_field(field)
+        try:
+            if operator == 'in':
+                filters[lookup] = [model_field.to_python(item) for item in value]
+            else:
+                filters[lookup] = model_field.to_python(value)
+        except ValidationError:
+            raise WidgetConfigError(f"Filter '{lookup}' has an invalid value")
+
+    metric = configuration.get('metric', 'count')
+    aggregate, _, metric_field = metric.partition(':')
+    if metric != 'count' and (aggregate not in AGGREGATES or metric_field not in source['numeric']):
+        raise WidgetConfigError(f"Metric '{metric}' is not available on {source_name}")
+
+    group_by = configuration.get('group_by')
+    if group_by is not None and group_by != 'date' and group_by not in source['filters']:
+        raise WidgetConfigError(f"Cannot group {source_name} by '{group_by}'")
+
+    fields = configuration.get('fields') or source['fields'][:4]
+    unknown = [field for field in fields if field not in source['fields']]
+    if unknown:
+        raise WidgetConfigError(f"Unknown fields for {source_name}: {', '.join(unknown)}")
+
+    order_by = configuration.get('order_by', '-created_at')
+    if order_by.lstrip('-') not in source['fields']:
+        raise WidgetConfigError(f"Cannot order {source_name} by '{order_by}'")
+
+    date_field = configuration.get('date_field', source['dates'][0])
+    if date_field not in source['dates']:
+        raise WidgetConfigError(f"'{date_field}' is not a date field of {source_name}")
+
+    try:
+        limit = min(max(int(configuration.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        period_days = configuration.get('period_days')
+        period_days = int(period_days) if period_days is not None else None
+    except (TypeError, ValueError):
+        raise WidgetConfigError('limit and period_days must be integers')
+
+    return {
+        'source': source_name,
+        'filters': filters,
+        'metric': metric,
+        'group_by': group_by,
+        'fields': tuple(fields),
+        'order_by': order_by,
+        'date_field': date_field,
+        'limit': limit,
+        'period_days': period_days,
+    }
+
+
+def _queryset(user, spec):
+    source = SOURCES[spec['source']]
+    queryset = source['model'].objects.filter(user=user, **spec['filters'])
+    if spec['period_days']:
+        queryset = queryset.filter(created_at__gte=timezone.now() - datetime.timedelta(days=spec['period_days']))
+    return queryset
+
+
+def _aggregate_expression(spec):
+    if spec['metric'] == 'count':
+        return Count('pk')
+    aggregate, _, field = spec['metric'].partition(':')
+    return AGGREGATES[aggregate](field)
+
+
+def _grouped(queryset, spec, default_group):
+    group_by = spec['group_by'] or default_group
+    if group_by == 'date':
+        queryset = queryset.annotate(date=TruncDate('created_at'))
+    rows = queryset.order_by().values(group_by).annotate(value=_aggregate_expression(spec)).order_by(group_by)
+    return {
+        'labels': [row[group_by] for row in rows],
+        'values': [row['value'] for row in rows],
+    }
+
+
+def resolve_metric(user, spec):
+    return {'value': _queryset(user, spec).aggregate(value=_aggregate_expression(spec))['value'] or 0}
+
+
+def resolve_chart(user, spec):
+    return _grouped(_queryset(user, spec), spec, 'date')
+
+
+def resolve_map(user, spec):
+    if spec['source'] != 'customers':
+        raise WidgetConfigError('Map widgets read customers')
+    return _grouped(_queryset(user, spec), spec, 'county')
+
+
+def resolve_table(user, spec):
+    rows = _queryset(user, spec).order_by(spec['order_by']).values(*spec['fields'])[:spec['limit']]
+    return {'columns': list(spec['fields']), 'rows': list(rows)}
+
+
+def resolve_list(user, spec):
+    title_field = SOURCES[spec['source']]['title']
+    fields = [field for field in spec['fields'] if field != title_field]
+    items = _queryset(user, spec).order_by(spec['order_by']).values('pk', title_field, *fields)[:spec['limit']]
+    return {'items': [
+        {
+            'id': item.pop('pk'),
+            'title': item.pop(title_field),
+            'details': item,
+        }
+        for item in items
+    ]}
+
+
+def resolve_calendar(user, spec):
+    date_field = spec['date_field']
+    title_field = SOURCES[spec['source']]['title']
+    queryset = _queryset(user, spec).exclude(**{f'{date_field}__isnull': True})
+    today = timezone.localdate()
+    if date_field in ('start_date', 'end_date'):
+        queryset = queryset.filter(**{f'{date_field}__gte': today})
+    else:
+        queryset = queryset.filter(**{f'{date_field}__date__gte': today})
+    events = queryset.order_by(date_field).values('pk', title_field, date_field)[:spec['limit']]
+    return {'events': [
+        {'id': event['pk'], 'title': event[title_field], 'date': event[date_field]}
+        for event in events
+    ]}
+
+
+RESOLVERS = {
+    'metric': resolve_metric,
+    'chart': resolve_chart,
+    'table': resolve_table,
+    'map': resolve_map,
+    'calendar': resolve_calendar,
+    'list': resolve_list,
+}
+
+
+def _jsonable(value):
+    """Make resolver output JSON-safe (and cheap to pickle)."""
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def resolve_definition(user, widget_type, configuration):
+    """Resolve one widget definition without caching."""
+    try:
+        compiled_type, spec = compile_definition(canonical_definition(widget_type, configuration))
+        resolver = RESOLVERS.get(compiled_type)
+        if resolver is None:
+            raise WidgetConfigError(f"Unknown widget type '{compiled_type}'")
+        return _jsonable(resolver(user, spec))
+    except WidgetConfigError as exc:
+        return {'error': str(exc)}
+
+
+def resolve_widgets(user, widgets):
+    """
+    Resolve several of a user's widgets, returning ``{widget.id: (data, cached)}``.
+
+    All cache entries are fetched with one get_many; each distinct definition
+    that missed is resolved once and stored with its own TTL. A widget whose
+    query fails gets an error entry, which is not cached, and the others
+    are still resolved.
+    """
+    cache = get_dashboard_cache()
+    version = get_data_versions(user.pk)[0]
+
+    keys = {}
+    for widget in widgets:
+        digest = hashlib.sha1(
+            canonical_definition(widget.widget_type, widget.configuration).encode()
+        ).hexdigest()
+        keys[widget.id] = WIDGET_CACHE_KEY.format(user_id=user.pk, version=version, digest=digest)
+
+    cached = cache.get_many(set(keys.values()))
+    resolved = {}
+    results = {}
+    for widget in widgets:
+        key = keys[widget.id]
+        if key in cached:
+            results[widget.id] = (cached[key], True)
+            continue
+        if key not in resolved:
+            try:
+                resolved[key] = resolve_definition(user, widget.widget_type, widget.configuration)
+            except (DatabaseError, ValidationError, ValueError, TypeError):
+                logger.exception('Could not resolve dashboard widget %s', widget.id)
+                resolved[key] = {'error': 'This widget could not be loaded'}
+            else:
+                cache.set(key, resolved[key], get_cache_ttl(widget.configuration))
+        results[widget.id] = (resolved[key], False)
+    return results
@@ -0,0 +1,36 @@
+"""
+Payment list filters for DataLinkCRM.
+"""
+from .models import Payment
+
+STATUS_VALUES = {value for value, _ in Payment.STATUS_CHOICES}
+METHOD_VALUES = {value for value, _ in Payment.PAYMENT_METHOD_CHOICES}
+
+
+def filter_payments(queryset, params, user=None):
+    """
+    Apply the list filters in ``params`` (a QueryDict or dict) to ``queryset``.
+
+    Supported filters are ``status``, ``method`` and ``currency``; unknown
+    status and method values are ignored. ``user`` is unused; it keeps the
+    signature of filter_customers(). Returns the filtered queryset and the
+    dict of filters that were applied.
+    """
+    applied = {}
+
+    status = params.get('status', '').strip()
+    if status in STATUS_VALUES:
+        queryset = queryset.filter(status=status)
+        applied['status'] = status
+
+    method = params.get('method', '').strip()
+    if method in METHOD_VALUES:
+        queryset = queryset.filter(payment_method=method)
+        applied['method'] = method
+
+    currency = params.get('currency', '').strip().upper()
+    if currency:
+        queryset = queryset.filter(currency=currency)
+        applied['currency'] = currency
+
+    return queryset, applied
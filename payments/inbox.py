@@ -0,0 +1,268 @@
+"""
+Payment callback inbox for DataLinkCRM.
+
+M-PESA callbacks and Stripe webhooks arrive in bursts. The receivers (see
+payments.views) only verify a request and append it to the PaymentEvent
+inbox, so the provider gets its acknowledgement at once. Providers retry
+deliveries; the inbox keeps one row per provider event ID and drops repeats
+on insert.
+
+drain_inbox() applies the inbox in batches: each batch resolves its
+payments with one query, works out the status transitions in memory and
+saves them with one bulk_update, and stamps the events processed with
+another. Concurrent drainers on PostgreSQL skip each other's locked rows.
+
+A callback can arrive before the transaction that recorded the payment's
+CheckoutRequestID commits, so an event that matches no payment is retried
+with a growing delay, up to PAYMENT_INBOX_MAX_ATTEMPTS times, before it is
+left unmatched. An M-PESA success is only applied if the amount paid equals
+the payment's amount.
+"""
+import datetime
+import logging
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .metadata import metadata_filter, metadata_update_fields, sync_metadata_columns
+from .models import Payment, PaymentEvent
+from .signals import payments_bulk_updated
+
+logger = logging.getLogger(__name__)
+
+# The statuses a payment may move to from each status. Anything else is a
+# stale or repeated event and is ignored; a success reported after a
+# timeout still counts.
+TRANSITIONS = {
+    'pending': {'processing', 'completed', 'failed', 'cancelled'},
+    'processing': {'completed', 'failed', 'cancelled'},
+    'failed': {'completed'},
+    'completed': {'refunded'},
+}
+
+# M-PESA result codes that mean the customer cancelled rather than failed.
+MPESA_CANCELLED_CODES = {1032}
+
+STRIPE_STATUSES = {
+    'payment_intent.processing': 'processing',
+    'payment_intent.succeeded': 'completed',
+    'payment_intent.payment_failed': 'failed',
+    'payment_intent.canceled': 'cancelled',
+    'charge.refunded': 'refunded',
+}
+
+# ``keys`` are (lookup, value) pairs tried in order to find the payment:
+# 'reference', 'checkout' (M-PESA CheckoutRequestID) or 'intent' (Stripe
+# PaymentIntent ID). ``amount`` is the amount the provider says was paid,
+# if it is checked.
+Transition = namedtuple('Transition', 'keys status completed_at metadata amount', defaults=(None,))
+
+
+def record_event(provider, event_id, event_type, payload):
+    """Append an event to the inbox; a repeat delivery of a stored event is dropped."""
+    PaymentEvent.objects.bulk_create(
+        [PaymentEvent(provider=provider, event_id=event_id, event_type=event_type, payload=payload)],
+        ignore_conflicts=True
+    )
+
+
+def mpesa_checkout_id(payload):
+    """Return the CheckoutRequestID an M-PESA callback or timeout refers to, or None."""
+    body = payload.get('Body') if isinstance(payload, dict) else None
+    callback = body.get('stkCallback') if isinstance(body, dict) else None
+    if isinstance(callback, dict):
+        return callback.get('CheckoutRequestID')
+    return payload.get('CheckoutRequestID') if isinstance(payload, dict) else None
+
+
+def _mpesa_transition(event):
+    checkout_id = mpesa_checkout_id(event.payload)
+    if event.event_type == 'timeout':
+        return Transition([('checkout', checkout_id)], 'failed', None, {'error': 'M-PESA request timed out'})
+
+    callback = event.payload['Body']['stkCallback']
+    code = int(callback.get('ResultCode', -1))
+    if code != 0:
+        status = 'cancelled' if code in MPESA_CANCELLED_CODES else 'failed'
+        return Transition([('checkout', checkout_id)], status, None, {'error': callback.get('ResultDesc', '')})
+
+    items = {
+        item.get('Name'): item.get('Value')
+        for item in (callback.get('CallbackMetadata') or {}).get('Item', [])
+        if isinstance(item, dict)
+    }
+    completed_at = None
+    if items.get('TransactionDate'):
+        try:
+            # Reported in Kenyan time as a number, e.g. 20261017143005.
+            completed_at = timezone.make_aware(
+                datetime.datetime.strptime(str(items['TransactionDate']), '%Y%m%d%H%M%S')
+            )
+        except ValueError:
+            pass
+    metadata = {'mpesa_receipt': items.get('MpesaReceiptNumber')}
+    if items.get('PhoneNumber'):
+        metadata['phone'] = str(items['PhoneNumber'])
+    amount = Decimal(str(items['Amount']))
+    return Transition([('checkout', checkout_id)], 'completed', completed_at, metadata, amount)
+
+
+def _stripe_transition(event):
+    status = STRIPE_STATUSES.get(event.event_type)
+    if status is None:
+        return None
+    obj = event.payload['data']['object']
+    intent_id = obj.get('payment_intent') if obj.get('object') == 'charge' else obj.get('id')
+    keys = []
+    reference = (obj.get('metadata') or {}).get('reference')
+    if reference:
+        keys.append(('reference', reference))
+    if intent_id:
+        keys.append(('intent', intent_id))
+    metadata = {'stripe_payment_intent_id': intent_id} if intent_id else {}
+    if status == 'failed':
+        error = obj.get('last_payment_error') or {}
+        metadata['error'] = error.get('message', '') if isinstance(error, dict) else ''
+    completed_at = None
+    if status == 'completed' and event.payload.get('created'):
+        completed_at = datetime.datetime.fromtimestamp(event.payload['created'], tz=datetime.timezone.utc)
+    return Transition(keys, status, completed_at, metadata)
+
+
+def parse_event(event):
+    """Return the Transition an inbox event asks for, or None if it asks for nothing."""
+    try:
+        if event.provider == 'mpesa':
+            return _mpesa_transition(event)
+        return _stripe_transition(event)
+    except (KeyError, TypeError, ValueError, AttributeError, InvalidOperation):
+        return None
+
+
+def _load_payments(transitions):
+    """Return ``{(lookup, value): payment}`` for every key in ``transitions``, from one query."""
+    values = {'reference': set(), 'checkout': set(), 'intent': set()}
+    for transition in transitions:
+        for lookup, value in transition.keys:
+            if value:
+                values[lookup].add(value)
+
+    condition = Q()
+    if values['reference']:
+        condition |= Q(reference__in=values['reference'])
+    if values['checkout']:
+        condition |= metadata_filter(Payment, 'checkout_request_id', list(values['checkout']))
+    if values['intent']:
+        condition |= metadata_filter(Payment, 'stripe_payment_intent_id', list(values['intent']))
+    if not condition:
+        return {}
+
+    payments = Payment.objects.filter(condition)
+    if connection.features.has_select_for_update:
+        payments = payments.select_for_update()
+    found = {}
+    for payment in payments:
+        found[('reference', payment.reference)] = payment
+        for lookup, key in (('checkout', 'checkout_request_id'), ('intent', 'stripe_payment_intent_id')):
+            if payment.metadata.get(key):
+                found[(lookup, payment.metadata[key])] = payment
+    return found
+
+
+def _retry_later(event, now):
+    """Put off an event that matched no payment; returns False once it is out of attempts."""
+    event.attempts += 1
+    if event.attempts >= settings.PAYMENT_INBOX_MAX_ATTEMPTS:
+        event.next_attempt_at = None
+        return False
+    delay = settings.PAYMENT_INBOX_RETRY_DELAY * 2 ** (event.attempts - 1)
+    event.next_attempt_at = now + datetime.timedelta(seconds=delay)
+    return True
+
+
+def process_batch(batch_size=None):
+    """Apply the oldest due inbox events; returns how many were looked at."""
+    batch_size = batch_size or settings.PAYMENT_INBOX_BATCH_SIZE
+    with transaction.atomic():
+        now = timezone.now()
+        events = PaymentEvent.objects.filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now), processed_at__isnull=True
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            events = events.select_for_update(skip_locked=True)
+        events = list(events[:batch_size])
+        if not events:
+            return 0
+
+        parsed = [(event, parse_event(event)) for event in events]
+        payments = _load_payments([transition for _, transition in parsed if transition])
+
+        changed = {}
+        previous_status = {}
+        for event, transition in parsed:
+            event.processed_at = now
+            if transition is None:
+                event.outcome = 'ignored: nothing to apply'
+                continue
+            payment = next((payments[key] for key in transition.keys if key in payments), None)
+            if payment is None:
+                if _retry_later(event, now):
+                    event.processed_at = None
+                    event.outcome = f'retrying: unmatched after {event.attempts} attempts'
+                else:
+                    event.outcome = 'unmatched'
+                continue
+
+            event.payment = payment
+            if transition.status not in TRANSITIONS.get(payment.status, ()):
+                event.outcome = f'ignored: {payment.status} to {transition.status}'
+                continue
+            if transition.amount is not None and transition.amount != payment.amount:
+                event.outcome = f'rejected: paid {transition.amount}, expected {payment.amount}'
+                logger.warning(
+                    'Payment %s: %s reported %s paid, expected %s',
+                    payment.reference, event.provider, transition.amount, payment.amount
+                )
+                continue
+            previous_status.setdefault(payment.pk, payment.status)
+            payment.status = transition.status
+            if transition.status == 'completed':
+                payment.completed_at = transition.completed_at or event.received_at
+            payment.metadata.update({key: value for key, value in transition.metadata.items() if value is not None})
+            payment.updated_at = now
+            sync_metadata_columns(payment)
+            changed[payment.pk] = payment
+            event.outcome = f'applied: {transition.status}'
+
+        if changed:
+            Payment.objects.bulk_update(
+                changed.values(),
+                ['status', 'completed_at', 'metadata', 'updated_at', *metadata_update_fields(Payment)],
+                batch_size=batch_size
+            )
+            payments_bulk_updated.send(
+                sender=Payment, payments=list(changed.values()), previous_status=previous_status
+            )
+        PaymentEvent.objects.bulk_update(
+            events, ['processed_at', 'attempts', 'next_attempt_at', 'payment', 'outcome'], batch_size=batch_size
+        )
+
+    unmatched = sum(1 for event in events if event.outcome == 'unmatched')
+    if unmatched:
+        logger.warning('%s payment events matched no payment', unmatched)
+    return len(events)
+
+
+def drain_inbox(batch_size=None):
+    """Process inbox batches until it is empty; returns the number of events processed."""
+    batch_size = batch_size or settings.PAYMENT_INBOX_BATCH_SIZE
+    processed = 0
+    while True:
+        count = process_batch(batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
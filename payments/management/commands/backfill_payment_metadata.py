@@ -0,0 +1,24 @@
+"""
+Copy hot Payment.metadata keys into their indexed columns.
+"""
+from django.core.management.base import BaseCommand
+
+from payments.metadata import backfill_metadata_columns, metadata_columns, BATCH_SIZE
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Fill the indexed metadata columns of existing payments (see PAYMENT_METADATA_COLUMNS).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Payments updated per statement.')
+
+    def handle(self, *args, **options):
+        columns = metadata_columns(Payment)
+        self.stdout.write(f"Backfilling {', '.join(f'{key} -> {column}' for key, column in columns.items())}")
+
+        def progress(done):
+            self.stdout.write(f'{done} payments done')
+
+        done = backfill_metadata_columns(Payment, batch_size=max(1, options['batch_size']), progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {done} payments.'))
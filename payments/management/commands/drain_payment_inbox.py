@@ -0,0 +1,31 @@
+"""
+Apply payment provider callbacks waiting in the inbox.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.inbox import drain_inbox
+
+
+class Command(BaseCommand):
+    help = 'Apply M-PESA and Stripe callbacks from the payment inbox in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the inbox once and exit.')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = drain_inbox(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} payment events.'))
+            return
+
+        self.stdout.write('Draining the payment inbox; press Ctrl+C to stop.')
+        try:
+            while True:
+                if not drain_inbox(options['batch_size']):
+                    time.sleep(settings.PAYMENT_INBOX_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
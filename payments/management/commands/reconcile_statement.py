@@ -0,0 +1,47 @@
+"""
+Reconcile an M-PESA or bank statement against the CRM's payments.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.reconciliation import reconcile_statement, ReconciliationError, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Reconcile a CSV or XLSX statement against a user\'s payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX statement.')
+        parser.add_argument('--user', required=True, help='Username whose payments are reconciled.')
+        parser.add_argument('--method', default='', help='Only match payments of this method, e.g. mpesa.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Statement lines matched per query.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user '{options['user']}'")
+
+        def progress(reconciliation):
+            self.stdout.write(f'{reconciliation.rows} lines read')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                reconciliation = reconcile_statement(
+                    user, file, options['path'],
+                    payment_method=options['method'],
+                    chunk_size=max(1, options['chunk_size']),
+                    progress=progress
+                )
+        except (OSError, ReconciliationError) as exc:
+            raise CommandError(str(exc))
+
+        for error in reconciliation.errors:
+            self.stderr.write(f"Row {error['row']}: {error['message']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciliation {reconciliation.pk}: {reconciliation.matched} matched, '
+            f'{reconciliation.amount_mismatched} amount mismatches, '
+            f'{reconciliation.missing_in_crm} missing in CRM, '
+            f'{reconciliation.missing_in_statement} missing in statement, '
+            f'{reconciliation.skipped} lines skipped.'
+        ))
@@ -0,0 +1,32 @@
+"""
+Serve a local mock of the M-PESA Daraja API.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.mock_daraja import MockDaraja
+
+
+class Command(BaseCommand):
+    help = 'Serve a local mock of the M-PESA Daraja API for development.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument(
+            '--callback-delay', type=float, default=2.0,
+            help='Seconds before the payment result is posted to the CallBackURL.'
+        )
+
+    def handle(self, *args, **options):
+        daraja = MockDaraja(host=options['host'], port=options['port'], callback_delay=options['callback_delay'])
+        daraja.start()
+        self.stdout.write(f'MPESA_AUTH_URL={daraja.auth_url}')
+        self.stdout.write(f'MPESA_ONLINEPAYMENT_URL={daraja.stk_push_url}')
+        self.stdout.write('Mock Daraja running; press Ctrl+C to stop.')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            daraja.stop()
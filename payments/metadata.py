@@ -0,0 +1,107 @@
+"""
+Indexed copies of hot Payment.metadata keys.
+
+Payment.metadata is free-form JSON, so filtering on a key inside it means
+extracting the key from every row. The keys that are looked up often
+(PAYMENT_METADATA_COLUMNS: M-PESA receipt and CheckoutRequestID, phone,
+Stripe PaymentIntent ID) are also copied into ordinary indexed columns.
+Payment.save() keeps the copies in step; code that writes metadata with
+bulk_update calls sync_metadata_columns() itself and saves the returned
+fields too. backfill_metadata_columns() fills the columns of existing rows
+in batches, straight from the JSON in the database.
+
+metadata_lookup() names a key for filter() or values_list(), using the
+column when the key has one, and metadata_filter() builds an IN lookup on
+it, so callers do not need to know which keys are indexed.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Q, Value
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import NullIf, Substr
+
+BATCH_SIZE = 1000
+
+
+def metadata_columns(model):
+    """Return ``{metadata key: column}`` from PAYMENT_METADATA_COLUMNS, checked against ``model``."""
+    columns = getattr(settings, 'PAYMENT_METADATA_COLUMNS', {})
+    for key, column in columns.items():
+        try:
+            model._meta.get_field(column)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(
+                f"PAYMENT_METADATA_COLUMNS maps '{key}' to '{column}', which is not a {model.__name__} field"
+            )
+    return columns
+
+
+def _column_value(model, column, value):
+    if value is None or value == '':
+        return None
+    max_length = model._meta.get_field(column).max_length
+    return str(value)[:max_length]
+
+
+def sync_metadata_columns(payment):
+    """Copy the hot keys of ``payment.metadata`` into their columns; returns the fields that changed."""
+    changed = []
+    metadata = payment.metadata if isinstance(payment.metadata, dict) else {}
+    for key, column in metadata_columns(type(payment)).items():
+        value = _column_value(type(payment), column, metadata.get(key))
+        if getattr(payment, column) != value:
+            setattr(payment, column, value)
+            changed.append(column)
+    return changed
+
+
+def metadata_update_fields(model):
+    """The columns to save alongside ``metadata`` in an update_fields list or bulk_update."""
+    return list(metadata_columns(model).values())
+
+
+def metadata_lookup(model, key):
+    """Return the lookup for metadata ``key``: its indexed column if it has one, else the JSON key."""
+    return metadata_columns(model).get(key) or f'metadata__{key}'
+
+
+def metadata_filter(model, key, values):
+    """Return a Q matching rows whose metadata ``key`` is one of ``values``."""
+    return Q(**{f'{metadata_lookup(model, key)}__in': values})
+
+
+def backfill_metadata_columns(model, columns=None, batch_size=BATCH_SIZE, progress=None):
+    """
+    Fill the metadata columns of every row of ``model`` from its JSON, in batches.
+
+    Each batch is a page of primary keys followed by one UPDATE that
+    extracts the keys in the database, so rows are never loaded. ``columns``
+    defaults to metadata_columns(); data migrations pass their own.
+    ``progress`` is called with the number of rows done after each batch.
+    Returns the number of rows visited.
+    """
+    columns = metadata_columns(model) if columns is None else columns
+    if not columns:
+        return 0
+    # Absent and empty keys both become NULL, as on save.
+    expressions = {
+        column: NullIf(
+            Substr(KeyTextTransform(key, 'metadata'), 1, model._meta.get_field(column).max_length), Value('')
+        )
+        for key, column in columns.items()
+    }
+
+    done = 0
+    last = None
+    while True:
+        page = model.objects.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        pks = list(page.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return done
+        model.objects.filter(pk__in=pks).update(**expressions)
+        done += len(pks)
+        last = pks[-1]
+        if progress is not None:
+            progress(done)
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at'], name='payments_pa_created_b8a300_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'completed_at'], name='payments_pa_status_7f9b9d_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0005_tags'),
+        ('payments', '0002_rollup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='customers.customer'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_payment_customer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='payments_pa_custome_c1455c_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('mpesa', 'M-PESA'), ('stripe', 'Stripe')], max_length=20)),
+                ('event_id', models.CharField(max_length=255)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, max_length=200)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='payments.payment')),
+            ],
+            options={
+                'verbose_name': 'Payment Event',
+                'verbose_name_plural': 'Payment Events',
+                'ordering': ['received_at'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='payment_event_pending_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymentevent',
+            constraint=models.UniqueConstraint(fields=('provider', 'event_id'), name='unique_payment_event'),
+        ),
+    ]
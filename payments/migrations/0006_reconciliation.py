@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('payments', '0005_payment_event_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('payment_method', models.CharField(blank=True, choices=[('stripe', 'Credit/Debit Card'), ('mpesa', 'M-PESA'), ('bank_transfer', 'Bank Transfer'), ('cash', 'Cash'), ('cheque', 'Cheque')], max_length=20)),
+                ('period_start', models.DateTimeField(blank=True, null=True)),
+                ('period_end', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('matched', models.PositiveIntegerField(default=0)),
+                ('amount_mismatched', models.PositiveIntegerField(default=0)),
+                ('missing_in_crm', models.PositiveIntegerField(default=0)),
+                ('missing_in_statement', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reconciliations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reconciliation',
+                'verbose_name_plural': 'Reconciliations',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReconciliationItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('result', models.CharField(choices=[('matched', 'Matched'), ('amount_mismatch', 'Amount mismatch'), ('missing_in_crm', 'Missing in CRM'), ('missing_in_statement', 'Missing in statement')], max_length=20)),
+                ('reference', models.CharField(max_length=100)),
+                ('row_number', models.PositiveIntegerField(blank=True, null=True)),
+                ('statement_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('statement_date', models.DateTimeField(blank=True, null=True)),
+                ('crm_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('crm_status', models.CharField(blank=True, max_length=20)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='payments.payment')),
+                ('reconciliation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='payments.reconciliation')),
+            ],
+            options={
+                'verbose_name': 'Reconciliation Item',
+                'verbose_name_plural': 'Reconciliation Items',
+                'indexes': [models.Index(fields=['reconciliation', 'result', 'id'], name='payments_re_reconci_8caebb_idx'), models.Index(fields=['reconciliation', 'payment'], name='payments_re_reconci_ad40ab_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:02
+
+from django.db import migrations, models
+
+from payments.metadata import backfill_metadata_columns
+
+# The keys as configured when the columns were added; later changes to
+# PAYMENT_METADATA_COLUMNS are applied with `manage.py backfill_payment_metadata`.
+COLUMNS = {
+    'mpesa_receipt': 'mpesa_receipt',
+    'checkout_request_id': 'mpesa_checkout_request_id',
+    'phone': 'phone',
+    'stripe_payment_intent_id': 'stripe_payment_intent_id',
+}
+
+
+def backfill(apps, schema_editor):
+    backfill_metadata_columns(apps.get_model('payments', 'Payment'), columns=COLUMNS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='mpesa_checkout_request_id',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='mpesa_receipt',
+            field=models.CharField(blank=True, editable=False, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='phone',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('mpesa_receipt__isnull', False)), fields=['mpesa_receipt'], name='payment_mpesa_receipt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('mpesa_checkout_request_id__isnull', False)), fields=['mpesa_checkout_request_id'], name='payment_mpesa_checkout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('phone__isnull', False)), fields=['phone'], name='payment_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('stripe_payment_intent_id__isnull', False)), fields=['stripe_payment_intent_id'], name='payment_stripe_intent_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_payment_metadata_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
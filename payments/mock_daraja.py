@@ -0,0 +1,214 @@
+"""
+A local stand-in for Safaricom's Daraja API.
+
+Serves the OAuth and STK push endpoints payments.mpesa uses, checking
+credentials, tokens and passwords the way Daraja does, and then posts the
+payment result to the request's CallBackURL like Safaricom would. Phone
+numbers ending in 1032 get a "cancelled by user" result; all others pay.
+
+    with MockDaraja() as daraja:
+        gateway = MpesaGateway(auth_url=daraja.auth_url, stk_push_url=daraja.stk_push_url)
+
+or run it with ``manage.py run_mock_daraja`` and point MPESA_AUTH_URL and
+MPESA_ONLINEPAYMENT_URL at it. It counts tokens issued, pushes and client
+connections, so tests can check that tokens and connections are reused.
+"""
+import base64
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+AUTH_PATH = '/oauth/v1/generate'
+STK_PUSH_PATH = '/mpesa/stkpush/v1/processrequest'
+
+CANCELLED_SUFFIX = '1032'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        daraja = self.server.daraja
+        daraja.seen(self.client_address)
+        if urlsplit(self.path).path != AUTH_PATH:
+            return self._reply(404, {'errorMessage': 'Not found'})
+
+        expected = base64.b64encode(f'{daraja.consumer_key}:{daraja.consumer_secret}'.encode()).decode()
+        if self.headers.get('Authorization') != f'Basic {expected}':
+            return self._reply(400, {'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'})
+        return self._reply(200, {'access_token': daraja.issue_token(), 'expires_in': str(daraja.expires_in)})
+
+    def do_POST(self):
+        daraja = self.server.daraja
+        daraja.seen(self.client_address)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        if urlsplit(self.path).path != STK_PUSH_PATH:
+            return self._reply(404, {'errorMessage': 'Not found'})
+
+        token = (self.headers.get('Authorization') or '').removeprefix('Bearer ')
+        if not daraja.valid_token(token):
+            return self._reply(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            return self._reply(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid JSON'})
+
+        error = daraja.validate(payload)
+        if error:
+            return self._reply(400, {'errorCode': '400.002.02', 'errorMessage': f'Bad Request - Invalid {error}'})
+        return self._reply(200, daraja.accept(payload))
+
+
+class MockDaraja:
+    """A Daraja API served from a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=0, consumer_key=None, consumer_secret=None,
+                 shortcode=None, pass_key=None, expires_in=3599, callback_delay=0.5):
+        self.consumer_key = consumer_key or settings.MPESA_CONSUMER_KEY
+        self.consumer_secret = consumer_secret or settings.MPESA_CONSUMER_SECRET
+        self.shortcode = shortcode or settings.MPESA_BUSINESS_SHORTCODE
+        self.pass_key = pass_key or settings.MPESA_PASS_KEY
+        self.expires_in = expires_in
+        # Seconds before the result is posted to the CallBackURL; None posts nothing.
+        self.callback_delay = callback_delay
+
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.tokens_issued = 0
+        self.pushes = []
+        self.connections = set()
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.daraja = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def auth_url(self):
+        return f'{self.url}{AUTH_PATH}?grant_type=client_credentials'
+
+    @property
+    def stk_push_url(self):
+        return f'{self.url}{STK_PUSH_PATH}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def seen(self, client_address):
+        with self.lock:
+            self.connections.add(client_address)
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens.add(token)
+            self.tokens_issued += 1
+        return token
+
+    def valid_token(self, token):
+        with self.lock:
+            return token in self.tokens
+
+    def revoke_tokens(self):
+        """Invalidate every token issued so far, as Daraja does when one expires early."""
+        with self.lock:
+            self.tokens.clear()
+
+    def validate(self, payload):
+        """Return the name of the first invalid field, or None."""
+        for field in ('BusinessShortCode', 'Password', 'Timestamp', 'TransactionType', 'Amount',
+                      'PartyA', 'PartyB', 'PhoneNumber', 'CallBackURL', 'AccountReference', 'TransactionDesc'):
+            if payload.get(field) in (None, ''):
+                return field
+        expected = base64.b64encode(f"{self.shortcode}{self.pass_key}{payload['Timestamp']}".encode()).decode()
+        if str(payload['BusinessShortCode']) != str(self.shortcode) or payload['Password'] != expected:
+            return 'Password'
+        if not isinstance(payload['Amount'], int) or payload['Amount'] < 1:
+            return 'Amount'
+        if not str(payload['PhoneNumber']).startswith('254') or len(str(payload['PhoneNumber'])) != 12:
+            return 'PhoneNumber'
+        return None
+
+    def accept(self, payload):
+        merchant_request_id = f'{uuid.uuid4().int % 100000}-{uuid.uuid4().int % 100000000}-1'
+        checkout_request_id = f'ws_CO_{timezone.now():%d%m%Y%H%M%S}{uuid.uuid4().hex[:12]}'
+        with self.lock:
+            self.pushes.append(dict(payload, CheckoutRequestID=checkout_request_id))
+        if self.callback_delay is not None:
+            timer = threading.Timer(
+                self.callback_delay, self.send_callback, args=(payload, merchant_request_id, checkout_request_id)
+            )
+            timer.daemon = True
+            timer.start()
+        return {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        }
+
+    def result(self, payload, merchant_request_id, checkout_request_id):
+        """Return the callback body Safaricom would post for ``payload``."""
+        phone = str(payload['PhoneNumber'])
+        callback = {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+        }
+        if phone.endswith(CANCELLED_SUFFIX):
+            callback.update(ResultCode=1032, ResultDesc='Request cancelled by user')
+        else:
+            callback.update(
+                ResultCode=0,
+                ResultDesc='The service request is processed successfully.',
+                CallbackMetadata={'Item': [
+                    {'Name': 'Amount', 'Value': payload['Amount']},
+                    {'Name': 'MpesaReceiptNumber', 'Value': uuid.uuid4().hex[:10].upper()},
+                    {'Name': 'TransactionDate', 'Value': int(f'{timezone.localtime():%Y%m%d%H%M%S}')},
+                    {'Name': 'PhoneNumber', 'Value': int(phone)},
+                ]},
+            )
+        return {'Body': {'stkCallback': callback}}
+
+    def send_callback(self, payload, merchant_request_id, checkout_request_id):
+        try:
+            requests.post(
+                payload['CallBackURL'], json=self.result(payload, merchant_request_id, checkout_request_id), timeout=10
+            )
+        except requests.RequestException:
+            pass
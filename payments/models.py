@@ -4,6 +4,7 @@ Payment models for DataLinkCRM.
 from django.db import models
 from django.contrib.auth.models import User
 import uuid
+from .metadata import metadata_update_fields, sync_metadata_columns
 
 class Payment(models.Model):
     """Payment model."""
@@ -26,6 +27,9 @@ class Payment(models.Model):
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments')
+    customer = models.ForeignKey(
+        'customers.Customer', on_delete=models.SET_NULL, null=True, blank=True, related_name='payments'
+    )
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     currency = models.CharField(max_length=3, default='KES')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -33,6 +37,11 @@ class Payment(models.Model):
     reference = models.CharField(max_length=100, unique=True, db_index=True)
     description = models.TextField(blank=True)
     metadata = models.JSONField(default=dict, blank=True)
+    # Indexed copies of metadata keys (see payments.metadata and PAYMENT_METADATA_COLUMNS).
+    mpesa_receipt = models.CharField(max_length=50, null=True, blank=True, editable=False)
+    mpesa_checkout_request_id = models.CharField(max_length=100, null=True, blank=True, editable=False)
+    phone = models.CharField(max_length=20, null=True, blank=True, editable=False)
+    stripe_payment_intent_id = models.CharField(max_length=255, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -41,10 +50,46 @@ class Payment(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'completed_at']),
+            models.Index(fields=['customer', 'created_at', 'id']),
+            # Partial, so rows without the key cost nothing; "column = value"
+            # implies NOT NULL, which both SQLite and PostgreSQL use to pick them.
+            models.Index(
+                fields=['mpesa_receipt'],
+                condition=models.Q(mpesa_receipt__isnull=False),
+                name='payment_mpesa_receipt_idx'
+            ),
+            models.Index(
+                fields=['mpesa_checkout_request_id'],
+                condition=models.Q(mpesa_checkout_request_id__isnull=False),
+                name='payment_mpesa_checkout_idx'
+            ),
+            models.Index(
+                fields=['phone'],
+                condition=models.Q(phone__isnull=False),
+                name='payment_phone_idx'
+            ),
+            models.Index(
+                fields=['stripe_payment_intent_id'],
+                condition=models.Q(stripe_payment_intent_id__isnull=False),
+                name='payment_stripe_intent_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"Payment {self.reference} - {self.amount} {self.currency}"
     
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            sync_metadata_columns(self)
+        elif 'metadata' in update_fields:
+            sync_metadata_columns(self)
+            kwargs['update_fields'] = set(update_fields) | set(metadata_update_fields(type(self)))
+        super().save(*args, **kwargs)
+    
     def get_payment_method_display(self):
         methods = {
             'stripe': 'Credit/Debit Card',
@@ -57,3 +102,107 @@ class Payment(models.Model):
     
     def get_status_display(self):
         return dict(self.STATUS_CHOICES).get(self.status, self.status)
+
+
+class PaymentEvent(models.Model):
+    """A payment provider callback waiting in, or applied from, the inbox (see payments.inbox)."""
+    PROVIDER_CHOICES = [
+        ('mpesa', 'M-PESA'),
+        ('stripe', 'Stripe'),
+    ]
+    
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # An event whose payment is not found yet is retried a few times, from next_attempt_at on.
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='events')
+    outcome = models.CharField(max_length=200, blank=True)
+    
+    class Meta:
+        ordering = ['received_at']
+        verbose_name = 'Payment Event'
+        verbose_name_plural = 'Payment Events'
+        constraints = [
+            # Providers retry deliveries; each event is stored once.
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='unique_payment_event'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(processed_at__isnull=True),
+                name='payment_event_pending_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_provider_display()} {self.event_type} {self.event_id}"
+
+
+class Reconciliation(models.Model):
+    """A statement file reconciled against the user's payments (see payments.reconciliation)."""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reconciliations')
+    filename = models.CharField(max_length=255)
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHOD_CHOICES, blank=True)
+    period_start = models.DateTimeField(null=True, blank=True)
+    period_end = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    rows = models.PositiveIntegerField(default=0)
+    matched = models.PositiveIntegerField(default=0)
+    amount_mismatched = models.PositiveIntegerField(default=0)
+    missing_in_crm = models.PositiveIntegerField(default=0)
+    missing_in_statement = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Reconciliation'
+        verbose_name_plural = 'Reconciliations'
+    
+    def __str__(self):
+        return f"Reconciliation of {self.filename}"
+
+
+class ReconciliationItem(models.Model):
+    """One statement line or unmatched payment in a reconciliation."""
+    RESULT_CHOICES = [
+        ('matched', 'Matched'),
+        ('amount_mismatch', 'Amount mismatch'),
+        ('missing_in_crm', 'Missing in CRM'),
+        ('missing_in_statement', 'Missing in statement'),
+    ]
+    
+    reconciliation = models.ForeignKey(Reconciliation, on_delete=models.CASCADE, related_name='items')
+    result = models.CharField(max_length=20, choices=RESULT_CHOICES)
+    reference = models.CharField(max_length=100)
+    row_number = models.PositiveIntegerField(null=True, blank=True)
+    statement_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    statement_date = models.DateTimeField(null=True, blank=True)
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    crm_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    crm_status = models.CharField(max_length=20, blank=True)
+    
+    class Meta:
+        verbose_name = 'Reconciliation Item'
+        verbose_name_plural = 'Reconciliation Items'
+        indexes = [
+            models.Index(fields=['reconciliation', 'result', 'id']),
+            # Finds the payments a reconciliation has already seen.
+            models.Index(fields=['reconciliation', 'payment']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_result_display()}: {self.reference}"
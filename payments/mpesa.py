@@ -0,0 +1,381 @@
+"""
+M-PESA (Daraja) gateway for DataLinkCRM.
+
+Lipa na M-PESA Online payments start with an STK push: the customer's phone
+shows a PIN prompt and Safaricom later posts the outcome to
+MPESA_CALLBACK_URL, with MPESA_CALLBACK_SECRET appended so the receiver can
+tell the post is genuine (see secret_callback_url()).
+
+Every Daraja call needs an OAuth token valid for about an hour. The token is
+kept in the cache until shortly before it expires, so all workers share one
+token instead of fetching one per payment, and requests go through one
+pooled requests.Session per process so the TLS connection is reused.
+push_payments() submits many STK pushes at once from a bounded thread pool.
+
+payments.mock_daraja serves the same API locally for development and tests.
+"""
+import base64
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metadata import metadata_update_fields, sync_metadata_columns
+from .models import Payment
+from .signals import payments_bulk_updated
+
+logger = logging.getLogger(__name__)
+
+TOKEN_KEY = 'payments:mpesa:token:{digest}'
+TOKEN_LOCK_KEY = 'payments:mpesa:token-lock:{digest}'
+
+# Seconds a worker waits for another one to fetch the token before fetching it itself.
+TOKEN_LOCK_TIMEOUT = 10
+
+PHONE_RE = re.compile(r'^(?:\+?254|0)?([17][0-9]{8})$')
+
+
+class MpesaError(Exception):
+    """Raised when Daraja rejects a request or cannot be reached."""
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response or {}
+
+
+def normalize_msisdn(phone):
+    """Return a Kenyan phone number in the 2547XXXXXXXX form Daraja expects."""
+    match = PHONE_RE.match(re.sub(r'[\s\-()]', '', phone or ''))
+    if not match:
+        raise MpesaError(f"'{phone}' is not a Kenyan mobile number")
+    return '254' + match.group(1)
+
+
+def whole_amount(amount):
+    """Return ``amount`` as the whole number of shillings Daraja accepts."""
+    amount = Decimal(amount)
+    if not amount.is_finite() or amount <= 0 or amount != amount.to_integral_value():
+        raise MpesaError(f'M-PESA amounts must be whole shillings, not {amount}')
+    if amount > settings.MPESA_MAX_AMOUNT:
+        raise MpesaError(f'M-PESA amounts cannot exceed {settings.MPESA_MAX_AMOUNT} shillings')
+    return int(amount)
+
+
+def secret_callback_url(url=None):
+    """
+    Return ``url`` (default MPESA_CALLBACK_URL) ending in MPESA_CALLBACK_SECRET.
+
+    Returns '' while no secret is set, as the receivers would refuse the callback.
+    """
+    secret = settings.MPESA_CALLBACK_SECRET
+    if not secret:
+        return ''
+    return f"{(url or settings.MPESA_CALLBACK_URL).rstrip('/')}/{quote(secret)}"
+
+
+class MpesaGateway:
+    """A Daraja client; share one instance per process (see get_gateway())."""
+
+    def __init__(self, auth_url=None, stk_push_url=None, consumer_key=None, consumer_secret=None,
+                 shortcode=None, party_b=None, pass_key=None, callback_url=None,
+                 pool_size=None, timeout=None):
+        self.auth_url = auth_url or settings.MPESA_AUTH_URL
+        self.stk_push_url = stk_push_url or settings.MPESA_ONLINEPAYMENT_URL
+        self.consumer_key = consumer_key or settings.MPESA_CONSUMER_KEY
+        self.consumer_secret = consumer_secret or settings.MPESA_CONSUMER_SECRET
+        self.shortcode = shortcode or settings.MPESA_BUSINESS_SHORTCODE
+        self.party_b = party_b or settings.MPESA_PARTY_B
+        self.pass_key = pass_key or settings.MPESA_PASS_KEY
+        self.callback_url = callback_url or secret_callback_url()
+        self.pool_size = pool_size or settings.MPESA_POOL_SIZE
+        self.timeout = timeout or settings.MPESA_TIMEOUT
+
+        digest = hashlib.sha256(f'{self.auth_url}|{self.consumer_key}'.encode()).hexdigest()[:16]
+        self.token_key = TOKEN_KEY.format(digest=digest)
+        self.token_lock_key = TOKEN_LOCK_KEY.format(digest=digest)
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = threading.Lock()
+
+        self.session = requests.Session()
+        # Only connection failures are retried; a POST that reached Daraja
+        # may already have prompted the customer.
+        adapter = HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2),
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    # OAuth token
+
+    def access_token(self):
+        """
+        Return a valid OAuth token.
+
+        Tried in order: this process's copy, the shared cache, and Daraja.
+        Only one worker at a time fetches from Daraja; the others wait for
+        it to fill the cache.
+        """
+        if self._token and time.time() < self._token_expires:
+            return self._token
+        with self._token_lock:
+            if self._token and time.time() < self._token_expires:
+                return self._token
+
+            cached = cache.get(self.token_key)
+            if cached is None:
+                cached = self._fetch_shared_token()
+            self._token, self._token_expires = cached
+            return self._token
+
+    def _fetch_shared_token(self):
+        locked = cache.add(self.token_lock_key, 1, timeout=TOKEN_LOCK_TIMEOUT)
+        if not locked:
+            deadline = time.time() + TOKEN_LOCK_TIMEOUT
+            while time.time() < deadline:
+                time.sleep(0.05)
+                cached = cache.get(self.token_key)
+                if cached is not None:
+                    return cached
+        try:
+            token, expires_in = self._request_token()
+            lifetime = max(expires_in - settings.MPESA_TOKEN_EXPIRY_MARGIN, 1)
+            cached = (token, time.time() + lifetime)
+            cache.set(self.token_key, cached, timeout=lifetime)
+            return cached
+        finally:
+            if locked:
+                cache.delete(self.token_lock_key)
+
+    def _request_token(self):
+        try:
+            response = self.session.get(
+                self.auth_url, auth=(self.consumer_key, self.consumer_secret), timeout=self.timeout
+            )
+        except requests.RequestException as exc:
+            raise MpesaError(f'Could not reach M-PESA: {exc}')
+        data = self._json(response)
+        if response.status_code != 200 or 'access_token' not in data:
+            raise MpesaError('M-PESA did not issue an access token', data)
+        return data['access_token'], int(data.get('expires_in', 3599))
+
+    def invalidate_token(self, token):
+        """Forget ``token`` after Daraja refused it, unless it was already replaced."""
+        with self._token_lock:
+            if self._token == token:
+                self._token, self._token_expires = None, 0
+            cached = cache.get(self.token_key)
+            if cached is not None and cached[0] == token:
+                cache.delete(self.token_key)
+
+    # STK push
+
+    def password(self, timestamp):
+        return base64.b64encode(f'{self.shortcode}{self.pass_key}{timestamp}'.encode()).decode()
+
+    def stk_push(self, phone, amount, reference, description=''):
+        """
+        Prompt ``phone`` to pay ``amount`` KES against ``reference``.
+
+        Returns Daraja's response, which holds the CheckoutRequestID the
+        callback will refer to. Raises MpesaError if the push was refused.
+        """
+        if not self.callback_url:
+            raise MpesaError('MPESA_CALLBACK_SECRET is not set, so the payment result could not be received')
+        # Daraja expects the time in Kenya, whatever the server's zone.
+        timestamp = timezone.localtime(timezone.now()).strftime('%Y%m%d%H%M%S')
+        msisdn = normalize_msisdn(phone)
+        payload = {
+            'BusinessShortCode': self.shortcode,
+            'Password': self.password(timestamp),
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': whole_amount(amount),
+            'PartyA': msisdn,
+            'PartyB': self.party_b,
+            'PhoneNumber': msisdn,
+            'CallBackURL': self.callback_url,
+            'AccountReference': reference[:12],
+            'TransactionDesc': (description or reference)[:13],
+        }
+
+        for attempt in range(2):
+            token = self.access_token()
+            try:
+                response = self.session.post(
+                    self.stk_push_url,
+                    json=payload,
+                    headers={'Authorization': f'Bearer {token}'},
+                    timeout=self.timeout
+                )
+            except requests.RequestException as exc:
+                raise MpesaError(f'Could not reach M-PESA: {exc}')
+            if response.status_code == 401 and attempt == 0:
+                # Revoked or expired early; fetch a new token and try once more.
+                self.invalidate_token(token)
+                continue
+            break
+
+        data = self._json(response)
+        if response.status_code != 200 or str(data.get('ResponseCode')) != '0':
+            message = data.get('errorMessage') or data.get('ResponseDescription') or f'HTTP {response.status_code}'
+            raise MpesaError(f'STK push refused: {message}', data)
+        return data
+
+    @staticmethod
+    def _json(response):
+        try:
+            data = response.json()
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return this process's gateway, creating it on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = MpesaGateway()
+    return _gateway
+
+
+def payment_phone(payment):
+    """Return the phone an M-PESA payment is requested from."""
+    phone = payment.metadata.get('phone')
+    if not phone and payment.customer_id:
+        phone = payment.customer.phone
+    return phone
+
+
+def _push(gateway, request):
+    phone, amount, reference, description = request
+    try:
+        return gateway.stk_push(phone, amount, reference, description), None
+    except MpesaError as exc:
+        return exc.response, str(exc)
+
+
+def _push_in_pool(gateway, requests_, workers):
+    """Push in worker threads, keeping at most two pushes per worker in flight."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for request in requests_:
+            pending.append(executor.submit(_push, gateway, request))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _claim(payments):
+    """
+    Move the payments still pending in the database to 'processing' and return them.
+
+    The rows are locked while they are claimed, so when two workers are
+    given the same payments only one of them prompts the customer.
+    """
+    by_pk = {payment.pk: payment for payment in payments}
+    now = timezone.now()
+    with transaction.atomic():
+        pks = list(
+            Payment.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=by_pk, status='pending')
+            .values_list('pk', flat=True)
+        )
+        Payment.objects.filter(pk__in=pks, status='pending').update(status='processing', updated_at=now)
+        claimed = [by_pk[pk] for pk in pks]
+        for payment in claimed:
+            payment.status = 'processing'
+            payment.updated_at = now
+        payments_bulk_updated.send(
+            sender=Payment, payments=claimed, previous_status={pk: 'pending' for pk in pks}
+        )
+    return claimed
+
+
+def push_payments(payments, gateway=None, workers=None):
+    """
+    Send an STK push for each pending M-PESA payment in ``payments``.
+
+    The payments are first claimed by moving them to 'processing' (see
+    _claim()); any that another worker claimed first are skipped. Pushes run
+    concurrently on at most ``workers`` threads (default MPESA_MAX_WORKERS);
+    the database is only touched from this thread. Each payment keeps
+    'processing' with its CheckoutRequestID in metadata, or moves to
+    'failed' with the error, saved with one bulk_update that leaves alone
+    payments no longer 'processing'. Returns ``(pushed, failed)``.
+    """
+    gateway = gateway or get_gateway()
+    workers = workers or settings.MPESA_MAX_WORKERS
+    payments = _claim([
+        payment for payment in payments
+        if payment.payment_method == 'mpesa' and payment.status == 'pending'
+    ])
+
+    requests_ = []
+    for payment in payments:
+        phone = payment_phone(payment)
+        if phone:
+            payment.metadata['phone'] = phone
+        requests_.append((phone, payment.amount, payment.reference, payment.description))
+
+    results = _push_in_pool(gateway, requests_, workers) if len(payments) > 1 else map(
+        lambda request: _push(gateway, request), requests_
+    )
+
+    pushed = failed = 0
+    now = timezone.now()
+    for payment, (response, error) in zip(payments, results):
+        if error is None:
+            payment.metadata.update({
+                'checkout_request_id': response.get('CheckoutRequestID'),
+                'merchant_request_id': response.get('MerchantRequestID'),
+            })
+            pushed += 1
+        else:
+            logger.warning('STK push for payment %s failed: %s', payment.reference, error)
+            payment.status = 'failed'
+            payment.metadata['error'] = error
+            failed += 1
+        payment.updated_at = now
+        sync_metadata_columns(payment)
+
+    with transaction.atomic():
+        # Payments changed elsewhere since they were claimed keep that change.
+        claimed = set(
+            Payment.objects.select_for_update()
+            .filter(pk__in=[payment.pk for payment in payments], status='processing')
+            .values_list('pk', flat=True)
+        )
+        payments = [payment for payment in payments if payment.pk in claimed]
+        Payment.objects.filter(status='processing').bulk_update(
+            payments, ['status', 'metadata', 'updated_at', *metadata_update_fields(Payment)], batch_size=500
+        )
+        payments_bulk_updated.send(
+            sender=Payment, payments=payments, previous_status={pk: 'processing' for pk in claimed}
+        )
+    return pushed, failed
@@ -0,0 +1,284 @@
+"""
+Statement reconciliation for DataLinkCRM.
+
+An M-PESA or bank statement (CSV or XLSX) is streamed in chunks. Each chunk
+is hash-joined against the user's payments: the chunk's references are
+looked up with one query on Payment.reference and the indexed M-PESA
+receipt number, and every line is classified as matched, amount mismatch
+or missing in CRM. The results are written with bulk_create before the
+next chunk is read.
+
+Payments the statement never mentioned are found afterwards with an
+anti-join in the database, limited to completed payments of the statement's
+method and period, and written in chunks as missing in statement. Memory
+use depends on the chunk size, not on the statement or the payments table.
+"""
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .metadata import metadata_filter, metadata_lookup
+from .models import Payment, Reconciliation, ReconciliationItem
+from customers.importer import CustomerImportError, iter_csv, iter_xlsx, normalize_header
+
+CHUNK_SIZE = 5000
+
+# Errors kept on the reconciliation; later ones are only counted.
+MAX_REPORTED_ERRORS = 100
+
+# Statement columns recognised for each value, in order of preference.
+# M-PESA statements call the reference "Receipt No." and the amount "Paid In".
+REFERENCE_COLUMNS = ['reference', 'receipt_no', 'receipt_number', 'transaction_reference', 'transaction_id', 'ref']
+AMOUNT_COLUMNS = ['amount', 'paid_in', 'credit', 'credit_amount']
+DATE_COLUMNS = ['date', 'completion_time', 'transaction_date', 'value_date', 'posting_date']
+
+DATE_FORMATS = ['%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%d-%m-%Y %H:%M:%S', '%d-%m-%Y']
+
+AMOUNT_RE = re.compile(r'[^0-9.\-]')
+
+# The Reconciliation counter of each item result.
+RESULT_COUNTERS = {
+    'matched': 'matched',
+    'amount_mismatch': 'amount_mismatched',
+    'missing_in_crm': 'missing_in_crm',
+    'missing_in_statement': 'missing_in_statement',
+}
+
+
+class ReconciliationError(ValueError):
+    """Raised when a statement cannot be reconciled at all (bad format or columns)."""
+
+
+def _pick(header, candidates):
+    for name in candidates:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def parse_amount(value):
+    """Parse a statement amount such as 'KES 1,250.00' or '(300.00)'; None if blank."""
+    value = value.strip()
+    if not value:
+        return None
+    negative = value.startswith('(') and value.endswith(')')
+    amount = Decimal(AMOUNT_RE.sub('', value))
+    return -amount if negative else amount
+
+
+def parse_statement_date(value):
+    """Parse a statement date or time in the local zone; None if blank or unrecognised."""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is not None:
+                moment = datetime.datetime.combine(day, datetime.time())
+    except ValueError:
+        # Well formed but impossible, such as 2026-02-30.
+        return None
+    if moment is None:
+        for fmt in DATE_FORMATS:
+            try:
+                moment = datetime.datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def iter_statement(file, filename):
+    if filename.lower().endswith('.xlsx'):
+        return iter_xlsx(file)
+    if filename.lower().endswith('.csv'):
+        return iter_csv(file)
+    raise ReconciliationError('Only .csv and .xlsx statements can be reconciled')
+
+
+class _Run:
+    """Counters and period of a reconciliation in progress."""
+
+    def __init__(self, reconciliation):
+        self.reconciliation = reconciliation
+        self.first_date = None
+        self.last_date = None
+
+    def error(self, row_number, message):
+        reconciliation = self.reconciliation
+        reconciliation.skipped += 1
+        if len(reconciliation.errors) < MAX_REPORTED_ERRORS:
+            reconciliation.errors.append({'row': row_number, 'message': message})
+
+    def saw_date(self, moment):
+        if moment is not None:
+            self.first_date = min(self.first_date or moment, moment)
+            self.last_date = max(self.last_date or moment, moment)
+
+
+def _cell(values, index):
+    return values[index] if index is not None and index < len(values) else ''
+
+
+def _parse_chunk(chunk, columns, run):
+    """Return ``[(row_number, reference, amount, date)]`` for the usable lines of a chunk."""
+    reference_at, amount_at, date_at = columns
+    lines = []
+    for row_number, values in chunk:
+        reference = _cell(values, reference_at).strip()
+        if not reference:
+            run.error(row_number, 'No reference')
+            continue
+        try:
+            amount = parse_amount(_cell(values, amount_at))
+        except InvalidOperation:
+            run.error(row_number, f"'{_cell(values, amount_at)}' is not an amount")
+            continue
+        if amount is None:
+            # Withdrawals and charges have no paid-in amount; they are not payments.
+            run.reconciliation.skipped += 1
+            continue
+        date = parse_statement_date(_cell(values, date_at))
+        run.saw_date(date)
+        lines.append((row_number, reference, amount, date))
+    return lines
+
+
+def _match_chunk(user, lines, payment_method):
+    """Hash-join a chunk of statement lines against the user's payments."""
+    references = {reference for _, reference, _, _ in lines}
+    # M-PESA statements list the receipt number rather than our reference.
+    payments = Payment.objects.filter(
+        Q(reference__in=references) | metadata_filter(Payment, 'mpesa_receipt', list(references)), user=user
+    )
+    if payment_method:
+        payments = payments.filter(payment_method=payment_method)
+    by_reference = {}
+    for pk, reference, receipt, amount, status in payments.values_list(
+        'pk', 'reference', metadata_lookup(Payment, 'mpesa_receipt'), 'amount', 'status'
+    ):
+        if receipt:
+            by_reference[str(receipt)] = (pk, amount, status)
+        by_reference[reference] = (pk, amount, status)
+
+    items = []
+    for row_number, reference, amount, date in lines:
+        item = ReconciliationItem(
+            reference=reference, row_number=row_number, statement_amount=amount, statement_date=date
+        )
+        match = by_reference.get(reference)
+        if match is None:
+            item.result = 'missing_in_crm'
+        else:
+            item.payment_id, item.crm_amount, item.crm_status = match
+            item.result = 'matched' if item.crm_amount == amount else 'amount_mismatch'
+        items.append(item)
+    return items
+
+
+def _unseen_payments(reconciliation):
+    """The completed payments in the statement's scope that no line matched."""
+    payments = Payment.objects.filter(user=reconciliation.user, status='completed')
+    if reconciliation.payment_method:
+        payments = payments.filter(payment_method=reconciliation.payment_method)
+    if reconciliation.period_start:
+        payments = payments.filter(completed_at__gte=reconciliation.period_start)
+    if reconciliation.period_end:
+        payments = payments.filter(completed_at__lt=reconciliation.period_end)
+    seen = ReconciliationItem.objects.filter(reconciliation=reconciliation, payment=OuterRef('pk'))
+    return payments.filter(~Exists(seen)).order_by().values_list('pk', 'reference', 'amount', 'status')
+
+
+def _day_start(moment, days=0):
+    """Local midnight starting ``moment``'s day, ``days`` days later; None for None."""
+    if moment is None:
+        return None
+    day = timezone.localtime(moment).date() + datetime.timedelta(days=days)
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+
+
+def _write(reconciliation, items):
+    for item in items:
+        item.reconciliation = reconciliation
+        field = RESULT_COUNTERS[item.result]
+        setattr(reconciliation, field, getattr(reconciliation, field) + 1)
+    with transaction.atomic():
+        ReconciliationItem.objects.bulk_create(items)
+
+
+def reconcile_statement(user, file, filename, payment_method='', period_start=None, period_end=None,
+                        chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Reconcile a CSV or XLSX statement against ``user``'s payments.
+
+    Lines are matched on Payment.reference, restricted to ``payment_method``
+    if given. Payments missing from the statement are looked for between
+    ``period_start`` and ``period_end``, which default to the start of the
+    first and the end of the last day the statement covers. ``progress`` is called with
+    the Reconciliation after every chunk. Returns the Reconciliation.
+    Raises ReconciliationError if the file has the wrong type, cannot be
+    read or lacks a reference or amount column.
+    """
+    rows = iter_statement(file, filename)
+    try:
+        header = [normalize_header(name) for name in next(rows, [])]
+    except CustomerImportError as exc:
+        raise ReconciliationError(str(exc))
+    columns = (_pick(header, REFERENCE_COLUMNS), _pick(header, AMOUNT_COLUMNS), _pick(header, DATE_COLUMNS))
+    if columns[0] is None or columns[1] is None:
+        raise ReconciliationError('The statement needs a reference column and an amount column')
+
+    reconciliation = Reconciliation.objects.create(
+        user=user, filename=filename[:255], payment_method=payment_method or ''
+    )
+    run = _Run(reconciliation)
+    try:
+        # Row numbers count the header as row 1, like a spreadsheet.
+        numbered = ((number, values) for number, values in enumerate(rows, start=2) if any(values))
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                break
+            reconciliation.rows += len(chunk)
+            lines = _parse_chunk(chunk, columns, run)
+            if lines:
+                _write(reconciliation, _match_chunk(user, lines, payment_method))
+            if progress is not None:
+                progress(reconciliation)
+
+        reconciliation.period_start = period_start or _day_start(run.first_date)
+        reconciliation.period_end = period_end or _day_start(run.last_date, days=1)
+        unseen = _unseen_payments(reconciliation).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(unseen, chunk_size))
+            if not chunk:
+                break
+            _write(reconciliation, [
+                ReconciliationItem(
+                    result='missing_in_statement', reference=reference,
+                    payment_id=pk, crm_amount=amount, crm_status=status
+                )
+                for pk, reference, amount, status in chunk
+            ])
+        reconciliation.status = 'completed'
+    except CustomerImportError as exc:
+        # The file turned out to be unreadable part way through.
+        reconciliation.status = 'failed'
+        raise ReconciliationError(str(exc))
+    except Exception:
+        reconciliation.status = 'failed'
+        raise
+    finally:
+        reconciliation.completed_at = timezone.now()
+        reconciliation.save()
+    return reconciliation
@@ -0,0 +1,9 @@
+"""
+Payment signals for DataLinkCRM.
+"""
+from django.dispatch import Signal
+
+# Sent with ``payments`` and ``previous_status`` ({payment id: status before})
+# after payments are saved with bulk_update, which skips post_save; receivers
+# update derived data in bulk.
+payments_bulk_updated = Signal()
@@ -0,0 +1,28 @@
+"""
+Background tasks for the payments app.
+Celery is optional; without it these are plain functions.
+"""
+try:
+    from celery import shared_task
+except ImportError:
+    def shared_task(func=None, **kwargs):
+        return func if func is not None else (lambda f: f)
+
+from .inbox import drain_inbox
+from .models import Payment
+from .mpesa import push_payments
+
+
+@shared_task(name='payments.push_mpesa_payments')
+def push_mpesa_payments_task(payment_ids):
+    """Send STK pushes for pending M-PESA payments; returns ``[pushed, failed]``."""
+    payments = Payment.objects.filter(
+        pk__in=payment_ids, payment_method='mpesa', status='pending'
+    ).select_related('customer')
+    return list(push_payments(payments))
+
+
+@shared_task(name='payments.drain_inbox')
+def drain_inbox_task():
+    """Apply the callbacks waiting in the payment inbox."""
+    return drain_inbox()
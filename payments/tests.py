@@ -1,3 +1,353 @@
-from django.test import TestCase
+"""
+Tests for the payments app.
+"""
+import datetime
+import io
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .inbox import TRANSITIONS, drain_inbox, parse_event, record_event
+from .metadata import backfill_metadata_columns, metadata_filter, metadata_lookup, sync_metadata_columns
+from .models import Payment, PaymentEvent
+from .mpesa import MpesaError, normalize_msisdn, push_payments, whole_amount
+from .reconciliation import ReconciliationError, parse_amount, parse_statement_date, reconcile_statement
+from analytics.models import DailyPaymentRollup
+from analytics.rollups import rebuild_rollups
+
+# Payment writes also touch the dashboard caches; keep them in memory instead of Redis.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class FakeGateway:
+    """Stands in for MpesaGateway, refusing pushes to the numbers in ``refuse``."""
+
+    def __init__(self, refuse=(), on_push=None):
+        self.refuse = set(refuse)
+        self.on_push = on_push
+        self.pushed = []
+
+    def stk_push(self, phone, amount, reference, description=''):
+        whole_amount(amount)
+        self.pushed.append(reference)
+        if self.on_push is not None:
+            self.on_push(reference)
+        if normalize_msisdn(phone) in self.refuse:
+            raise MpesaError('STK push refused: Invalid PhoneNumber', {'errorCode': '400.002.02'})
+        return {'CheckoutRequestID': f'ws_CO_{reference}', 'MerchantRequestID': f'mr_{reference}'}
+
+
+def mpesa_callback(checkout_id, code=0, amount=1000, receipt='QJK4H7X2'):
+    """Return the body of an STK push callback."""
+    callback = {'CheckoutRequestID': checkout_id, 'ResultCode': code, 'ResultDesc': 'The service request is processed.'}
+    if code == 0:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': amount},
+            {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+            {'Name': 'TransactionDate', 'Value': 20261017143005},
+            {'Name': 'PhoneNumber', 'Value': 254712000001},
+        ]}
+    return {'Body': {'stkCallback': callback}}
+
+
+class MpesaValueTests(SimpleTestCase):
+    def test_whole_amount(self):
+        self.assertEqual(whole_amount('1500'), 1500)
+        self.assertEqual(whole_amount(Decimal('1500.00')), 1500)
+        for amount in ['Infinity', '-Infinity', 'NaN', '1500.50', '0', '-10', '1e999999', '250001']:
+            with self.subTest(amount=amount), self.assertRaises(MpesaError):
+                whole_amount(amount)
+
+    def test_normalize_msisdn(self):
+        for phone in ['0712345678', '+254 712 345 678', '254712345678', '712345678']:
+            with self.subTest(phone=phone):
+                self.assertEqual(normalize_msisdn(phone), '254712345678')
+        self.assertEqual(normalize_msisdn('0112345678'), '254112345678')
+        for phone in ['', None, '0612345678', '+1 555 0100']:
+            with self.subTest(phone=phone), self.assertRaises(MpesaError):
+                normalize_msisdn(phone)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PushPaymentsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pusher')
+        self.payments = [
+            Payment.objects.create(
+                user=self.user, amount=Decimal(amount), payment_method='mpesa', reference=f'PUSH{index}',
+                metadata={'phone': phone}
+            )
+            for index, (amount, phone) in enumerate([
+                ('1000.00', '0712000001'), ('250.00', '0712000002'), ('99.50', '0712000003'),
+            ])
+        ]
+
+    def assertRollupsMatchRebuild(self):
+        def rows():
+            return sorted(
+                DailyPaymentRollup.objects.filter(user=self.user).exclude(count=0).values_list(
+                    'date', 'status', 'count', 'total_amount'
+                )
+            )
+        live = rows()
+        rebuild_rollups([self.user.pk])
+        self.assertEqual(live, rows())
+
+    def test_claims_pushes_and_records_outcomes(self):
+        gateway = FakeGateway(refuse={'254712000002'})
+        with self.assertLogs('payments.mpesa', 'WARNING'):
+            pushed, failed = push_payments(self.payments, gateway=gateway, workers=2)
+
+        self.assertEqual((pushed, failed), (1, 2))
+        # The fractional amount never reaches Daraja.
+        self.assertEqual(sorted(gateway.pushed), ['PUSH0', 'PUSH1'])
+        first, second, third = [Payment.objects.get(pk=payment.pk) for payment in self.payments]
+        self.assertEqual(first.status, 'processing')
+        self.assertEqual(first.mpesa_checkout_request_id, 'ws_CO_PUSH0')
+        self.assertEqual(second.status, 'failed')
+        self.assertIn('Invalid PhoneNumber', second.metadata['error'])
+        self.assertEqual(third.status, 'failed')
+        self.assertIn('whole shillings', third.metadata['error'])
+        self.assertRollupsMatchRebuild()
+
+    def test_claimed_payments_are_not_pushed_again(self):
+        gateway = FakeGateway()
+        stale = list(Payment.objects.filter(pk__in=[payment.pk for payment in self.payments[:2]]))
+        self.assertEqual(push_payments(self.payments[:2], gateway=gateway, workers=2), (2, 0))
+        # Copies loaded before the first push still say 'pending'.
+        self.assertEqual(push_payments(stale, gateway=gateway, workers=2), (0, 0))
+        self.assertEqual(sorted(gateway.pushed), ['PUSH0', 'PUSH1'])
+        self.assertRollupsMatchRebuild()
+
+    def test_payment_changed_during_the_push_keeps_its_status(self):
+        def cancel(reference):
+            Payment.objects.filter(reference=reference).update(status='cancelled')
+
+        self.assertEqual(push_payments(self.payments[:1], gateway=FakeGateway(on_push=cancel)), (1, 0))
+        payment = Payment.objects.get(pk=self.payments[0].pk)
+        self.assertEqual(payment.status, 'cancelled')
+        self.assertNotIn('checkout_request_id', payment.metadata)
+
+
+class ParseEventTests(SimpleTestCase):
+    def parse(self, provider, event_type, payload):
+        return parse_event(PaymentEvent(provider=provider, event_type=event_type, payload=payload))
+
+    def test_mpesa_outcomes(self):
+        success = self.parse('mpesa', 'callback', mpesa_callback('ws_1'))
+        self.assertEqual(success.keys, [('checkout', 'ws_1')])
+        self.assertEqual((success.status, success.amount), ('completed', Decimal('1000')))
+        self.assertEqual(success.completed_at.isoformat(), '2026-10-17T14:30:05+03:00')
+        self.assertEqual(success.metadata, {'mpesa_receipt': 'QJK4H7X2', 'phone': '254712000001'})
+
+        self.assertEqual(self.parse('mpesa', 'callback', mpesa_callback('ws_1', 1032)).status, 'cancelled')
+        self.assertEqual(self.parse('mpesa', 'callback', mpesa_callback('ws_1', 1)).status, 'failed')
+        timeout = self.parse('mpesa', 'timeout', {'CheckoutRequestID': 'ws_1'})
+        self.assertEqual((timeout.keys, timeout.status), ([('checkout', 'ws_1')], 'failed'))
+
+    def test_stripe_events(self):
+        payload = {'created': 0, 'data': {'object': {
+            'object': 'payment_intent', 'id': 'pi_1', 'metadata': {'reference': 'INV1'},
+        }}}
+        succeeded = self.parse('stripe', 'payment_intent.succeeded', payload)
+        self.assertEqual(succeeded.keys, [('reference', 'INV1'), ('intent', 'pi_1')])
+        self.assertEqual(succeeded.status, 'completed')
+        self.assertIsNone(self.parse('stripe', 'customer.created', payload))
+
+    def test_malformed_payloads_ask_for_nothing(self):
+        malformed = [{}, {'Body': {}}, {'Body': {'stkCallback': {'ResultCode': 'x'}}}, mpesa_callback('ws_1', amount='lots')]
+        for payload in malformed:
+            with self.subTest(payload=payload):
+                self.assertIsNone(self.parse('mpesa', 'callback', payload))
+
+    def test_final_statuses_only_move_forward(self):
+        self.assertNotIn('cancelled', TRANSITIONS)
+        self.assertNotIn('refunded', TRANSITIONS)
+        self.assertEqual(TRANSITIONS['completed'], {'refunded'})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('inbox')
+        self.payments = [
+            Payment.objects.create(
+                user=self.user, amount=Decimal('1000.00'), payment_method='mpesa', status='processing',
+                reference=f'INBOX{index}', metadata={'checkout_request_id': f'ws_{index}'}
+            )
+            for index in range(3)
+        ]
+
+    def callback(self, event_id, checkout_id, **kwargs):
+        record_event('mpesa', event_id, 'callback', mpesa_callback(checkout_id, **kwargs))
+
+    def outcomes(self):
+        return dict(PaymentEvent.objects.values_list('event_id', 'outcome'))
+
+    def test_drain_applies_each_event_once(self):
+        self.callback('ev0', 'ws_0')
+        self.callback('ev0', 'ws_0')
+        self.callback('ev1', 'ws_1', amount=10)
+        self.callback('ev2', 'ws_2', code=1032)
+        self.callback('ev3', 'ws_2')
+        with self.assertLogs('payments.inbox', 'WARNING'):
+            self.assertEqual(drain_inbox(batch_size=2), 4)
+
+        self.assertEqual(self.outcomes(), {
+            'ev0': 'applied: completed',
+            'ev1': 'rejected: paid 10, expected 1000.00',
+            'ev2': 'applied: cancelled',
+            'ev3': 'ignored: cancelled to completed',
+        })
+        first, second, third = [Payment.objects.get(pk=payment.pk) for payment in self.payments]
+        self.assertEqual((first.status, first.mpesa_receipt), ('completed', 'QJK4H7X2'))
+        self.assertEqual(second.status, 'processing')
+        self.assertEqual(third.status, 'cancelled')
+        self.assertEqual(DailyPaymentRollup.objects.get(user=self.user, status='completed').count, 1)
+        self.assertEqual(DailyPaymentRollup.objects.get(user=self.user, status='processing').count, 1)
+
+    def test_unmatched_events_are_retried_later(self):
+        self.callback('early', 'ws_unknown')
+        self.assertEqual(drain_inbox(), 1)
+        event = PaymentEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertIsNotNone(event.next_attempt_at)
+        # Not due yet, so the next drain leaves it alone.
+        self.assertEqual(drain_inbox(), 0)
+
+
+class StatementValueTests(SimpleTestCase):
+    def test_parse_amount(self):
+        self.assertEqual(parse_amount('KES 1,250.00'), Decimal('1250.00'))
+        self.assertEqual(parse_amount('(300.00)'), Decimal('-300.00'))
+        self.assertIsNone(parse_amount('  '))
+
+    def test_parse_statement_date(self):
+        local = datetime.datetime(2026, 10, 17, 14, 30, 5)
+        for value in ['2026-10-17 14:30:05', '17/10/2026 14:30:05', '17-10-2026 14:30:05']:
+            with self.subTest(value=value):
+                self.assertEqual(parse_statement_date(value), timezone.make_aware(local))
+        self.assertEqual(parse_statement_date('2026-10-17'), timezone.make_aware(datetime.datetime(2026, 10, 17)))
+        self.assertEqual(
+            parse_statement_date('2026-10-17T11:30:05Z'),
+            datetime.datetime(2026, 10, 17, 11, 30, 5, tzinfo=datetime.timezone.utc)
+        )
+        for value in ['', '2026-02-30', '2026-10-17 25:00', '30/02/2026', 'yesterday']:
+            with self.subTest(value=value):
+                self.assertIsNone(parse_statement_date(value))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reconciler')
+
+    def create_payment(self, reference, amount, completed_at, **metadata):
+        return Payment.objects.create(
+            user=self.user, amount=Decimal(amount), payment_method='mpesa', status='completed', reference=reference,
+            completed_at=timezone.make_aware(completed_at), metadata=metadata
+        )
+
+    def test_statement_lines_are_classified(self):
+        matched = self.create_payment('INV1', '1000.00', datetime.datetime(2026, 10, 17, 9), mpesa_receipt='QJK4H7X2')
+        mismatched = self.create_payment('INV2', '500.00', datetime.datetime(2026, 10, 17, 10))
+        unseen = self.create_payment('INV3', '700.00', datetime.datetime(2026, 10, 18, 23))
+        # Completed outside the period the statement covers.
+        self.create_payment('INV4', '900.00', datetime.datetime(2026, 9, 1, 12))
+        statement = (
+            'Receipt No.,Completion Time,Details,Paid In,Withdrawn\n'
+            'QJK4H7X2,17/10/2026 09:00:12,Payment,"1,000.00",\n'
+            'INV2,17/10/2026 10:05:00,Payment,450.00,\n'
+            'QJK9Z1A0,18/10/2026 08:00:00,Payment,120.00,\n'
+            'QJK9Z1A1,18/10/2026 08:30:00,Charge,,30.00\n'
+            ',18/10/2026 09:00:00,Payment,50.00,\n'
+            'QJK9Z1A2,2026-02-30,Payment,ten,\n'
+        )
+        reconciliation = reconcile_statement(
+            self.user, io.BytesIO(statement.encode()), 'statement.csv', payment_method='mpesa', chunk_size=2
+        )
+
+        self.assertEqual(reconciliation.status, 'completed')
+        self.assertEqual(
+            (reconciliation.rows, reconciliation.matched, reconciliation.amount_mismatched,
+             reconciliation.missing_in_crm, reconciliation.missing_in_statement, reconciliation.skipped),
+            (6, 1, 1, 1, 1, 3)
+        )
+        self.assertEqual([error['row'] for error in reconciliation.errors], [6, 7])
+        self.assertEqual(reconciliation.period_start, timezone.make_aware(datetime.datetime(2026, 10, 17)))
+        self.assertEqual(reconciliation.period_end, timezone.make_aware(datetime.datetime(2026, 10, 19)))
+        results = dict(reconciliation.items.values_list('reference', 'result'))
+        self.assertEqual(results, {
+            'QJK4H7X2': 'matched',
+            'INV2': 'amount_mismatch',
+            'QJK9Z1A0': 'missing_in_crm',
+            'INV3': 'missing_in_statement',
+        })
+        self.assertEqual(
+            set(reconciliation.items.exclude(payment=None).values_list('payment_id', flat=True)),
+            {matched.pk, mismatched.pk, unseen.pk}
+        )
+
+    def test_unusable_statements_are_rejected(self):
+        for content, filename in [
+            (b'Date,Details\n17/10/2026,Payment\n', 'statement.csv'),
+            (b'PK\x03\x04 not really a workbook', 'statement.xlsx'),
+            (b'reference,amount\n', 'statement.pdf'),
+        ]:
+            with self.subTest(filename=filename), self.assertRaises(ReconciliationError):
+                reconcile_statement(self.user, io.BytesIO(content), filename)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MetadataColumnTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('metadata')
+
+    def create_payment(self, reference, **metadata):
+        return Payment.objects.create(
+            user=self.user, amount=Decimal('10.00'), payment_method='mpesa', reference=reference, metadata=metadata
+        )
+
+    def test_saves_copy_hot_keys(self):
+        payment = self.create_payment('META1', mpesa_receipt='QJK4H7X2', phone='', checkout_request_id='x' * 500)
+        self.assertEqual(payment.mpesa_receipt, 'QJK4H7X2')
+        self.assertIsNone(payment.phone)
+        self.assertEqual(len(payment.mpesa_checkout_request_id), 100)
+
+        payment.metadata = {'phone': '254712000001'}
+        payment.save(update_fields=['metadata'])
+        payment.refresh_from_db()
+        self.assertEqual((payment.mpesa_receipt, payment.phone), (None, '254712000001'))
+        self.assertEqual(sync_metadata_columns(payment), [])
+
+    def test_lookups_use_the_column_when_there_is_one(self):
+        self.assertEqual(metadata_lookup(Payment, 'mpesa_receipt'), 'mpesa_receipt')
+        self.assertEqual(metadata_lookup(Payment, 'merchant_request_id'), 'metadata__merchant_request_id')
+        payment = self.create_payment('META1', mpesa_receipt='QJK4H7X2', merchant_request_id='mr_1')
+        self.create_payment('META2', mpesa_receipt='QJK4H7X3')
+        for key, value in [('mpesa_receipt', 'QJK4H7X2'), ('merchant_request_id', 'mr_1')]:
+            with self.subTest(key=key):
+                self.assertEqual(list(Payment.objects.filter(metadata_filter(Payment, key, [value]))), [payment])
+
+    def test_backfill_fills_rows_written_around_save(self):
+        for index in range(5):
+            self.create_payment(f'META{index}')
+        Payment.objects.filter(reference='META3').update(metadata={'mpesa_receipt': 'QJK4H7X5', 'phone': ''})
+        Payment.objects.filter(reference='META4').update(mpesa_receipt='STALE')
+        done = []
+        self.assertEqual(backfill_metadata_columns(Payment, batch_size=2, progress=done.append), 5)
+        self.assertEqual(done, [2, 4, 5])
+        self.assertEqual(
+            dict(Payment.objects.exclude(mpesa_receipt=None).values_list('reference', 'mpesa_receipt')),
+            {'META3': 'QJK4H7X5'}
+        )
+        self.assertFalse(Payment.objects.exclude(phone=None).exists())
+
+    def test_columns_must_exist(self):
+        with self.settings(PAYMENT_METADATA_COLUMNS={'mpesa_receipt': 'receipt'}), \
+                self.assertRaises(ImproperlyConfigured):
+            metadata_lookup(Payment, 'mpesa_receipt')
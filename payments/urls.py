@@ -8,4 +8,8 @@ app_name = 'payments'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('export/', views.export, name='export'),
+    path('api/mpesa/stk-push/', views.mpesa_stk_push, name='mpesa-stk-push'),
+    path('api/reconciliations/', views.reconcile, name='reconcile'),
+    path('api/reconciliations/<int:reconciliation_id>/', views.reconciliation_items, name='reconciliation-items'),
 ]
\ No newline at end of file
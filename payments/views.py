@@ -1,16 +1,241 @@
 """
 Payments views for DataLinkCRM.
 """
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Payment
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from django.conf import settings
+from decimal import Decimal, InvalidOperation
+import hashlib
+import hmac
+import json
+import uuid
+import stripe
+from .models import Payment, Reconciliation, ReconciliationItem
+from .filters import filter_payments
+from .inbox import mpesa_checkout_id, record_event
+from .mpesa import MpesaError, normalize_msisdn, push_payments, whole_amount
+from .reconciliation import reconcile_statement, ReconciliationError
+from core.exports import export_response
+from core.pagination import keyset_page, InvalidCursor
+from customers.models import Customer
 
 @login_required
 def index(request):
     """Payment list view."""
-    payments = Payment.objects.filter(user=request.user)
+    payments, filters = filter_payments(Payment.objects.filter(user=request.user), request.GET)
     context = {
         'title': 'Payments',
         'payments': payments,
+        'filters': filters,
     }
     return render(request, 'payments/index.html', context)
+
+@login_required
+@require_http_methods(["GET"])
+def export(request):
+    """Stream the user's payments as CSV or JSON Lines, with the list filters applied."""
+    return export_response(request, 'payments')
+
+@login_required
+@require_http_methods(["POST"])
+def mpesa_stk_push(request):
+    """
+    Start an M-PESA payment: record it and prompt the customer's phone.
+    
+    Takes ``amount`` (whole shillings), ``phone`` and/or ``customer`` (ID),
+    and an optional ``description``. The payment stays 'processing' until
+    the M-PESA callback reports the result.
+    """
+    customer = None
+    if request.POST.get('customer'):
+        try:
+            customer = Customer.objects.filter(user=request.user, pk=request.POST['customer']).first()
+        except ValidationError:
+            customer = None
+        if customer is None:
+            return JsonResponse({'error': 'Customer not found'}, status=404)
+    
+    try:
+        amount = whole_amount(Decimal(request.POST.get('amount', '')))
+        phone = normalize_msisdn(request.POST.get('phone') or (customer.phone if customer else ''))
+    except InvalidOperation:
+        return JsonResponse({'error': 'amount must be a number'}, status=400)
+    except MpesaError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    payment = Payment.objects.create(
+        user=request.user,
+        customer=customer,
+        amount=amount,
+        currency='KES',
+        payment_method='mpesa',
+        reference=f"MP{uuid.uuid4().hex[:10].upper()}",
+        description=request.POST.get('description', ''),
+        metadata={'phone': phone},
+    )
+    pushed, _ = push_payments([payment])
+    
+    data = {
+        'id': str(payment.pk),
+        'reference': payment.reference,
+        'status': payment.status,
+        'checkout_request_id': payment.metadata.get('checkout_request_id'),
+    }
+    if not pushed:
+        data['error'] = payment.metadata.get('error')
+        return JsonResponse(data, status=502)
+    return JsonResponse(data)
+
+def _client_ip(request):
+    # Each trusted proxy appends the address it was called from to
+    # X-Forwarded-For; anything to the left of those is up to the client.
+    proxies = settings.MPESA_TRUSTED_PROXY_COUNT
+    if not proxies:
+        return request.META.get('REMOTE_ADDR', '')
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+    return forwarded[-proxies] if len(forwarded) >= proxies else ''
+
+def _mpesa_event(request, event_type, secret):
+    """Verify an M-PESA notification and put it in the inbox."""
+    expected = settings.MPESA_CALLBACK_SECRET
+    if not expected:
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'M-PESA callbacks are not configured'}, status=503)
+    if not hmac.compare_digest(secret.encode(), expected.encode()):
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Forbidden'}, status=403)
+    allowed = settings.MPESA_CALLBACK_ALLOWED_IPS
+    if allowed and _client_ip(request) not in allowed:
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Forbidden'}, status=403)
+    
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Invalid JSON'}, status=400)
+    checkout_id = mpesa_checkout_id(payload)
+    if event_type == 'stk_callback' and not checkout_id:
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Not an STK callback'}, status=400)
+    
+    # A timeout without a CheckoutRequestID is keyed on its content, so repeats still collapse.
+    event_id = checkout_id or hashlib.sha256(request.body).hexdigest()
+    if event_type == 'timeout':
+        event_id = f'timeout:{event_id}'
+    record_event('mpesa', event_id, event_type, payload)
+    return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Accepted'})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def mpesa_callback(request, secret):
+    """Receive an STK push result (MPESA_CALLBACK_URL); applied later by payments.inbox."""
+    return _mpesa_event(request, 'stk_callback', secret)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def mpesa_timeout(request, secret):
+    """Receive an M-PESA timeout notification (MPESA_TIMEOUT_URL)."""
+    return _mpesa_event(request, 'timeout', secret)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def stripe_webhook(request):
+    """Receive a Stripe webhook, checked against STRIPE_WEBHOOK_SECRET; applied later by payments.inbox."""
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        return JsonResponse({'error': 'Stripe webhooks are not configured'}, status=503)
+    
+    try:
+        payload = request.body.decode('utf-8')
+        stripe.WebhookSignature.verify_header(
+            payload,
+            request.META.get('HTTP_STRIPE_SIGNATURE', ''),
+            settings.STRIPE_WEBHOOK_SECRET,
+            tolerance=settings.STRIPE_WEBHOOK_TOLERANCE
+        )
+        event = json.loads(payload)
+    except stripe.SignatureVerificationError:
+        return JsonResponse({'error': 'Invalid signature'}, status=400)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+    if not isinstance(event, dict) or not event.get('id') or not event.get('type'):
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+    
+    record_event('stripe', event['id'], event['type'], event)
+    return JsonResponse({'received': True})
+
+# Largest page of reconciliation items returned at once.
+RECONCILIATION_ITEMS_MAX_LIMIT = 500
+
+def _reconciliation_summary(reconciliation):
+    return {
+        'id': reconciliation.pk,
+        'filename': reconciliation.filename,
+        'payment_method': reconciliation.payment_method,
+        'status': reconciliation.status,
+        'period_start': reconciliation.period_start.isoformat() if reconciliation.period_start else None,
+        'period_end': reconciliation.period_end.isoformat() if reconciliation.period_end else None,
+        'rows': reconciliation.rows,
+        'matched': reconciliation.matched,
+        'amount_mismatched': reconciliation.amount_mismatched,
+        'missing_in_crm': reconciliation.missing_in_crm,
+        'missing_in_statement': reconciliation.missing_in_statement,
+        'skipped': reconciliation.skipped,
+        'errors': reconciliation.errors,
+    }
+
+@login_required
+@require_http_methods(["POST"])
+def reconcile(request):
+    """Reconcile an uploaded CSV or XLSX statement against the user's payments."""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'No file uploaded'}, status=400)
+    payment_method = request.POST.get('payment_method', '')
+    if payment_method and payment_method not in dict(Payment.PAYMENT_METHOD_CHOICES):
+        return JsonResponse({'error': f"Unknown payment method '{payment_method}'"}, status=400)
+    
+    try:
+        reconciliation = reconcile_statement(request.user, upload, upload.name, payment_method=payment_method)
+    except ReconciliationError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    return JsonResponse(_reconciliation_summary(reconciliation))
+
+@login_required
+@require_http_methods(["GET"])
+def reconciliation_items(request, reconciliation_id):
+    """A reconciliation's summary and a page of its items, optionally of one ``result``."""
+    reconciliation = get_object_or_404(Reconciliation, pk=reconciliation_id, user=request.user)
+    
+    items = ReconciliationItem.objects.filter(reconciliation=reconciliation)
+    result = request.GET.get('result')
+    if result:
+        if result not in dict(ReconciliationItem.RESULT_CHOICES):
+            return JsonResponse({'error': f"Unknown result '{result}'"}, status=400)
+        items = items.filter(result=result)
+    try:
+        limit = min(max(int(request.GET.get('limit', 100)), 1), RECONCILIATION_ITEMS_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    try:
+        page, next_cursor = keyset_page(items, ('id',), cursor=request.GET.get('cursor'), limit=limit)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'reconciliation': _reconciliation_summary(reconciliation),
+        'results': [
+            {
+                'result': item.result,
+                'reference': item.reference,
+                'row': item.row_number,
+                'statement_amount': str(item.statement_amount) if item.statement_amount is not None else None,
+                'statement_date': item.statement_date.isoformat() if item.statement_date else None,
+                'payment': str(item.payment_id) if item.payment_id else None,
+                'crm_amount': str(item.crm_amount) if item.crm_amount is not None else None,
+                'crm_status': item.crm_status,
+            }
+            for item in page
+        ],
+        'next_cursor': next_cursor,
+    })
@@ -0,0 +1,12 @@
+"""
+Payment provider callback URL configuration.
+Paths match MPESA_CALLBACK_URL and MPESA_TIMEOUT_URL followed by MPESA_CALLBACK_SECRET.
+"""
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('mpesa-callback/<path:secret>', views.mpesa_callback, name='mpesa_callback'),
+    path('mpesa-timeout/<path:secret>', views.mpesa_timeout, name='mpesa_timeout'),
+    path('stripe-webhook', views.stripe_webhook, name='stripe_webhook'),
+]
@@ -0,0 +1,31 @@
+"""
+Project list filters for DataLinkCRM.
+"""
+from .models import Project
+
+STATUS_VALUES = {value for value, _ in Project.STATUS_CHOICES}
+PRIORITY_VALUES = {value for value, _ in Project.PRIORITY_CHOICES}
+
+
+def filter_projects(queryset, params, user=None):
+    """
+    Apply the list filters in ``params`` (a QueryDict or dict) to ``queryset``.
+
+    Supported filters are ``status`` and ``priority``; unknown values are
+    ignored. ``user`` is unused; it keeps the signature of
+    filter_customers(). Returns the filtered queryset and the dict of
+    filters that were applied.
+    """
+    applied = {}
+
+    status = params.get('status', '').strip()
+    if status in STATUS_VALUES:
+        queryset = queryset.filter(status=status)
+        applied['status'] = status
+
+    priority = params.get('priority', '').strip()
+    if priority in PRIORITY_VALUES:
+        queryset = queryset.filter(priority=priority)
+        applied['priority'] = priority
+
+    return queryset, applied
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['created_at'], name='projects_pr_created_6b02e3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', 'updated_at'], name='projects_pr_status_8e1074_idx'),
+        ),
+    ]
@@ -36,6 +36,10 @@ class Project(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'updated_at']),
+        ]
     
     def __str__(self):
         return self.name
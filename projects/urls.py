@@ -10,4 +10,5 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('<uuid:project_id>/', views.detail, name='detail'),
     path('create/', views.create, name='create'),
+    path('export/', views.export, name='export'),
 ]
\ No newline at end of file
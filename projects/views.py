@@ -4,18 +4,28 @@ Projects views for DataLinkCRM.
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_http_methods
 from .models import Project
+from .filters import filter_projects
+from core.exports import export_response
 
 @login_required
 def index(request):
     """Project list view."""
-    projects = Project.objects.filter(user=request.user)
+    projects, filters = filter_projects(Project.objects.filter(user=request.user), request.GET)
     context = {
         'title': 'Projects',
         'projects': projects,
+        'filters': filters,
     }
     return render(request, 'projects/index.html', context)
 
+@login_required
+@require_http_methods(["GET"])
+def export(request):
+    """Stream the user's projects as CSV or JSON Lines, with the list filters applied."""
+    return export_response(request, 'projects')
+
 @login_required
 def detail(request, project_id):
     """Project detail view."""
@@ -0,0 +1,165 @@
+"""
+Global search for DataLinkCRM.
+
+Queries the full-text index built by the search migrations: FTS5 with bm25
+ranking on SQLite, a GIN-indexed tsvector with ts_rank on PostgreSQL, and a
+plain substring match on any other database. Every term is matched as a
+prefix, so results appear while the user is still typing.
+
+Each search runs under a time budget (SEARCH_TIMEOUT_MS). A query that
+overruns it is cancelled by the database and the search returns no results
+with ``timed_out`` set, instead of holding up the request.
+"""
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from functools import reduce
+
+from django.conf import settings
+from django.db import connection, transaction, OperationalError
+from django.db.models import Q
+from django.urls import reverse, NoReverseMatch
+
+from .models import SearchEntry
+
+MAX_TERMS = 8
+
+ICONS = {
+    'customer': 'user',
+    'project': 'project-diagram',
+    'payment': 'credit-card',
+}
+
+# Detail page per kind, with the list page used until a detail route exists.
+URL_NAMES = {
+    'customer': ('customers:detail', 'customers:index'),
+    'project': ('projects:detail', 'projects:index'),
+    'payment': ('payments:detail', 'payments:index'),
+}
+
+
+def parse_terms(query):
+    """Split a query into lowercase word terms, ignoring punctuation."""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def get_result_limit():
+    return getattr(settings, 'SEARCH_RESULT_LIMIT', 10)
+
+
+def get_timeout_ms():
+    return getattr(settings, 'SEARCH_TIMEOUT_MS', 250)
+
+
+def result_url(kind, object_id):
+    detail_name, list_name = URL_NAMES[kind]
+    try:
+        return reverse(detail_name, args=[object_id])
+    except NoReverseMatch:
+        return reverse(list_name)
+
+
+@contextmanager
+def query_deadline(timeout_ms):
+    """Make the database abort queries that run longer than ``timeout_ms``."""
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [int(timeout_ms)])
+            yield
+    elif connection.vendor == 'sqlite':
+        deadline = time.monotonic() + timeout_ms / 1000
+        connection.ensure_connection()
+        connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            yield
+        finally:
+            connection.connection.set_progress_handler(None, 0)
+    else:
+        yield
+
+
+def _kind_filter(kinds, column, params):
+    if not kinds:
+        return ''
+    params.extend(kinds)
+    return f" AND {column} IN ({', '.join(['%s'] * len(kinds))})"
+
+
+def _search_sqlite(user, terms, kinds, limit):
+    params = [' '.join(f'"{term}"*' for term in terms), user.pk]
+    kind_sql = _kind_filter(kinds, 'e.kind', params)
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT e.kind, e.object_id, e.title, e.description '
+            'FROM search_searchentry_fts f JOIN search_searchentry e ON e.id = f.rowid '
+            'WHERE search_searchentry_fts MATCH %s AND e.user_id = %s' + kind_sql +
+            ' ORDER BY bm25(search_searchentry_fts, 10.0, 1.0) LIMIT %s',
+            params
+        )
+        return cursor.fetchall()
+
+
+def _search_postgres(user, terms, kinds, limit):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    params = [tsquery, user.pk, tsquery]
+    kind_sql = _kind_filter(kinds, 'kind', params)
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT kind, object_id, title, description FROM search_searchentry, "
+            "to_tsquery('simple', %s) query "
+            "WHERE user_id = %s AND document @@ to_tsquery('simple', %s)" + kind_sql +
+            " ORDER BY ts_rank(document, query) DESC LIMIT %s",
+            params
+        )
+        return cursor.fetchall()
+
+
+def _search_fallback(user, terms, kinds, limit):
+    entries = SearchEntry.objects.filter(
+        reduce(lambda left, right: left & right, [Q(body__icontains=term) for term in terms]),
+        user=user
+    )
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+    return list(entries.order_by('-updated_at').values_list('kind', 'object_id', 'title', 'description')[:limit])
+
+
+BACKENDS = {
+    'sqlite': _search_sqlite,
+    'postgresql': _search_postgres,
+}
+
+
+def search(user, query, kinds=None, limit=None):
+    """
+    Search the user's customers, projects and payments.
+
+    ``kinds`` restricts the search to some of 'customer', 'project' and
+    'payment'. Returns ``(results, timed_out)`` where results are dicts with
+    the title/description/icon/url keys the frontend renders.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return [], False
+
+    backend = BACKENDS.get(connection.vendor, _search_fallback)
+    try:
+        with query_deadline(get_timeout_ms()):
+            rows = backend(user, terms, kinds, limit or get_result_limit())
+    except OperationalError:
+        return [], True
+
+    return [
+        {
+            'type': kind,
+            'title': title,
+            'description': description,
+            'icon': ICONS[kind],
+            'url': result_url(kind, uuid.UUID(str(object_id))),
+        }
+        for kind, object_id, title, description in rows
+    ], False
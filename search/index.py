@@ -0,0 +1,147 @@
+"""
+Search index maintenance for DataLinkCRM.
+
+Each Customer, Project and Payment has one SearchEntry row holding its
+display text and the text to match. Rows are written from model signals (see
+search.signals); rebuild_index() recreates them in bulk for data written
+with queryset updates or bulk_create, which skip the signals.
+"""
+from itertools import islice
+
+from django.db import transaction
+
+from .models import SearchEntry
+from customers.models import Customer
+from projects.models import Project
+from payments.models import Payment
+
+BATCH_SIZE = 1000
+
+
+def phone_variants(phone):
+    """Return a phone number in the forms people type it: +2547..., 2547..., 07..."""
+    if not phone:
+        return []
+    digits = phone.lstrip('+')
+    variants = [phone, digits]
+    if digits.startswith('254') and len(digits) == 12:
+        variants.append('0' + digits[3:])
+    return variants
+
+
+def _join(*parts):
+    return ' · '.join(str(part) for part in parts if part)
+
+
+def customer_document(customer):
+    return {
+        'title': customer.get_full_name() or customer.customer_id,
+        'description': _join(customer.customer_id, customer.email, customer.company_name),
+        'body': ' '.join([
+            customer.first_name,
+            customer.last_name,
+            customer.email,
+            customer.company_name,
+            customer.customer_id,
+            *phone_variants(customer.phone),
+        ]),
+    }
+
+
+def project_document(project):
+    return {
+        'title': project.name,
+        'description': _join(project.get_status_display(), project.description[:120]),
+        'body': ' '.join([project.name, project.description]),
+    }
+
+
+def payment_document(payment):
+    return {
+        'title': payment.reference,
+        'description': _join(f'{payment.currency} {payment.amount}', payment.get_status_display(), payment.description[:80]),
+        'body': ' '.join([payment.reference, payment.description]),
+    }
+
+
+# model -> (kind, document builder, fields the document is built from)
+INDEXED_MODELS = {
+    Customer: ('customer', customer_document, {
+        'first_name', 'last_name', 'email', 'phone', 'company_name', 'customer_id',
+    }),
+    Project: ('project', project_document, {'name', 'description', 'status'}),
+    Payment: ('payment', payment_document, {'reference', 'description', 'amount', 'currency', 'status'}),
+}
+
+
+def _entry_fields(document):
+    return {
+        'title': document['title'][:255],
+        'description': document['description'][:255],
+        'body': document['body'],
+    }
+
+
+def index_object(instance):
+    """Create or refresh the SearchEntry for a Customer, Project or Payment."""
+    kind, build, _ = INDEXED_MODELS[type(instance)]
+    SearchEntry.objects.update_or_create(
+        kind=kind,
+        object_id=instance.pk,
+        defaults=dict(_entry_fields(build(instance)), user_id=instance.user_id)
+    )
+
+
+def index_new_objects(instances):
+    """Create SearchEntry rows for objects inserted in bulk."""
+    entries = []
+    for instance in instances:
+        kind, build, _ = INDEXED_MODELS[type(instance)]
+        entries.append(SearchEntry(
+            kind=kind,
+            object_id=instance.pk,
+            user_id=instance.user_id,
+            **_entry_fields(build(instance))
+        ))
+    SearchEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+
+def remove_object(instance):
+    """Delete the SearchEntry for a Customer, Project or Payment."""
+    kind = INDEXED_MODELS[type(instance)][0]
+    SearchEntry.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def rebuild_index(user_ids=None):
+    """
+    Recreate the SearchEntry rows for ``user_ids`` (all users by default).
+
+    Returns the number of entries written.
+    """
+    written = 0
+    with transaction.atomic():
+        entries = SearchEntry.objects.all()
+        if user_ids:
+            entries = entries.filter(user_id__in=user_ids)
+        entries.delete()
+
+        for model, (kind, build, _) in INDEXED_MODELS.items():
+            objects = model.objects.order_by()
+            if user_ids:
+                objects = objects.filter(user_id__in=user_ids)
+            for batch in _batched(objects.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE):
+                SearchEntry.objects.bulk_create([
+                    SearchEntry(kind=kind, object_id=instance.pk, user_id=instance.user_id, **_entry_fields(build(instance)))
+                    for instance in batch
+                ])
+                written += len(batch)
+    return written
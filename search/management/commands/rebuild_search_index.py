@@ -0,0 +1,17 @@
+"""
+Rebuild the global search index from customers, projects and payments.
+"""
+from django.core.management.base import BaseCommand
+
+from search.index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate SearchEntry rows for customers, projects and payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Limit to this user ID (repeatable).')
+
+    def handle(self, *args, **options):
+        written = rebuild_index(user_ids=options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {written} records.'))
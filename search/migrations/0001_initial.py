@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('customer', 'Customer'), ('project', 'Project'), ('payment', 'Payment')], max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Search Entry',
+                'verbose_name_plural': 'Search Entries',
+                'indexes': [models.Index(fields=['user', 'kind'], name='search_sear_user_id_d43a66_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry'),
+        ),
+    ]
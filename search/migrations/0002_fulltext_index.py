@@ -0,0 +1,75 @@
+from django.db import migrations
+
+# SQLite: an FTS5 table over SearchEntry (external content), kept in sync by triggers.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE search_searchentry_fts USING fts5(
+        title, body,
+        content='search_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER search_searchentry_ai AFTER INSERT ON search_searchentry BEGIN
+        INSERT INTO search_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_searchentry_ad AFTER DELETE ON search_searchentry BEGIN
+        INSERT INTO search_searchentry_fts(search_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_searchentry_au AFTER UPDATE ON search_searchentry BEGIN
+        INSERT INTO search_searchentry_fts(search_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO search_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    "INSERT INTO search_searchentry_fts(search_searchentry_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS search_searchentry_au',
+    'DROP TRIGGER IF EXISTS search_searchentry_ad',
+    'DROP TRIGGER IF EXISTS search_searchentry_ai',
+    'DROP TABLE IF EXISTS search_searchentry_fts',
+]
+
+# PostgreSQL: a generated tsvector column (title weighted above body) with a GIN index.
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE search_searchentry ADD COLUMN document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX search_searchentry_document_idx ON search_searchentry USING GIN (document)',
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS search_searchentry_document_idx',
+    'ALTER TABLE search_searchentry DROP COLUMN IF EXISTS document',
+]
+
+
+def run_for_vendor(sqlite, postgres):
+    def run(apps, schema_editor):
+        statements = {'sqlite': sqlite, 'postgresql': postgres}.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(SQLITE_FORWARD, POSTGRES_FORWARD),
+            run_for_vendor(SQLITE_REVERSE, POSTGRES_REVERSE),
+        ),
+    ]
@@ -0,0 +1,41 @@
+"""
+Search models for DataLinkCRM.
+"""
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class SearchEntry(models.Model):
+    """
+    One searchable record (customer, project or payment).
+
+    ``body`` holds the text that is matched; the full-text index over it is
+    created by a database-specific migration (FTS5 on SQLite, a tsvector
+    with a GIN index on PostgreSQL).
+    """
+    KIND_CHOICES = [
+        ('customer', 'Customer'),
+        ('project', 'Project'),
+        ('payment', 'Payment'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_entries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    title = models.CharField(max_length=255)
+    description = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Search Entry'
+        verbose_name_plural = 'Search Entries'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'kind']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
@@ -0,0 +1,31 @@
+"""
+Search signal handlers for DataLinkCRM.
+Keep SearchEntry rows in step with the records they describe.
+"""
+from django.db.models.signals import post_save, post_delete
+
+from .index import INDEXED_MODELS, index_object, index_new_objects, remove_object
+from customers.signals import customers_bulk_created
+
+
+def object_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not INDEXED_MODELS[sender][2].intersection(update_fields):
+        # None of the indexed text changed.
+        return
+    index_object(instance)
+
+
+def object_deleted(sender, instance, **kwargs):
+    remove_object(instance)
+
+
+def customers_imported(sender, user_id, customers, **kwargs):
+    index_new_objects(customers)
+
+
+for model in INDEXED_MODELS:
+    uid = f'search-index-{model._meta.label_lower}'
+    post_save.connect(object_saved, sender=model, dispatch_uid=uid)
+    post_delete.connect(object_deleted, sender=model, dispatch_uid=uid)
+
+customers_bulk_created.connect(customers_imported, dispatch_uid='search-customers-imported')
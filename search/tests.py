@@ -0,0 +1,73 @@
+"""
+Tests for the search app.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .engine import MAX_TERMS, parse_terms, search
+from .index import phone_variants
+from customers.models import Customer
+from customers.signals import customers_bulk_created
+from payments.models import Payment
+
+# Saving customers also touches the typeahead and dashboard caches; keep them in memory instead of Redis.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ParseTests(SimpleTestCase):
+    def test_terms_are_lowercase_words(self):
+        self.assertEqual(parse_terms('  Wanjiru, O\'Brien-Kamau! '), ['wanjiru', 'o', 'brien', 'kamau'])
+
+    def test_terms_are_capped(self):
+        self.assertEqual(len(parse_terms(' '.join(['word'] * 20))), MAX_TERMS)
+
+    def test_phone_variants(self):
+        self.assertEqual(phone_variants('+254712345678'), ['+254712345678', '254712345678', '0712345678'])
+        self.assertEqual(phone_variants(''), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('searcher')
+        self.customer = Customer.objects.create(
+            user=self.user, first_name='Wanjiru', last_name='Kamau', email='wanjiru@example.com',
+            phone='+254712345678', company_name='Mvuli Traders'
+        )
+        Payment.objects.create(
+            user=self.user, amount=Decimal('2500.00'), payment_method='mpesa', reference='INV2041',
+            description='Mvuli deposit'
+        )
+
+    def titles(self, query, user=None, **kwargs):
+        results, timed_out = search(user or self.user, query, **kwargs)
+        self.assertFalse(timed_out)
+        return [result['title'] for result in results]
+
+    def test_terms_match_as_prefixes(self):
+        self.assertEqual(self.titles('wanj kam'), ['Wanjiru Kamau'])
+        self.assertEqual(self.titles('0712345'), ['Wanjiru Kamau'])
+
+    def test_kinds_and_owner_limit_results(self):
+        self.assertEqual(sorted(self.titles('mvuli')), ['INV2041', 'Wanjiru Kamau'])
+        self.assertEqual(self.titles('mvuli', kinds=['payment']), ['INV2041'])
+        self.assertEqual(self.titles('mvuli', user=User.objects.create_user('stranger')), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.customer.last_name = 'Otieno'
+        self.customer.save(update_fields=['last_name'])
+        self.assertEqual(self.titles('otieno'), ['Wanjiru Otieno'])
+        self.assertEqual(self.titles('kamau'), [])
+        self.customer.delete()
+        self.assertEqual(self.titles('wanjiru'), [])
+
+    def test_bulk_created_customers_are_indexed(self):
+        customers = Customer.objects.bulk_create([
+            Customer(user=self.user, customer_id='CUSTBULK1', first_name='Achieng', last_name='Odhiambo',
+                     email='achieng@example.com', phone='+254722000001'),
+        ])
+        self.assertEqual(self.titles('achieng'), [])
+        customers_bulk_created.send(sender=Customer, user_id=self.user.pk, customers=customers)
+        self.assertEqual(self.titles('achieng'), ['Achieng Odhiambo'])
@@ -0,0 +1,34 @@
+"""
+Search views for DataLinkCRM.
+"""
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from .engine import search as run_search
+
+# Shortest query that is searched; matches the frontend's own check.
+MIN_QUERY_LENGTH = 2
+
+# Frontend search targets and the record kinds they cover.
+TARGETS = {
+    'customers': ['customer'],
+    'projects': ['project'],
+    'payments': ['payment'],
+}
+
+@login_required
+@require_http_methods(["GET"])
+def search(request):
+    """Global search over the user's customers, projects and payments."""
+    query = request.GET.get('q', '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return JsonResponse({'results': [], 'query': query, 'timed_out': False})
+    
+    results, timed_out = run_search(request.user, query, kinds=TARGETS.get(request.GET.get('target')))
+    
+    return JsonResponse({
+        'results': results,
+        'query': query,
+        'timed_out': timed_out,
+    })
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SegmentsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'segments'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,324 @@
+"""
+Segment definitions for DataLinkCRM.
+
+A definition is a JSON object whose conditions must all hold::
+
+    {
+        "status": ["active", "lead"],
+        "customer_type": ["business"],
+        "county": ["Nairobi", "Kiambu"],
+        "tags": "vip AND NOT churned",
+        "created_after": "2026-01-01",
+        "interactions": {"min": 3, "type": "call"},
+        "payments": {"min": "10000.00", "currency": "KES"}
+    }
+
+``interactions`` counts the customer's interactions (optionally of one
+type); ``payments`` totals their completed payments (optionally in one
+currency). Every condition can be evaluated two ways that agree: as a
+Customer queryset, used when a whole segment is rebuilt, and in Python
+against one customer's facts, used to maintain membership incrementally.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from customers.models import Customer, CustomerInteraction
+from customers.tags import TagQueryError, parse_tag_query, split_tags, tag_query, tree_matches
+from payments.models import Payment
+
+# Conditions listing allowed values of a choice field.
+CHOICE_FIELDS = {
+    'status': {value for value, _ in Customer.STATUS_CHOICES},
+    'customer_type': {value for value, _ in Customer.CUSTOMER_TYPES},
+    'gender': {value for value, _ in Customer.GENDER_CHOICES},
+}
+
+# Conditions listing values of a free-text field, compared case-insensitively.
+TEXT_FIELDS = ('county', 'city', 'industry')
+
+INTERACTION_TYPES = {value for value, _ in CustomerInteraction.INTERACTION_TYPES}
+
+CONDITIONS = set(CHOICE_FIELDS) | set(TEXT_FIELDS) | {
+    'tags', 'is_primary_contact', 'created_after', 'created_before', 'interactions', 'payments',
+}
+
+# Customer fields a definition can depend on; saves touching none of them
+# cannot change membership.
+CUSTOMER_FIELDS = set(CHOICE_FIELDS) | set(TEXT_FIELDS) | {'tags', 'is_primary_contact', 'created_at'}
+
+AMOUNT_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+class SegmentDefinitionError(ValueError):
+    """Raised for a segment definition that is not valid."""
+
+
+def _clean_list(name, value, allowed=None):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not value or not all(isinstance(item, str) for item in value):
+        raise SegmentDefinitionError(f"'{name}' must be a non-empty list of strings")
+    value = [item.strip() for item in value if item.strip()]
+    if allowed is not None:
+        unknown = [item for item in value if item not in allowed]
+        if unknown:
+            raise SegmentDefinitionError(f"Unknown {name} value '{unknown[0]}'")
+    if not value:
+        raise SegmentDefinitionError(f"'{name}' must be a non-empty list of strings")
+    return sorted(set(value))
+
+
+def _clean_date(name, value):
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise SegmentDefinitionError(f"'{name}' must be a date (YYYY-MM-DD)")
+
+
+def _clean_range(name, value, parse):
+    if not isinstance(value, dict):
+        raise SegmentDefinitionError(f"'{name}' must be an object")
+    cleaned = {}
+    for bound in ('min', 'max'):
+        if value.get(bound) is not None:
+            try:
+                cleaned[bound] = parse(value[bound])
+            except (TypeError, ValueError, InvalidOperation):
+                raise SegmentDefinitionError(f"'{name}.{bound}' must be a number")
+    if not cleaned:
+        raise SegmentDefinitionError(f"'{name}' needs a 'min' or 'max'")
+    return cleaned
+
+
+def clean_definition(data):
+    """
+    Validate a definition and return it in normalized form.
+
+    Raises SegmentDefinitionError describing the first problem found.
+    """
+    if not isinstance(data, dict):
+        raise SegmentDefinitionError('A segment definition must be an object')
+    unknown = set(data) - CONDITIONS
+    if unknown:
+        raise SegmentDefinitionError(f"Unknown condition '{sorted(unknown)[0]}'")
+
+    cleaned = {}
+    for name, allowed in CHOICE_FIELDS.items():
+        if name in data:
+            cleaned[name] = _clean_list(name, data[name], allowed)
+    for name in TEXT_FIELDS:
+        if name in data:
+            cleaned[name] = _clean_list(name, data[name])
+
+    if 'tags' in data:
+        if not isinstance(data['tags'], str):
+            raise SegmentDefinitionError("'tags' must be a tag expression")
+        try:
+            parse_tag_query(data['tags'])
+        except TagQueryError as exc:
+            raise SegmentDefinitionError(f"Invalid tag expression: {exc}")
+        cleaned['tags'] = data['tags'].strip()
+
+    if 'is_primary_contact' in data:
+        if not isinstance(data['is_primary_contact'], bool):
+            raise SegmentDefinitionError("'is_primary_contact' must be true or false")
+        cleaned['is_primary_contact'] = data['is_primary_contact']
+
+    for name in ('created_after', 'created_before'):
+        if name in data:
+            cleaned[name] = _clean_date(name, data[name])
+
+    if 'interactions' in data:
+        cleaned['interactions'] = _clean_range('interactions', data['interactions'], int)
+        interaction_type = data['interactions'].get('type')
+        if interaction_type is not None:
+            if interaction_type not in INTERACTION_TYPES:
+                raise SegmentDefinitionError(f"Unknown interaction type '{interaction_type}'")
+            cleaned['interactions']['type'] = interaction_type
+
+    if 'payments' in data:
+        cleaned['payments'] = {
+            bound: str(amount)
+            for bound, amount in _clean_range('payments', data['payments'], Decimal).items()
+        }
+        currency = data['payments'].get('currency')
+        if currency is not None:
+            if not isinstance(currency, str) or len(currency.strip()) != 3:
+                raise SegmentDefinitionError("'payments.currency' must be a 3-letter code")
+            cleaned['payments']['currency'] = currency.strip().upper()
+
+    return cleaned
+
+
+def definition_sources(definition):
+    """
+    Return the kinds of change that can affect membership.
+
+    ``'customer'`` for customer fields, plus ``'interactions'`` and
+    ``'payments'`` when the definition depends on them.
+    """
+    sources = {'customer'}
+    if 'interactions' in definition:
+        sources.add('interactions')
+    if 'payments' in definition:
+        sources.add('payments')
+    return sources
+
+
+def _in_range(value, bounds, parse):
+    if 'min' in bounds and value < parse(bounds['min']):
+        return False
+    if 'max' in bounds and value > parse(bounds['max']):
+        return False
+    return True
+
+
+def segment_queryset(user, definition):
+    """Return the queryset of ``user``'s customers matching ``definition``."""
+    queryset = Customer.objects.filter(user=user)
+
+    for name in CHOICE_FIELDS:
+        if name in definition:
+            queryset = queryset.filter(**{f'{name}__in': definition[name]})
+    for name in TEXT_FIELDS:
+        if name in definition:
+            condition = Q()
+            for value in definition[name]:
+                condition |= Q(**{f'{name}__iexact': value})
+            queryset = queryset.filter(condition)
+
+    if 'tags' in definition:
+        queryset = queryset.filter(tag_query(definition['tags'], user.pk))
+    if 'is_primary_contact' in definition:
+        queryset = queryset.filter(is_primary_contact=definition['is_primary_contact'])
+    if 'created_after' in definition:
+        queryset = queryset.filter(created_at__date__gte=definition['created_after'])
+    if 'created_before' in definition:
+        queryset = queryset.filter(created_at__date__lt=definition['created_before'])
+
+    if 'interactions' in definition:
+        bounds = definition['interactions']
+        counts = CustomerInteraction.objects.filter(customer=OuterRef('pk'))
+        if 'type' in bounds:
+            counts = counts.filter(interaction_type=bounds['type'])
+        counts = counts.order_by().values('customer').annotate(count=Count('pk')).values('count')
+        queryset = queryset.annotate(
+            segment_interactions=Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+        )
+        if 'min' in bounds:
+            queryset = queryset.filter(segment_interactions__gte=bounds['min'])
+        if 'max' in bounds:
+            queryset = queryset.filter(segment_interactions__lte=bounds['max'])
+
+    if 'payments' in definition:
+        bounds = definition['payments']
+        totals = Payment.objects.filter(customer=OuterRef('pk'), status='completed')
+        if 'currency' in bounds:
+            totals = totals.filter(currency=bounds['currency'])
+        totals = totals.order_by().values('customer').annotate(total=Sum('amount')).values('total')
+        queryset = queryset.annotate(
+            segment_payments=Coalesce(
+                Subquery(totals, output_field=AMOUNT_FIELD), Value(Decimal('0')), output_field=AMOUNT_FIELD
+            )
+        )
+        if 'min' in bounds:
+            queryset = queryset.filter(segment_payments__gte=Decimal(bounds['min']))
+        if 'max' in bounds:
+            queryset = queryset.filter(segment_payments__lte=Decimal(bounds['max']))
+
+    return queryset
+
+
+def load_facts(customer_ids):
+    """
+    Return ``{customer id: facts}`` for evaluating definitions with matches().
+
+    Interaction counts and payment totals start empty; fill them with
+    load_interaction_counts() and load_payment_totals() when needed.
+    """
+    facts = {}
+    rows = Customer.objects.filter(pk__in=customer_ids).values('pk', 'user_id', *sorted(CUSTOMER_FIELDS))
+    for row in rows:
+        row['tags'] = set(split_tags(row['tags']))
+        row['interactions'] = defaultdict(int)
+        row['payments'] = defaultdict(Decimal)
+        facts[row['pk']] = row
+    return facts
+
+
+def load_interaction_counts(facts):
+    """Fill in per-type interaction counts for ``facts`` with one grouped query."""
+    counts = (
+        CustomerInteraction.objects.filter(customer_id__in=list(facts))
+        .values_list('customer_id', 'interaction_type')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    for customer_id, interaction_type, count in counts:
+        facts[customer_id]['interactions'][interaction_type] = count
+
+
+def load_payment_totals(facts):
+    """Fill in completed payment totals per currency for ``facts`` with one grouped query."""
+    totals = (
+        Payment.objects.filter(customer_id__in=list(facts), status='completed')
+        .values_list('customer_id', 'currency')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for customer_id, currency, total in totals:
+        facts[customer_id]['payments'][currency] = total
+
+
+class CompiledDefinition:
+    """A definition prepared for repeated evaluation with matches()."""
+
+    def __init__(self, definition):
+        self.definition = definition
+        self.sources = definition_sources(definition)
+        self.tag_tree = parse_tag_query(definition['tags'])[0] if 'tags' in definition else None
+        self.text_values = {
+            name: {value.lower() for value in definition[name]}
+            for name in TEXT_FIELDS if name in definition
+        }
+
+    def matches(self, facts):
+        """Return whether the customer described by ``facts`` belongs to the segment."""
+        definition = self.definition
+        for name in CHOICE_FIELDS:
+            if name in definition and facts[name] not in definition[name]:
+                return False
+        for name, values in self.text_values.items():
+            if facts[name].lower() not in values:
+                return False
+        if self.tag_tree is not None and not tree_matches(self.tag_tree, facts['tags']):
+            return False
+        if 'is_primary_contact' in definition and facts['is_primary_contact'] != definition['is_primary_contact']:
+            return False
+
+        if 'created_after' in definition or 'created_before' in definition:
+            created = timezone.localtime(facts['created_at']).date().isoformat()
+            if created < definition.get('created_after', created):
+                return False
+            if 'created_before' in definition and created >= definition['created_before']:
+                return False
+
+        if 'interactions' in definition:
+            bounds = definition['interactions']
+            counts = facts['interactions']
+            count = counts[bounds['type']] if 'type' in bounds else sum(counts.values())
+            if not _in_range(count, bounds, int):
+                return False
+
+        if 'payments' in definition:
+            bounds = definition['payments']
+            totals = facts['payments']
+            total = totals[bounds['currency']] if 'currency' in bounds else sum(totals.values(), Decimal('0'))
+            if not _in_range(total, bounds, Decimal):
+                return False
+        return True
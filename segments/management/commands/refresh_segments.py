@@ -0,0 +1,17 @@
+"""
+Recompute segment membership from the segment definitions.
+"""
+from django.core.management.base import BaseCommand
+
+from segments.membership import refresh_segments
+
+
+class Command(BaseCommand):
+    help = 'Re-evaluate every active segment and repair its members and count.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Limit to this user ID (repeatable).')
+
+    def handle(self, *args, **options):
+        refreshed = refresh_segments(user_ids=options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} segments.'))
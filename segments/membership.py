@@ -0,0 +1,186 @@
+"""
+Segment membership maintenance for DataLinkCRM.
+
+Membership is materialized in SegmentMembership rows with the count kept on
+Segment.member_count, so reading a segment never evaluates its filter.
+
+Writes to customers, interactions and payments mark the customers they
+touch (see segments.signals). When the transaction commits, only those
+customers are re-evaluated, against only the segments the change can
+affect, from a handful of batched queries; membership rows and counts are
+then adjusted by the difference. refresh_segment() evaluates a whole
+segment in SQL, for new or edited definitions and as a periodic repair.
+"""
+import threading
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .definitions import (
+    CompiledDefinition,
+    load_facts,
+    load_interaction_counts,
+    load_payment_totals,
+    segment_queryset,
+)
+from .models import Segment, SegmentMembership
+
+BATCH_SIZE = 1000
+
+_pending = threading.local()
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _adjust_counts(deltas):
+    for segment_id, delta in deltas.items():
+        if delta:
+            Segment.objects.filter(pk=segment_id).update(member_count=F('member_count') + delta)
+
+
+def refresh_segment(segment):
+    """
+    Recompute a segment's members from its definition.
+
+    Returns the number of members.
+    """
+    matching = set(segment_queryset(segment.user, segment.definition).values_list('pk', flat=True).iterator())
+    with transaction.atomic():
+        current = set(SegmentMembership.objects.filter(segment=segment).values_list('customer_id', flat=True))
+        for batch in _batched(current - matching, BATCH_SIZE):
+            SegmentMembership.objects.filter(segment=segment, customer_id__in=batch).delete()
+        SegmentMembership.objects.bulk_create(
+            [SegmentMembership(segment=segment, customer_id=pk) for pk in matching - current],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        segment.member_count = len(matching)
+        segment.refreshed_at = timezone.now()
+        segment.save(update_fields=['member_count', 'refreshed_at'])
+    return segment.member_count
+
+
+def refresh_segments(user_ids=None):
+    """Refresh every active segment (of ``user_ids`` if given); returns how many."""
+    segments = Segment.objects.filter(is_active=True).select_related('user')
+    if user_ids:
+        segments = segments.filter(user_id__in=user_ids)
+    refreshed = 0
+    for segment in segments:
+        refresh_segment(segment)
+        refreshed += 1
+    return refreshed
+
+
+def update_memberships(changes):
+    """
+    Re-evaluate the customers in ``changes`` and apply the membership difference.
+
+    ``changes`` maps customer IDs to the set of sources that changed for
+    them ('customer', 'interactions', 'payments'). Customers that no longer
+    exist are skipped; their rows went with them.
+    """
+    for batch in _batched(changes, BATCH_SIZE):
+        facts = load_facts(batch)
+        if not facts:
+            continue
+
+        by_user = defaultdict(list)
+        segments = Segment.objects.filter(
+            user_id__in={row['user_id'] for row in facts.values()}, is_active=True
+        ).only('id', 'user_id', 'definition')
+        for segment in segments:
+            by_user[segment.user_id].append((segment.pk, CompiledDefinition(segment.definition)))
+
+        relevant = {}
+        for pk, row in facts.items():
+            affected = [
+                (segment_id, compiled) for segment_id, compiled in by_user[row['user_id']]
+                if compiled.sources & changes[pk]
+            ]
+            if affected:
+                relevant[pk] = affected
+        if not relevant:
+            continue
+
+        sources = set().union(*(compiled.sources for affected in relevant.values() for _, compiled in affected))
+        if 'interactions' in sources:
+            load_interaction_counts(facts)
+        if 'payments' in sources:
+            load_payment_totals(facts)
+
+        current = set(
+            SegmentMembership.objects.filter(
+                customer_id__in=list(relevant),
+                segment_id__in={segment_id for affected in relevant.values() for segment_id, _ in affected}
+            ).values_list('segment_id', 'customer_id')
+        )
+        added = []
+        removed = defaultdict(list)
+        for pk, affected in relevant.items():
+            for segment_id, compiled in affected:
+                member = (segment_id, pk) in current
+                if compiled.matches(facts[pk]):
+                    if not member:
+                        added.append(SegmentMembership(segment_id=segment_id, customer_id=pk))
+                elif member:
+                    removed[segment_id].append(pk)
+
+        if not added and not removed:
+            continue
+        deltas = defaultdict(int)
+        with transaction.atomic():
+            SegmentMembership.objects.bulk_create(added, ignore_conflicts=True)
+            for membership in added:
+                deltas[membership.segment_id] += 1
+            for segment_id, customer_ids in removed.items():
+                deleted, _ = SegmentMembership.objects.filter(
+                    segment_id=segment_id, customer_id__in=customer_ids
+                ).delete()
+                deltas[segment_id] -= deleted
+            _adjust_counts(deltas)
+
+
+def _flush():
+    changes = getattr(_pending, 'changes', None)
+    if changes:
+        _pending.changes = {}
+        update_memberships(changes)
+
+
+def customers_changed(customer_ids, source='customer'):
+    """
+    Queue customers for re-evaluation once the current transaction commits.
+
+    Changes made in one transaction are evaluated together, so a burst of
+    writes to the same customer costs one evaluation.
+    """
+    changes = getattr(_pending, 'changes', None)
+    if changes is None:
+        changes = _pending.changes = {}
+    queued = False
+    for customer_id in customer_ids:
+        if customer_id is not None:
+            changes.setdefault(customer_id, set()).add(source)
+            queued = True
+    if queued:
+        transaction.on_commit(_flush)
+
+
+def customer_removed(customer_id):
+    """Drop a customer that is being deleted from the counts of its segments on commit."""
+    segment_ids = list(SegmentMembership.objects.filter(customer_id=customer_id).values_list('segment_id', flat=True))
+    if segment_ids:
+        transaction.on_commit(
+            lambda: Segment.objects.filter(pk__in=segment_ids).update(member_count=F('member_count') - 1)
+        )
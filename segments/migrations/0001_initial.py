@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customers', '0005_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Segment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True)),
+                ('definition', models.JSONField(default=dict)),
+                ('is_active', models.BooleanField(default=True)),
+                ('member_count', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Segment',
+                'verbose_name_plural': 'Segments',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SegmentMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segment_memberships', to='customers.customer')),
+                ('segment', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='segments.segment')),
+            ],
+            options={
+                'verbose_name': 'Segment Membership',
+                'verbose_name_plural': 'Segment Memberships',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='segmentmembership',
+            constraint=models.UniqueConstraint(fields=('segment', 'customer'), name='unique_segment_member'),
+        ),
+        migrations.AddConstraint(
+            model_name='segment',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_segment_name'),
+        ),
+    ]
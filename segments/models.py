@@ -0,0 +1,56 @@
+"""
+Segment models for DataLinkCRM.
+"""
+from django.db import models
+from django.contrib.auth.models import User
+
+from customers.models import Customer
+
+
+class Segment(models.Model):
+    """
+    A saved customer segment.
+
+    ``definition`` holds the declarative filter (see segments.definitions);
+    the matching customers are materialized as SegmentMembership rows and
+    counted in ``member_count``, both kept up to date as customers,
+    interactions and payments change.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='segments')
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    definition = models.JSONField(default=dict)
+    is_active = models.BooleanField(default=True)
+    member_count = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Segment'
+        verbose_name_plural = 'Segments'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='unique_segment_name'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+
+class SegmentMembership(models.Model):
+    """A customer that currently matches a segment."""
+    segment = models.ForeignKey(Segment, on_delete=models.CASCADE, related_name='memberships', db_index=False)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='segment_memberships')
+    added_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Segment Membership'
+        verbose_name_plural = 'Segment Memberships'
+        constraints = [
+            # Also the index member lists are paged along.
+            models.UniqueConstraint(fields=['segment', 'customer'], name='unique_segment_member'),
+        ]
+    
+    def __str__(self):
+        return f"{self.segment_id}: {self.customer_id}"
@@ -0,0 +1,64 @@
+"""
+Segment signal handlers for DataLinkCRM.
+Queue the customers touched by Customer, interaction and Payment writes for
+segment re-evaluation.
+"""
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+
+from .definitions import CUSTOMER_FIELDS
+from .membership import customers_changed, customer_removed
+from customers.models import Customer, CustomerInteraction
+from customers.signals import customers_bulk_created
+from payments.models import Payment
+from payments.signals import payments_bulk_updated
+
+
+def customer_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not CUSTOMER_FIELDS.intersection(update_fields):
+        return
+    customers_changed([instance.pk])
+
+
+def customer_deleting(sender, instance, **kwargs):
+    customer_removed(instance.pk)
+
+
+def customers_imported(sender, user_id, customers, **kwargs):
+    customers_changed([customer.pk for customer in customers])
+
+
+def interaction_changed(sender, instance, **kwargs):
+    customers_changed([instance.customer_id], 'interactions')
+
+
+def payment_pre_save(sender, instance, update_fields=None, **kwargs):
+    """Remember the customer an existing payment belonged to, in case it moves."""
+    instance._segment_customer_id = None
+    if not instance._state.adding and (update_fields is None or 'customer' in update_fields):
+        instance._segment_customer_id = (
+            Payment.objects.filter(pk=instance.pk).values_list('customer_id', flat=True).first()
+        )
+
+
+def payment_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_segment_customer_id', None)
+    customers_changed({instance.customer_id, previous}, 'payments')
+
+
+def payment_deleted(sender, instance, **kwargs):
+    customers_changed([instance.customer_id], 'payments')
+
+
+def payments_updated(sender, payments, **kwargs):
+    customers_changed({payment.customer_id for payment in payments}, 'payments')
+
+
+post_save.connect(customer_saved, sender=Customer, dispatch_uid='segments-customer-saved')
+pre_delete.connect(customer_deleting, sender=Customer, dispatch_uid='segments-customer-deleting')
+customers_bulk_created.connect(customers_imported, dispatch_uid='segments-customers-imported')
+post_save.connect(interaction_changed, sender=CustomerInteraction, dispatch_uid='segments-interaction-saved')
+post_delete.connect(interaction_changed, sender=CustomerInteraction, dispatch_uid='segments-interaction-deleted')
+pre_save.connect(payment_pre_save, sender=Payment, dispatch_uid='segments-payment-pre-save')
+post_save.connect(payment_saved, sender=Payment, dispatch_uid='segments-payment-saved')
+post_delete.connect(payment_deleted, sender=Payment, dispatch_uid='segments-payment-deleted')
+payments_bulk_updated.connect(payments_updated, dispatch_uid='segments-payments-updated')
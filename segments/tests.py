@@ -0,0 +1,135 @@
+"""
+Tests for the segments app.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .definitions import (
+    CompiledDefinition,
+    SegmentDefinitionError,
+    clean_definition,
+    load_facts,
+    load_interaction_counts,
+    load_payment_totals,
+    segment_queryset,
+)
+from .membership import refresh_segment
+from .models import Segment, SegmentMembership
+from customers.models import Customer, CustomerInteraction
+from payments.models import Payment
+
+# Customer and payment writes also touch the typeahead and dashboard caches; keep them in memory instead of Redis.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+DEFINITIONS = [
+    {'status': ['active']},
+    {'customer_type': ['business'], 'county': ['nairobi']},
+    {'tags': 'vip and not churned'},
+    {'created_after': '2000-01-01', 'is_primary_contact': False},
+    {'interactions': {'min': 2}},
+    {'interactions': {'min': 1, 'type': 'call'}},
+    {'interactions': {'max': 0}},
+    {'payments': {'min': '1000.00'}},
+    {'payments': {'max': '500', 'currency': 'USD'}},
+    {'status': ['lead', 'active'], 'tags': 'nairobi, vip', 'payments': {'min': '1'}},
+]
+
+
+class CleanDefinitionTests(SimpleTestCase):
+    def test_normalizes_values(self):
+        self.assertEqual(
+            clean_definition({
+                'status': 'active',
+                'county': [' Nairobi ', 'Kiambu', 'Nairobi'],
+                'payments': {'min': 100, 'currency': 'kes'},
+            }),
+            {'status': ['active'], 'county': ['Kiambu', 'Nairobi'], 'payments': {'min': '100', 'currency': 'KES'}},
+        )
+
+    def test_invalid_definitions_are_rejected(self):
+        for definition in [
+            [],
+            {'colour': ['red']},
+            {'status': ['sleeping']},
+            {'county': []},
+            {'tags': 'vip and ('},
+            {'created_after': '2026-02-30'},
+            {'interactions': {}},
+            {'interactions': {'min': 'many'}},
+            {'interactions': {'min': 1, 'type': 'telegram'}},
+            {'payments': {'min': '1', 'currency': 'shillings'}},
+        ]:
+            with self.subTest(definition=definition), self.assertRaises(SegmentDefinitionError):
+                clean_definition(definition)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DefinitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('segmenter')
+        rows = [
+            ('active', 'business', 'Nairobi', 'vip, nairobi'),
+            ('active', 'individual', 'NAIROBI', 'vip, churned'),
+            ('lead', 'business', 'Kiambu', 'nairobi'),
+            ('inactive', 'business', 'nairobi', ''),
+        ]
+        self.customers = [
+            Customer.objects.create(
+                user=self.user, first_name='Segment', last_name=str(index), email=f'segment{index}@example.com',
+                phone=f'+254711{index:06d}', status=status, customer_type=customer_type, county=county, tags=tags
+            )
+            for index, (status, customer_type, county, tags) in enumerate(rows)
+        ]
+        first, second, third, _ = self.customers
+        for customer, interaction_type in [(first, 'call'), (first, 'email'), (second, 'email'), (third, 'call')]:
+            CustomerInteraction.objects.create(
+                customer=customer, user=self.user, interaction_type=interaction_type, subject='Follow up',
+                description='Checked in', interaction_date=timezone.now()
+            )
+        for index, (customer, amount, currency, status) in enumerate([
+            (first, '800.00', 'KES', 'completed'),
+            (first, '400.00', 'KES', 'completed'),
+            (second, '300.00', 'USD', 'completed'),
+            (second, '5000.00', 'KES', 'pending'),
+            (third, '700.00', 'USD', 'completed'),
+        ]):
+            Payment.objects.create(
+                user=self.user, customer=customer, amount=Decimal(amount), currency=currency, status=status,
+                payment_method='cash', reference=f'SEGMENT{index}'
+            )
+
+    def test_matches_agrees_with_segment_queryset(self):
+        facts = load_facts([customer.pk for customer in self.customers])
+        load_interaction_counts(facts)
+        load_payment_totals(facts)
+        for definition in DEFINITIONS:
+            definition = clean_definition(definition)
+            compiled = CompiledDefinition(definition)
+            with self.subTest(definition=definition):
+                self.assertEqual(
+                    {pk for pk, row in facts.items() if compiled.matches(row)},
+                    set(segment_queryset(self.user, definition).values_list('pk', flat=True)),
+                )
+
+    def test_memberships_follow_writes(self):
+        segment = Segment.objects.create(
+            user=self.user, name='Big spenders', definition=clean_definition({'payments': {'min': '1000'}})
+        )
+        self.assertEqual(refresh_segment(segment), 1)
+
+        second = self.customers[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.get(reference='SEGMENT3')
+            payment.status = 'completed'
+            payment.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.filter(reference='SEGMENT0').delete()
+
+        members = set(SegmentMembership.objects.filter(segment=segment).values_list('customer_id', flat=True))
+        self.assertEqual(members, {second.pk})
+        segment.refresh_from_db()
+        self.assertEqual(segment.member_count, 1)
+        self.assertEqual(refresh_segment(segment), 1)
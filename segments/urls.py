@@ -0,0 +1,13 @@
+"""
+Segments app URL configuration.
+"""
+from django.urls import path
+from . import views
+
+app_name = 'segments'
+
+urlpatterns = [
+    path('', views.segment_list, name='index'),
+    path('<int:segment_id>/', views.segment_detail, name='detail'),
+    path('<int:segment_id>/members/', views.segment_members, name='members'),
+]
@@ -0,0 +1,149 @@
+"""
+Segment views for DataLinkCRM.
+"""
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_http_methods
+
+from .definitions import SegmentDefinitionError, clean_definition
+from .membership import refresh_segment
+from .models import Segment, SegmentMembership
+from core.pagination import keyset_page, InvalidCursor
+
+# Largest page of members returned at once.
+MEMBERS_MAX_LIMIT = 1000
+
+MEMBER_FIELDS = {
+    'customer_id': 'customer__customer_id',
+    'first_name': 'customer__first_name',
+    'last_name': 'customer__last_name',
+    'email': 'customer__email',
+    'phone': 'customer__phone',
+}
+
+def _segment_data(segment):
+    return {
+        'id': segment.pk,
+        'name': segment.name,
+        'description': segment.description,
+        'definition': segment.definition,
+        'is_active': segment.is_active,
+        'member_count': segment.member_count,
+        'refreshed_at': segment.refreshed_at.isoformat() if segment.refreshed_at else None,
+    }
+
+def _read_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise SegmentDefinitionError('Request body must be JSON')
+    if not isinstance(data, dict):
+        raise SegmentDefinitionError('Request body must be a JSON object')
+    return data
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def segment_list(request):
+    """List the user's segments with their member counts, or create one."""
+    if request.method == 'GET':
+        segments = Segment.objects.filter(user=request.user)
+        return JsonResponse({'segments': [_segment_data(segment) for segment in segments]})
+    
+    try:
+        data = _read_body(request)
+        definition = clean_definition(data.get('definition', {}))
+    except SegmentDefinitionError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    name = str(data.get('name', '')).strip()
+    if not name:
+        return JsonResponse({'error': 'name is required'}, status=400)
+    
+    try:
+        segment = Segment.objects.create(
+            user=request.user,
+            name=name[:100],
+            description=str(data.get('description', '')),
+            definition=definition
+        )
+    except IntegrityError:
+        return JsonResponse({'error': 'A segment with this name already exists'}, status=400)
+    refresh_segment(segment)
+    
+    return JsonResponse(_segment_data(segment), status=201)
+
+@login_required
+@require_http_methods(["GET", "PUT", "DELETE"])
+def segment_detail(request, segment_id):
+    """Read, update or delete a segment; a changed definition is re-evaluated."""
+    segment = get_object_or_404(Segment, pk=segment_id, user=request.user)
+    
+    if request.method == 'DELETE':
+        segment.delete()
+        return JsonResponse({'success': True})
+    
+    if request.method == 'PUT':
+        try:
+            data = _read_body(request)
+            if 'definition' in data:
+                definition = clean_definition(data['definition'])
+        except SegmentDefinitionError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        
+        refresh = False
+        if 'name' in data:
+            name = str(data['name']).strip()
+            if not name:
+                return JsonResponse({'error': 'name is required'}, status=400)
+            segment.name = name[:100]
+        if 'description' in data:
+            segment.description = str(data['description'])
+        if 'definition' in data and definition != segment.definition:
+            segment.definition = definition
+            refresh = True
+        if 'is_active' in data:
+            # Inactive segments are not maintained, so reactivating one re-evaluates it.
+            refresh = refresh or (bool(data['is_active']) and not segment.is_active)
+            segment.is_active = bool(data['is_active'])
+        try:
+            segment.save()
+        except IntegrityError:
+            return JsonResponse({'error': 'A segment with this name already exists'}, status=400)
+        if refresh:
+            refresh_segment(segment)
+    
+    return JsonResponse(_segment_data(segment))
+
+@login_required
+@require_http_methods(["GET"])
+def segment_members(request, segment_id):
+    """
+    A page of a segment's members, read from the materialized membership.
+    
+    Pages follow the (segment, customer) index, so campaigns can walk a
+    segment of any size with ``cursor``.
+    """
+    segment = get_object_or_404(Segment, pk=segment_id, user=request.user)
+    try:
+        limit = min(max(int(request.GET.get('limit', 100)), 1), MEMBERS_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    members = SegmentMembership.objects.filter(segment=segment).values('customer_id', *MEMBER_FIELDS.values())
+    try:
+        rows, next_cursor = keyset_page(members, ('customer_id',), cursor=request.GET.get('cursor'), limit=limit)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'segment': segment.pk,
+        'member_count': segment.member_count,
+        'results': [
+            dict({'id': str(row['customer_id'])}, **{key: row[field] for key, field in MEMBER_FIELDS.items()})
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+    })
@@ -18,7 +18,6 @@ window.DataLinkCRM = {
         this.setupEventListeners();
         this.initializeComponents();
         this.setupNotifications();
-        this.setupRealTimeUpdates();
         this.loadDashboardData();
         
         if (this.config.debug) {
@@ -705,22 +704,25 @@ window.DataLinkCRM = {
         }
     },
 
-    // Setup real-time updates
-    setupRealTimeUpdates: function() {
-        // Use Server-Sent Events for real-time updates
-        if (typeof EventSource !== 'undefined') {
-            const eventSource = new EventSource('/api/v1/stream/');
-            
-            eventSource.addEventListener('notification', function(event) {
-                const data = JSON.parse(event.data);
-                DataLinkCRM.showNotification(data.message, data.type || 'info');
-            });
-            
-            eventSource.addEventListener('dashboard-update', function(event) {
-                const data = JSON.parse(event.data);
-                DataLinkCRM.updateDashboardStats(data);
-            });
+    // Setup real-time updates from the dashboard event stream at streamUrl.
+    // Only the dashboard page opens it, as each stream holds a server worker;
+    // returns false when the browser has no EventSource, so it can poll.
+    setupRealTimeUpdates: function(streamUrl) {
+        if (typeof EventSource === 'undefined') {
+            return false;
         }
+        const eventSource = new EventSource(streamUrl);
+        
+        eventSource.addEventListener('notification', function(event) {
+            const data = JSON.parse(event.data);
+            DataLinkCRM.showNotification(data.message, data.type || 'info');
+        });
+        
+        eventSource.addEventListener('dashboard-update', function(event) {
+            const data = JSON.parse(event.data);
+            DataLinkCRM.updateDashboardStats(data);
+        });
+        return true;
     },
 
     // Load dashboard data